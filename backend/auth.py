@@ -105,6 +105,15 @@ async def get_current_user(authorization: str = Header(None)) -> dict:
     """FastAPI dependency to get current authenticated user"""
     return TenantMiddleware.get_current_user(authorization)
 
+async def get_optional_user(authorization: str = Header(None)) -> Optional[dict]:
+    """FastAPI dependency for endpoints that work without auth but use it when present"""
+    if not authorization:
+        return None
+    try:
+        return TenantMiddleware.get_current_user(authorization)
+    except HTTPException:
+        return None
+
 async def get_current_active_user(current_user: dict = Depends(get_current_user)) -> dict:
     """FastAPI dependency to get current active user with subscription check"""
     TenantMiddleware.verify_subscription_access(current_user)
@@ -0,0 +1,217 @@
+"""
+Off-peak warming of the Places and nutrition caches.
+
+The first request of the day for a city pays full upstream latency: a
+geocode, a nearby search and then USDA lookups for the foods people pick.
+CacheWarmer re-fetches what is likely to be asked for again before it
+expires:
+
+- Places: the most-requested geocodes, search tiles and place details from
+  ``db.places_cache`` (see places_cache.PlacesCache) that are missing or will
+  expire within ``horizon_seconds`` (capped at half their TTL)
+- Foods: the most-picked foods in ``db.nutrition`` (``search_hits``) whose
+  detail cache entry will expire within the horizon
+
+It only runs inside the configured UTC hours and while the Places circuit
+breaker is closed. Places entries it fails to refresh are left alone for
+``retry_seconds``. Each Places call is reserved first against a daily
+budget of ``quota_share`` of the Places daily limit, kept in
+``db.cache_warming``. The reservation is a conditional upsert, so several
+workers share one budget. Hits on warmed entries are reported as warm hits
+by the caches themselves.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from resilience import CircuitOpenError
+
+
+def parse_hours(value: str) -> Tuple[int, int]:
+    """"3-6" -> (3, 6): warm from 03:00 until 06:00 UTC; "22-4" wraps past midnight"""
+    start, end = (int(part) % 24 for part in value.split("-", 1))
+    return start, end
+
+
+class CacheWarmer:
+    """Periodic off-peak refresh of popular Places lookups and foods"""
+
+    def __init__(
+        self,
+        db,
+        places_cache,
+        refresh_places_entry: Callable[[Dict[str, Any]], Awaitable[bool]],
+        refresh_food: Callable[[str], Awaitable[Any]],
+        places_available: Callable[[], bool],
+        places_daily_limit: int,
+        food_ttl_seconds: int,
+        quota_share: float = 0.2,
+        hours: Tuple[int, int] = (3, 6),
+        top_n: int = 50,
+        food_top_n: int = 200,
+        horizon_seconds: int = 86400,
+        active_days: int = 7,
+        interval_seconds: float = 900,
+        retry_seconds: int = 86400,
+    ):
+        self.db = db
+        self.places_cache = places_cache
+        self.refresh_places_entry = refresh_places_entry
+        self.refresh_food = refresh_food
+        self.places_available = places_available
+        self.places_budget = int(places_daily_limit * quota_share)
+        self.food_ttl_seconds = food_ttl_seconds
+        self.hours = hours
+        self.top_n = top_n
+        self.food_top_n = food_top_n
+        self.horizon_seconds = horizon_seconds
+        self.active_days = active_days
+        self.interval_seconds = interval_seconds
+        self.retry_seconds = retry_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.last_run: Dict[str, Any] = {}
+        self.stats = {"runs": 0, "places_refreshed": 0, "places_failed": 0, "foods_refreshed": 0, "foods_failed": 0}
+
+    async def ensure_indexes(self):
+        await self.db.nutrition.create_index([("search_hits", -1)], sparse=True)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"Cache warming run failed: {e}")
+
+    def in_window(self, now: Optional[datetime] = None) -> bool:
+        hour = (now or datetime.now(timezone.utc)).hour
+        start, end = self.hours
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    async def _reserve_places_call(self, day: str) -> bool:
+        """Claim one call from today's warming budget; False once it is spent"""
+        if self.places_budget <= 0:
+            return False
+        try:
+            doc = await self.db.cache_warming.find_one_and_update(
+                {"_id": day, "places_calls": {"$lt": self.places_budget}},
+                {"$inc": {"places_calls": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Today's document exists but the filter didn't match: budget spent
+            return False
+        return doc is not None
+
+    async def places_calls_today(self) -> int:
+        doc = await self.db.cache_warming.find_one({"_id": datetime.now(timezone.utc).strftime("%Y-%m-%d")})
+        return doc.get("places_calls", 0) if doc else 0
+
+    async def warm_places(self, now: datetime) -> Dict[str, int]:
+        counts = {"candidates": 0, "refreshed": 0, "failed": 0, "skipped_budget": 0}
+        candidates = await self.places_cache.warm_candidates(self.top_n, self.active_days, self.horizon_seconds)
+        counts["candidates"] = len(candidates)
+        day = now.strftime("%Y-%m-%d")
+        for i, entry in enumerate(candidates):
+            if not self.places_available():
+                logging.warning("Stopping Places cache warming: Google Places is unavailable")
+                break
+            if not await self._reserve_places_call(day):
+                counts["skipped_budget"] = len(candidates) - i
+                break
+            try:
+                refreshed = await self.refresh_places_entry(entry)
+            except CircuitOpenError:
+                logging.warning("Stopping Places cache warming: Google Places circuit is open")
+                break
+            except Exception as e:
+                logging.warning(f"Warming {entry['kind']} {entry['key']} failed: {e}")
+                refreshed = False
+            if refreshed:
+                counts["refreshed"] += 1
+            else:
+                counts["failed"] += 1
+                await self.places_cache.defer(entry["kind"], entry["key"], self.retry_seconds)
+        return counts
+
+    async def warm_foods(self, now: datetime) -> Dict[str, int]:
+        counts = {"candidates": 0, "refreshed": 0, "failed": 0}
+        if self.food_top_n <= 0:
+            return counts
+        # cached_at is stored as an ISO string, which orders like the datetime
+        horizon = min(self.horizon_seconds, self.food_ttl_seconds // 2)
+        stale_before = (now + timedelta(seconds=horizon - self.food_ttl_seconds)).isoformat()
+        candidates = await self.db.nutrition.find(
+            {"search_hits": {"$gt": 0}, "cached_at": {"$lt": stale_before}},
+            {"_id": 0, "fdc_id": 1}
+        ).sort("search_hits", -1).to_list(self.food_top_n)
+        counts["candidates"] = len(candidates)
+        for doc in candidates:
+            try:
+                refreshed = await self.refresh_food(doc["fdc_id"])
+            except CircuitOpenError:
+                logging.warning("Stopping food cache warming: USDA circuit is open")
+                break
+            except Exception as e:
+                logging.warning(f"Warming food {doc['fdc_id']} failed: {e}")
+                refreshed = None
+            counts["refreshed" if refreshed else "failed"] += 1
+        return counts
+
+    async def run_once(self, force: bool = False) -> Dict[str, Any]:
+        """One warming pass; outside the off-peak window it does nothing unless forced"""
+        now = datetime.now(timezone.utc)
+        if not force and not self.in_window(now):
+            return {"skipped": "outside warming hours"}
+        if self._lock.locked():
+            return {"skipped": "already running"}
+
+        async with self._lock:
+            started = asyncio.get_running_loop().time()
+            run: Dict[str, Any] = {"started_at": now.isoformat(), "forced": force}
+            if self.places_available():
+                run["places"] = await self.warm_places(now)
+            else:
+                run["places"] = {"skipped": "Google Places is unavailable"}
+            run["foods"] = await self.warm_foods(now)
+            run["duration_seconds"] = round(asyncio.get_running_loop().time() - started, 3)
+
+            self.stats["runs"] += 1
+            for kind in ("places", "foods"):
+                self.stats[f"{kind}_refreshed"] += run[kind].get("refreshed", 0)
+                self.stats[f"{kind}_failed"] += run[kind].get("failed", 0)
+            self.last_run = run
+            logging.info(f"Cache warming run finished: {run}")
+            return run
+
+    async def get_stats(self) -> Dict[str, Any]:
+        start, end = self.hours
+        return {
+            "window_utc": f"{start:02d}:00-{end:02d}:00",
+            "in_window": self.in_window(),
+            "places_budget_per_day": self.places_budget,
+            "places_calls_today": await self.places_calls_today(),
+            **self.stats,
+            "last_run": self.last_run,
+        }
@@ -0,0 +1,213 @@
+"""
+Token-budgeted conversation context for the health coach.
+
+Each chat turn is sent with a system message built from:
+
+1. the static block: coach prompt + profile, always first so the provider's
+   prefix cache can reuse it; its token count is cached per distinct text
+2. a rolling summary of older turns, stored in ``db.chat_summaries``
+3. as many of the most recent turns as fit the model's token budget, verbatim
+
+Turns past the ``max_recent_turns`` window stay verbatim (budget permitting)
+until ``fold_batch`` of them have accumulated and are folded into the summary
+in the background, so prompt size (and latency) stays flat however long the
+conversation gets. A turn that doesn't fit the budget is folded right away,
+so every turn is either shown or being summarized.
+
+Token counts come from a local GPT-style pre-tokenizer: words are split the
+way BPE tokenizers split them and long words are charged one token per four
+characters. It slightly over-counts, which is the safe direction for a budget.
+"""
+import asyncio
+import logging
+import math
+import re
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+# Approximates the cl100k/o200k pre-tokenizer: contractions, words, numbers, punctuation runs
+PRETOKEN_PATTERN = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[A-Za-z]+| ?[0-9]{1,3}| ?[^\sA-Za-z0-9]+|\s+")
+
+# Prompt token budgets per model (context sent, not the model's full window)
+MODEL_TOKEN_BUDGETS = {
+    "gpt-4o-mini": 6000,
+    "gpt-4o": 6000,
+}
+DEFAULT_TOKEN_BUDGET = 4000
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a person with diabetes and their AI health coach.
+Update the summary with the new exchanges below. Keep facts about the person (conditions, medications, preferences, dislikes, goals), advice already given, decisions made and open questions. Drop pleasantries. Use plain sentences without markdown, at most {words} words.
+
+Current summary:
+{summary}
+
+New exchanges:
+{turns}"""
+
+
+def count_tokens(text: str) -> int:
+    """Approximate BPE token count of a string"""
+    tokens = 0
+    for piece in PRETOKEN_PATTERN.findall(text or ""):
+        if piece.isspace():
+            tokens += 1 if "\n" in piece else 0
+        else:
+            tokens += max(1, math.ceil(len(piece.strip()) / 4))
+    return tokens
+
+
+def truncate_to_tokens(text: str, limit: int) -> str:
+    """Longest prefix of text within the token limit, cut at a piece boundary"""
+    used = 0
+    end = 0
+    for match in PRETOKEN_PATTERN.finditer(text or ""):
+        piece = match.group()
+        cost = (1 if "\n" in piece else 0) if piece.isspace() else max(1, math.ceil(len(piece.strip()) / 4))
+        if used + cost > limit:
+            break
+        used += cost
+        end = match.end()
+    return text[:end]
+
+
+def format_turn(user_text: str, coach_text: str) -> str:
+    return f"User: {user_text}\nCoach: {coach_text}"
+
+
+class ConversationContextBuilder:
+    """Builds budgeted system messages and maintains rolling summaries"""
+
+    def __init__(
+        self,
+        db,
+        summarize: Callable[[str, str], Awaitable[str]],
+        max_recent_turns: int = 8,
+        fold_batch: int = 4,
+        summary_tokens: int = 400,
+        static_cache_size: int = 1024,
+    ):
+        self.db = db
+        self.summarize = summarize
+        self.max_recent_turns = max_recent_turns
+        self.fold_batch = fold_batch
+        self.summary_tokens = summary_tokens
+        self.static_cache_size = static_cache_size
+        self._static_tokens: "OrderedDict[str, int]" = OrderedDict()
+        self._folding: set = set()
+        self._fold_tasks: set = set()
+        self.stats = {"builds": 0, "static_cache_hits": 0, "folds": 0, "fold_errors": 0, "budget_folds": 0}
+
+    async def ensure_indexes(self):
+        await self.db.chat_summaries.create_index("conversation_id", unique=True)
+
+    @staticmethod
+    def token_budget(model: str) -> int:
+        return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+    def static_tokens(self, static_block: str) -> int:
+        """Token count of the prompt + profile block, cached per distinct block"""
+        tokens = self._static_tokens.get(static_block)
+        if tokens is not None:
+            self._static_tokens.move_to_end(static_block)
+            self.stats["static_cache_hits"] += 1
+            return tokens
+        tokens = count_tokens(static_block)
+        self._static_tokens[static_block] = tokens
+        while len(self._static_tokens) > self.static_cache_size:
+            self._static_tokens.popitem(last=False)
+        return tokens
+
+    async def get_summary(self, conversation_id: str) -> Dict[str, Any]:
+        doc = await self.db.chat_summaries.find_one({"conversation_id": conversation_id}, {"_id": 0})
+        return doc or {"conversation_id": conversation_id, "summary": "", "summarized_until": ""}
+
+    async def build(
+        self,
+        conversation_id: str,
+        static_block: str,
+        message: str,
+        load_turns: Callable[[str], Awaitable[List[Tuple[str, str, str]]]],
+        tenant_id: str,
+        model: str = "gpt-4o-mini",
+    ) -> str:
+        """System message for the next turn, within the model's token budget
+
+        ``load_turns(since)`` returns (user_text, coach_text, timestamp) turns
+        newer than the ``since`` timestamp (ISO string), oldest first. Summary
+        updates are billed to ``tenant_id``.
+        """
+        self.stats["builds"] += 1
+        summary_doc = await self.get_summary(conversation_id)
+        summary = summary_doc.get("summary") or ""
+        turns = await load_turns(summary_doc.get("summarized_until") or "")
+
+        remaining = self.token_budget(model) - self.static_tokens(static_block) - count_tokens(message)
+        summary_section = f"\n\nSummary of the earlier conversation:\n{summary}" if summary else ""
+        remaining -= count_tokens(summary_section)
+
+        # Newest turns first, verbatim, until the budget is full; turns not yet
+        # summarized stay here even past the window
+        recent: List[str] = []
+        for user_text, coach_text, _ in reversed(turns):
+            turn = format_turn(user_text, coach_text)
+            cost = count_tokens(turn) + 1
+            if cost > remaining:
+                break
+            recent.append(turn)
+            remaining -= cost
+        recent.reverse()
+
+        # Fold everything past the window once a batch has built up, or at once if some of it isn't shown
+        outside = turns[:len(turns) - min(len(recent), self.max_recent_turns)]
+        hidden = len(turns) > len(recent)
+        if outside and (hidden or len(outside) >= self.fold_batch):
+            if hidden:
+                self.stats["budget_folds"] += 1
+            self._fold_in_background(conversation_id, summary, outside, tenant_id)
+
+        system_message = static_block + summary_section
+        if recent:
+            system_message += "\n\nRecent conversation:\n" + "\n\n".join(recent)
+        return system_message
+
+    def _fold_in_background(self, conversation_id: str, summary: str, turns: List[Tuple[str, str, str]], tenant_id: str):
+        if conversation_id in self._folding:
+            return
+        self._folding.add(conversation_id)
+
+        async def fold():
+            try:
+                await self.fold(conversation_id, summary, turns, tenant_id)
+                self.stats["folds"] += 1
+            except Exception as e:
+                self.stats["fold_errors"] += 1
+                logging.warning(f"Conversation summary update failed for {conversation_id}: {e}")
+            finally:
+                self._folding.discard(conversation_id)
+
+        task = asyncio.create_task(fold())
+        self._fold_tasks.add(task)
+        task.add_done_callback(self._fold_tasks.discard)
+
+    async def fold(self, conversation_id: str, summary: str, turns: List[Tuple[str, str, str]], tenant_id: str):
+        """Merge turns into the stored summary and advance its cursor past them"""
+        words = int(self.summary_tokens * 0.7)
+        prompt = SUMMARY_PROMPT.format(
+            words=words,
+            summary=summary or "(none yet)",
+            turns="\n\n".join(format_turn(user_text, coach_text) for user_text, coach_text, _ in turns)
+        )
+        new_summary = truncate_to_tokens((await self.summarize(prompt, tenant_id)).strip(), self.summary_tokens)
+        await self.db.chat_summaries.update_one(
+            {"conversation_id": conversation_id},
+            {"$set": {
+                "summary": new_summary,
+                "summarized_until": turns[-1][2],
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }},
+            upsert=True
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "folding": len(self._folding), "static_blocks_cached": len(self._static_tokens)}
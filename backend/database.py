@@ -1,5 +1,8 @@
+import asyncio
 import os
-from pymongo import MongoClient
+import re
+import uuid
+from pymongo import MongoClient, UpdateOne
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from models import User, PaymentTransaction, ChatSession, Restaurant, ShoppingList, APIUsage, AdminUser
@@ -35,6 +38,7 @@ class DatabaseManager:
         self.db.restaurants.create_index([("tenant_id", 1), ("place_id", 1)])
         self.db.shopping_lists.create_index([("tenant_id", 1), ("user_id", 1)])
         self.db.api_usage.create_index([("tenant_id", 1), ("service", 1)])
+        self.db.api_usage.create_index([("service", 1), ("cost_usd", -1)])
         
         # Admin collection indexes
         self.db.admin_users.create_index("email", unique=True)
@@ -178,6 +182,61 @@ class DatabaseManager:
         )
         return result.modified_count > 0 or result.upserted_id is not None
     
+    async def increment_api_usage(self, usage: List[Dict[str, Any]]) -> int:
+        """Add a batch of usage counters in one bulk write (tenant_id + service per entry)"""
+        now = datetime.utcnow()
+        operations = []
+        for entry in usage:
+            entry = dict(entry)
+            tenant_id, service = entry.pop("tenant_id"), entry.pop("service")
+            latency_ms_max = entry.pop("latency_ms_max", None)
+            labels = {k: entry.pop(k) for k in ("endpoint", "model") if k in entry}
+            update = {
+                "$inc": entry,
+                "$set": {"updated_at": now, **labels},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "monthly_limit": 0, "last_reset": now, "created_at": now},
+            }
+            if latency_ms_max is not None:
+                update["$max"] = {"latency_ms_max": latency_ms_max}
+            operations.append(UpdateOne({"tenant_id": tenant_id, "service": service}, update, upsert=True))
+        if not operations:
+            return 0
+        # The pymongo client is synchronous; keep the write off the event loop
+        result = await asyncio.to_thread(self.db.api_usage.bulk_write, operations, ordered=False)
+        return result.modified_count + result.upserted_count
+    
+    async def get_top_api_consumers(self, service_prefix: str = "llm:", group_by: str = "tenant",
+                                    sort_by: str = "cost_usd", limit: int = 20) -> List[Dict[str, Any]]:
+        """Usage totals per tenant, endpoint or tenant + endpoint, highest first"""
+        group_keys = {
+            "tenant": {"tenant_id": "$tenant_id"},
+            "endpoint": {"endpoint": "$endpoint"},
+            "model": {"model": "$model"},
+            "tenant_endpoint": {"tenant_id": "$tenant_id", "endpoint": "$endpoint"},
+        }[group_by]
+        pipeline = [
+            {"$match": {"service": {"$regex": f"^{re.escape(service_prefix)}"}}},
+            {"$group": {
+                "_id": group_keys,
+                "calls_made": {"$sum": "$calls_made"},
+                "errors": {"$sum": "$errors"},
+                "prompt_tokens": {"$sum": "$prompt_tokens"},
+                "completion_tokens": {"$sum": "$completion_tokens"},
+                "latency_ms_total": {"$sum": "$latency_ms_total"},
+                "latency_ms_max": {"$max": "$latency_ms_max"},
+                "cost_usd": {"$sum": "$cost_usd"},
+            }},
+            {"$sort": {sort_by: -1}},
+            {"$limit": limit},
+        ]
+        consumers = []
+        rows = await asyncio.to_thread(lambda: list(self.db.api_usage.aggregate(pipeline)))
+        for row in rows:
+            row.update(row.pop("_id"))
+            row["avg_latency_ms"] = row["latency_ms_total"] / row["calls_made"] if row["calls_made"] else 0.0
+            consumers.append(row)
+        return consumers
+    
     # Admin Operations
     async def get_all_users(self, skip: int = 0, limit: int = 100) -> List[User]:
         """Get all users for admin dashboard"""
@@ -0,0 +1,180 @@
+"""
+Diabetic-friendliness scoring for restaurants and foods.
+
+The scoring rules live in a config table (defaults below, overridable by the
+``restaurant`` document in ``db.scoring_config``). They are compiled once into a
+single keyword matcher plus weight vectors, and a whole page of places is
+scored at once as NumPy feature matrices:
+
+    score = base + K @ keyword_weights + T @ type_weights
+                 + fast_food_penalty * F + rating_bonus
+
+clipped to [min_score, max_score].
+
+Every stored score is stamped with the version of the rules that produced it
+(``scoring_version`` on restaurants, ``rating_version`` on foods) so the
+rescoring job can find and refresh outdated documents.
+"""
+import copy
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_RESTAURANT_SCORING = {
+    "version": 1,
+    "base_score": 3.0,
+    "min_score": 1.0,
+    "max_score": 5.0,
+    # Substrings of the lowercased place name; each counts once per place
+    "name_keywords": {
+        "salad": 0.5, "grill": 0.5, "fresh": 0.5, "organic": 0.5,
+        "healthy": 0.5, "mediterranean": 0.5, "vegetarian": 0.5, "bowl": 0.5,
+        "mcdonald": -1.0, "burger": -1.0, "pizza": -1.0, "kfc": -1.0,
+        "taco bell": -1.0, "subway": -1.0,
+    },
+    # Google place types that are generally better for diabetics
+    "types": {"meal_takeaway": 0.3, "health": 0.3, "vegetarian_restaurant": 0.3},
+    # Applied once if any of these types is present, unless the name has the exempt keyword
+    "fast_food_types": ["meal_delivery", "meal_takeaway"],
+    "fast_food_type_penalty": -0.5,
+    "fast_food_exempt_keyword": "healthy",
+    # [minimum rating, bonus], highest band first
+    "rating_bands": [[4.0, 0.3], [3.5, 0.1]],
+}
+
+
+class RestaurantScorer:
+    """Compiled, vectorized version of the restaurant diabetic-friendliness rules"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.compile(config or DEFAULT_RESTAURANT_SCORING)
+
+    def compile(self, config: Dict[str, Any]):
+        """Precompute the keyword matcher and weight vectors for a config"""
+        self.config = copy.deepcopy(config)
+        self.version = config.get("version", 1)
+        self.base_score = float(config["base_score"])
+        self.min_score = float(config["min_score"])
+        self.max_score = float(config["max_score"])
+
+        self.keywords = list(config["name_keywords"])
+        self.keyword_index = {keyword: i for i, keyword in enumerate(self.keywords)}
+        self.keyword_weights = np.array([config["name_keywords"][k] for k in self.keywords], dtype=np.float64)
+        # Lookahead alternation reports every (possibly overlapping) keyword in one scan
+        alternation = "|".join(re.escape(k) for k in sorted(self.keywords, key=len, reverse=True))
+        self.keyword_pattern = re.compile(f"(?=({alternation}))") if self.keywords else None
+
+        self.types = list(config["types"])
+        self.type_index = {place_type: i for i, place_type in enumerate(self.types)}
+        self.type_weights = np.array([config["types"][t] for t in self.types], dtype=np.float64)
+
+        self.fast_food_types = frozenset(config["fast_food_types"])
+        self.fast_food_penalty = float(config["fast_food_type_penalty"])
+        self.fast_food_exempt = config.get("fast_food_exempt_keyword") or None
+
+        bands = sorted(config["rating_bands"], key=lambda band: band[0], reverse=True)
+        self.rating_thresholds = np.array([band[0] for band in bands], dtype=np.float64)
+        self.rating_bonuses = np.array([band[1] for band in bands], dtype=np.float64)
+
+    def features(self, places: List[Dict[str, Any]]):
+        """Build the keyword, type, fast-food and rating arrays for a page of places"""
+        n = len(places)
+        keyword_hits = np.zeros((n, len(self.keywords)), dtype=np.float64)
+        type_hits = np.zeros((n, len(self.types)), dtype=np.float64)
+        fast_food = np.zeros(n, dtype=np.float64)
+        ratings = np.zeros(n, dtype=np.float64)
+
+        for row, place in enumerate(places):
+            name = (place.get("name") or "").lower()
+            if self.keyword_pattern is not None:
+                for keyword in set(self.keyword_pattern.findall(name)):
+                    keyword_hits[row, self.keyword_index[keyword]] = 1.0
+
+            place_types = {t.lower() for t in (place.get("types") or place.get("cuisine_types") or [])}
+            for place_type in place_types:
+                column = self.type_index.get(place_type)
+                if column is not None:
+                    type_hits[row, column] = 1.0
+            if place_types & self.fast_food_types and not (self.fast_food_exempt and self.fast_food_exempt in name):
+                fast_food[row] = 1.0
+
+            ratings[row] = place.get("rating") or 0.0
+        return keyword_hits, type_hits, fast_food, ratings
+
+    def score_many(self, places: List[Dict[str, Any]]) -> np.ndarray:
+        """Score a whole result page in one pass"""
+        if not places:
+            return np.zeros(0, dtype=np.float64)
+        keyword_hits, type_hits, fast_food, ratings = self.features(places)
+
+        scores = np.full(len(places), self.base_score)
+        scores += keyword_hits @ self.keyword_weights
+        scores += type_hits @ self.type_weights
+        scores += fast_food * self.fast_food_penalty
+        if len(self.rating_thresholds):
+            # First band (highest threshold) the rating reaches, if any
+            reached = ratings[:, None] >= self.rating_thresholds[None, :]
+            band = reached.argmax(axis=1)
+            scores += np.where(reached.any(axis=1), self.rating_bonuses[band], 0.0)
+        return np.clip(np.round(scores, 2), self.min_score, self.max_score)
+
+    def score(self, place: Dict[str, Any]) -> float:
+        return float(self.score_many([place])[0])
+
+    async def load(self, db):
+        """Load the scoring table from db.scoring_config, keeping defaults for missing keys"""
+        try:
+            stored = await db.scoring_config.find_one({"name": "restaurant"}, {"_id": 0, "name": 0})
+            if stored:
+                self.compile({**DEFAULT_RESTAURANT_SCORING, **stored})
+                logging.info(f"Loaded restaurant scoring config version {self.version}")
+        except Exception as e:
+            logging.error(f"Error loading restaurant scoring config, using defaults: {e}")
+
+    async def save(self, db, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate, persist and activate a new scoring table under a new version"""
+        merged = {**DEFAULT_RESTAURANT_SCORING, **config}
+        merged["version"] = max(int(config.get("version", 0)), self.version + 1)
+        RestaurantScorer(merged)  # Raises on malformed tables before anything is stored
+        await db.scoring_config.replace_one(
+            {"name": "restaurant"},
+            {"name": "restaurant", **merged},
+            upsert=True
+        )
+        self.compile(merged)
+        return self.config
+
+
+# Bump when rate_food's thresholds or the food analytics change so stored ratings get refreshed
+# (2: net carbs and glycemic index/load stored alongside the rating;
+#  3: GI matched on the primary description segment, none for foods without carbs;
+#  4: singular/plural matching, category first segments, GI 0 kept, stored GIs recomputed)
+FOOD_RATING_VERSION = 4
+
+
+# (rating, max net carbs, max sugars) per 100 g, best first; anything worse is "caution"
+FOOD_RATING_BANDS = [("excellent", 5, 2), ("good", 10, 5), ("moderate", 20, 10)]
+
+
+def rate_foods(carbohydrates: np.ndarray, fiber: np.ndarray, sugars: np.ndarray) -> np.ndarray:
+    """Rate many per-100g foods at once by net carbs and sugars"""
+    net_carbs = carbohydrates - fiber
+    return np.select(
+        [(net_carbs <= max_net) & (sugars <= max_sugars) for _, max_net, max_sugars in FOOD_RATING_BANDS],
+        [rating for rating, _, _ in FOOD_RATING_BANDS],
+        default="caution"
+    )
+
+
+def rate_food(nutrients: Dict[str, Any]) -> str:
+    """Rate a per-100g food by net carbs and sugars"""
+    carbs = nutrients.get('carbohydrates') or 0
+    fiber = nutrients.get('fiber') or 0
+    sugars = nutrients.get('sugars') or 0
+    return str(rate_foods(np.array([carbs], dtype=float), np.array([fiber], dtype=float), np.array([sugars], dtype=float))[0])
+
+
+# Global restaurant scorer instance
+restaurant_scorer = RestaurantScorer()
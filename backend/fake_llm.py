@@ -0,0 +1,174 @@
+"""
+Deterministic stand-in for the LLM provider (LLM_BACKEND=fake).
+
+Lets /chat, /restaurants/analyze and /shopping-lists/generate run offline, so
+load tests and latency benchmarks need no network or API key. Calls go
+through the same gateway, scheduler and circuit breaker as real ones.
+
+Behaviour is configured with environment variables:
+
+- LLM_FAKE_SEED: seed for all randomness (default 0). Reply text depends only
+  on the seed and the prompt. Latency and injected errors follow the seed and
+  the call sequence, so a replayed load test sees the same distribution.
+- LLM_FAKE_LATENCY: time to first token, as ``fixed:MS``, ``uniform:MIN_MS,MAX_MS``,
+  ``normal:MEAN_MS,STDDEV_MS`` or ``lognormal:MEDIAN_MS,SIGMA`` (default ``lognormal:800,0.5``)
+- LLM_FAKE_TOKENS_PER_SECOND: streaming rate after the first token (default 40; 0 = instant)
+- LLM_FAKE_RESPONSE_TOKENS: reply length range ``MIN,MAX`` (default ``120,400``)
+- LLM_FAKE_ERROR_RATE: fraction of calls that fail with FakeLLMError (default 0)
+- LLM_FAKE_TIMEOUT_RATE: fraction of calls that hang past the LLM deadline (default 0)
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+WORDS = (
+    "blood sugar fiber protein carbs meal portion vegetables whole grains lean balance "
+    "glucose insulin snack breakfast lunch dinner walk hydration sleep label serving "
+    "salad chicken salmon beans lentils berries nuts yogurt spinach broccoli quinoa oats "
+    "steady gradual choose pair swap limit enjoy track aim consider try prefer"
+).split()
+
+FOOD_NAMES = (
+    "Chicken breast", "Salmon fillet", "Spinach", "Broccoli", "Brown rice", "Quinoa",
+    "Greek yogurt", "Eggs", "Almonds", "Black beans", "Olive oil", "Blueberries",
+    "Frozen mixed vegetables", "Oats", "Cauliflower", "Lentils", "Avocado", "Tofu",
+)
+
+UNITS = ("lbs", "oz", "cups", "tbsp", "tsp", None)
+
+
+class FakeLLMError(Exception):
+    """Injected provider failure"""
+
+
+def parse_latency(spec: str) -> Tuple[str, List[float]]:
+    kind, _, params = spec.partition(":")
+    kind = kind.strip().lower()
+    values = [float(v) for v in params.split(",") if v.strip()]
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if kind not in expected or len(values) != expected[kind]:
+        raise ValueError(f"Invalid LLM_FAKE_LATENCY '{spec}'; expected e.g. fixed:500, uniform:200,1200, normal:800,200 or lognormal:800,0.5")
+    return kind, values
+
+
+def sample_latency(rng: random.Random, kind: str, params: List[float]) -> float:
+    """Seconds until the first token"""
+    if kind == "fixed":
+        ms = params[0]
+    elif kind == "uniform":
+        ms = rng.uniform(params[0], params[1])
+    elif kind == "normal":
+        ms = rng.gauss(params[0], params[1])
+    else:
+        ms = params[0] * rng.lognormvariate(0, params[1])
+    return max(0.0, ms) / 1000
+
+
+class FakeLLMClient:
+    """Seeded fake with latency, token-rate and error injection"""
+
+    # Shared so every (provider, model) client draws from one call sequence
+    _calls = itertools.count()
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.seed = os.environ.get('LLM_FAKE_SEED', '0')
+        self.latency = parse_latency(os.environ.get('LLM_FAKE_LATENCY', 'lognormal:800,0.5'))
+        self.tokens_per_second = float(os.environ.get('LLM_FAKE_TOKENS_PER_SECOND', 40))
+        low, _, high = os.environ.get('LLM_FAKE_RESPONSE_TOKENS', '120,400').partition(",")
+        self.response_tokens = (int(low), int(high or low))
+        self.error_rate = float(os.environ.get('LLM_FAKE_ERROR_RATE', 0))
+        self.timeout_rate = float(os.environ.get('LLM_FAKE_TIMEOUT_RATE', 0))
+        self.hang_seconds = float(os.environ.get('LLM_TIMEOUT', 60)) * 2
+
+    def _rng(self, *parts: Any) -> random.Random:
+        digest = hashlib.sha256("|".join(str(p) for p in (self.seed, *parts)).encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _call_plan(self) -> Dict[str, Any]:
+        """Latency and failure mode of the next call in the sequence"""
+        rng = self._rng("call", next(self._calls))
+        roll = rng.random()
+        return {
+            "latency": sample_latency(rng, *self.latency),
+            "fail": "timeout" if roll < self.timeout_rate else "error" if roll < self.timeout_rate + self.error_rate else None,
+            # Where in the stream an injected error strikes
+            "fail_at": rng.random(),
+        }
+
+    def _reply(self, system_message: str, text: str, json_schema: Optional[Dict]) -> str:
+        rng = self._rng("reply", self.model, system_message, text)
+        if json_schema:
+            return json.dumps(self._instance(json_schema, rng, "response"))
+        count = rng.randint(*self.response_tokens)
+        words = [rng.choice(WORDS) for _ in range(count)]
+        sentences = []
+        while words:
+            length = rng.randint(8, 18)
+            sentence, words = words[:length], words[length:]
+            sentences.append(" ".join(sentence).capitalize() + ".")
+        return " ".join(sentences)
+
+    def _instance(self, schema: Dict, rng: random.Random, name: str) -> Any:
+        """Deterministic value conforming to a (simple) JSON schema"""
+        kind = schema.get("type")
+        if isinstance(kind, list):
+            kind = next((k for k in kind if k != "null"), "null")
+        if "enum" in schema:
+            return rng.choice(schema["enum"])
+        if kind == "object":
+            return {key: self._instance(sub, rng, key) for key, sub in schema.get("properties", {}).items()}
+        if kind == "array":
+            return [self._instance(schema.get("items", {}), rng, name) for _ in range(rng.randint(5, 15))]
+        if kind in ("number", "integer"):
+            return rng.randint(1, 4) if kind == "integer" else rng.choice((0.5, 1, 1.5, 2, 3, 8, 12))
+        if kind == "boolean":
+            return rng.random() < 0.5
+        if kind == "null":
+            return None
+        if name == "unit":
+            return rng.choice(UNITS)
+        if name in ("name", "item"):
+            return rng.choice(FOOD_NAMES)
+        return " ".join(rng.choice(WORDS) for _ in range(3))
+
+    @staticmethod
+    def _tokens(reply: str) -> List[str]:
+        words = reply.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    async def _fail(self, plan: Dict[str, Any]):
+        if plan["fail"] == "timeout":
+            # Longer than the LLM policy deadline, so the gateway times out
+            await asyncio.sleep(self.hang_seconds)
+        raise FakeLLMError(f"Injected LLM failure ({self.provider}/{self.model})")
+
+    async def complete(self, system_message: str, text: str, session_id: str, json_schema: Optional[Dict] = None) -> str:
+        plan = self._call_plan()
+        reply = self._reply(system_message, text, json_schema)
+        await asyncio.sleep(plan["latency"])
+        if plan["fail"]:
+            await self._fail(plan)
+        if self.tokens_per_second > 0:
+            await asyncio.sleep(len(self._tokens(reply)) / self.tokens_per_second)
+        return reply
+
+    async def stream(self, system_message: str, text: str, session_id: str) -> AsyncIterator[str]:
+        plan = self._call_plan()
+        tokens = self._tokens(self._reply(system_message, text, None))
+        fail_index = int(plan["fail_at"] * len(tokens)) if plan["fail"] else None
+        await asyncio.sleep(plan["latency"])
+        for index, token in enumerate(tokens):
+            if index == fail_index:
+                await self._fail(plan)
+            if index and self.tokens_per_second > 0:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield token
+
+    async def close(self):
+        pass
@@ -0,0 +1,379 @@
+"""
+Offline USDA FoodData Central index.
+
+Imports the public FoodData Central bulk downloads (JSON or CSV) into a compact
+local store: one float32 column per nutrient we track, descriptions packed into
+a single UTF-8 buffer, and an inverted index over description tokens stored as
+CSR-style posting arrays. Searches are answered locally with ranking, so the
+USDA API is only needed as a fallback for foods missing from the dump.
+
+Usage:
+    python food_index.py <dump.json | csv_dir> <output.npz>
+"""
+import csv
+import json
+import logging
+import os
+import re
+import sys
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from usda_nutrients import NUTRIENT_COLUMNS, NUTRIENT_SPECS, NUTRIENTS_BY_ID, convert_unit, parse_food
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase a description and split it into alphanumeric tokens"""
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+class FoodDataIndex:
+    """In-memory columnar store and inverted index over FoodData Central foods"""
+
+    def __init__(self):
+        self.fdc_ids = np.zeros(0, dtype=np.int64)
+        self.nutrients = np.zeros((0, len(NUTRIENT_COLUMNS)), dtype=np.float32)
+        self.doc_lengths = np.zeros(0, dtype=np.int16)
+        self.first_terms = np.zeros(0, dtype=np.int32)
+        self._descriptions = b""
+        self._description_offsets = np.zeros(1, dtype=np.int64)
+        self._brands = b""
+        self._brand_offsets = np.zeros(1, dtype=np.int64)
+        self.vocabulary: List[str] = []
+        self._postings = np.zeros(0, dtype=np.int32)
+        self._posting_offsets = np.zeros(1, dtype=np.int64)
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._term_ids: Dict[str, int] = {}
+        self._row_by_fdc_id: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.fdc_ids)
+
+    @property
+    def loaded(self) -> bool:
+        return len(self) > 0
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, foods: Iterable[Dict[str, Any]]) -> "FoodDataIndex":
+        """Build an index from normalized food records
+
+        Each record is a dict with ``fdc_id``, ``description``, optional
+        ``brand_name`` and a ``nutrients`` dict keyed by NUTRIENT_COLUMNS.
+        """
+        fdc_ids: List[int] = []
+        rows: List[List[float]] = []
+        descriptions: List[bytes] = []
+        brands: List[bytes] = []
+        doc_lengths: List[int] = []
+        first_tokens: List[str] = []
+        postings: Dict[str, List[int]] = {}
+
+        for food in foods:
+            description = (food.get("description") or "").strip()
+            if not description:
+                continue
+
+            row = len(fdc_ids)
+            fdc_ids.append(int(food["fdc_id"]))
+            nutrients = food.get("nutrients", {})
+            rows.append([nutrients.get(column, np.nan) for column in NUTRIENT_COLUMNS])
+            descriptions.append(description.encode("utf-8"))
+            brands.append((food.get("brand_name") or "").encode("utf-8"))
+
+            tokens = tokenize(description)
+            doc_lengths.append(min(len(tokens), np.iinfo(np.int16).max))
+            first_tokens.append(tokens[0] if tokens else "")
+            for token in set(tokens):
+                postings.setdefault(token, []).append(row)
+
+        index = cls()
+        index.fdc_ids = np.asarray(fdc_ids, dtype=np.int64)
+        index.nutrients = np.asarray(rows, dtype=np.float32).reshape(-1, len(NUTRIENT_COLUMNS))
+        index.doc_lengths = np.asarray(doc_lengths, dtype=np.int16)
+        index._descriptions, index._description_offsets = cls._pack_strings(descriptions)
+        index._brands, index._brand_offsets = cls._pack_strings(brands)
+
+        index.vocabulary = sorted(postings)
+        term_ids = {term: i for i, term in enumerate(index.vocabulary)}
+        index.first_terms = np.asarray([term_ids.get(t, -1) for t in first_tokens], dtype=np.int32)
+        lengths = np.fromiter((len(postings[t]) for t in index.vocabulary), dtype=np.int64, count=len(index.vocabulary))
+        index._posting_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        index._postings = (
+            np.concatenate([np.asarray(postings[t], dtype=np.int32) for t in index.vocabulary])
+            if index.vocabulary else np.zeros(0, dtype=np.int32)
+        )
+        index._finalize()
+        return index
+
+    @staticmethod
+    def _pack_strings(values: List[bytes]) -> Tuple[bytes, np.ndarray]:
+        """Pack byte strings into one buffer plus an offsets array"""
+        lengths = np.fromiter((len(v) for v in values), dtype=np.int64, count=len(values))
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        return b"".join(values), offsets
+
+    def _finalize(self):
+        """Derive lookup tables that are not persisted"""
+        self._term_ids = {term: i for i, term in enumerate(self.vocabulary)}
+        self._row_by_fdc_id = {int(fdc_id): row for row, fdc_id in enumerate(self.fdc_ids)}
+        document_frequency = np.diff(self._posting_offsets).astype(np.float32)
+        self._idf = np.log1p(len(self) / np.maximum(document_frequency, 1.0)).astype(np.float32)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path: str):
+        """Write the index to a compressed .npz file"""
+        np.savez_compressed(
+            path,
+            fdc_ids=self.fdc_ids,
+            nutrients=self.nutrients,
+            doc_lengths=self.doc_lengths,
+            first_terms=self.first_terms,
+            descriptions=np.frombuffer(self._descriptions, dtype=np.uint8),
+            description_offsets=self._description_offsets,
+            brands=np.frombuffer(self._brands, dtype=np.uint8),
+            brand_offsets=self._brand_offsets,
+            vocabulary=np.frombuffer("\n".join(self.vocabulary).encode("utf-8"), dtype=np.uint8),
+            postings=self._postings,
+            posting_offsets=self._posting_offsets,
+            columns=np.array(NUTRIENT_COLUMNS),
+        )
+
+    def load(self, path: str) -> "FoodDataIndex":
+        """Load an index previously written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            columns = [str(c) for c in data["columns"]]
+            if columns != NUTRIENT_COLUMNS:
+                raise ValueError(f"Food index {path} has columns {columns}, expected {NUTRIENT_COLUMNS}")
+            self.fdc_ids = data["fdc_ids"]
+            self.nutrients = data["nutrients"]
+            self.doc_lengths = data["doc_lengths"]
+            self.first_terms = data["first_terms"]
+            self._descriptions = data["descriptions"].tobytes()
+            self._description_offsets = data["description_offsets"]
+            self._brands = data["brands"].tobytes()
+            self._brand_offsets = data["brand_offsets"]
+            vocabulary = data["vocabulary"].tobytes().decode("utf-8")
+            self.vocabulary = vocabulary.split("\n") if vocabulary else []
+            self._postings = data["postings"]
+            self._posting_offsets = data["posting_offsets"]
+        self._finalize()
+        logging.info(f"Loaded local food index from {path}: {len(self)} foods, {len(self.vocabulary)} terms")
+        return self
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def description(self, row: int) -> str:
+        start, end = self._description_offsets[row], self._description_offsets[row + 1]
+        return self._descriptions[start:end].decode("utf-8")
+
+    def brand_name(self, row: int) -> Optional[str]:
+        start, end = self._brand_offsets[row], self._brand_offsets[row + 1]
+        return self._brands[start:end].decode("utf-8") or None
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Materialize one row as a FoodNutrition-shaped dict"""
+        values = self.nutrients[row]
+        record = {
+            "fdc_id": str(int(self.fdc_ids[row])),
+            "description": self.description(row),
+            "brand_name": self.brand_name(row),
+        }
+        for column, value in zip(NUTRIENT_COLUMNS, values):
+            record[column] = None if np.isnan(value) else round(float(value), 2)
+        return record
+
+    def get(self, fdc_id: str) -> Optional[Dict[str, Any]]:
+        """Return the record for an FDC ID, or None if it is not in the dump"""
+        try:
+            row = self._row_by_fdc_id.get(int(fdc_id))
+        except (TypeError, ValueError):
+            return None
+        return self.record(row) if row is not None else None
+
+    def _term_postings(self, term: str, allow_prefix: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, idf weights) for a query term, expanding prefixes if allowed"""
+        term_id = self._term_ids.get(term)
+        if term_id is not None:
+            term_ids = [term_id]
+        elif allow_prefix:
+            # Sorted vocabulary makes prefix expansion a contiguous slice
+            start = bisect_left(self.vocabulary, term)
+            end = bisect_left(self.vocabulary, term + "\uffff", lo=start)
+            term_ids = range(start, min(end, start + 50))
+        else:
+            term_ids = []
+
+        if not term_ids:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+        rows = np.concatenate([
+            self._postings[self._posting_offsets[t]:self._posting_offsets[t + 1]] for t in term_ids
+        ])
+        weights = np.concatenate([
+            np.full(self._posting_offsets[t + 1] - self._posting_offsets[t], self._idf[t], dtype=np.float32)
+            for t in term_ids
+        ])
+        if len(term_ids) > 1:
+            # A document matching several expansions of one prefix still counts once
+            rows, first = np.unique(rows, return_index=True)
+            weights = weights[first]
+        return rows, weights
+
+    def search(self, query: str, limit: int = 5, require_all: bool = False) -> List[Dict[str, Any]]:
+        """Rank foods whose descriptions match the query
+
+        Documents containing every query term rank ahead of partial matches;
+        with ``require_all`` partial matches are not returned at all.
+        Within a tier, matches are scored by summed IDF, normalized by
+        description length, with a bonus when the description starts with the
+        first query term. The last term also matches as a prefix so partially
+        typed queries still resolve.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.loaded:
+            return []
+
+        all_rows, all_weights = [], []
+        for i, term in enumerate(terms):
+            rows, weights = self._term_postings(term, allow_prefix=(i == len(terms) - 1))
+            all_rows.append(rows)
+            all_weights.append(weights)
+
+        rows = np.concatenate(all_rows)
+        if len(rows) == 0:
+            return []
+
+        n = len(self)
+        scores = np.bincount(rows, weights=np.concatenate(all_weights), minlength=n)
+        matched_terms = np.bincount(rows, minlength=n)
+        if require_all and matched_terms.max() < len(terms):
+            return []
+
+        candidates = np.flatnonzero(matched_terms == matched_terms.max())
+        candidate_scores = scores[candidates] / (1.0 + 0.15 * self.doc_lengths[candidates])
+
+        first_term_id = self._term_ids.get(terms[0])
+        if first_term_id is not None:
+            candidate_scores = candidate_scores + (self.first_terms[candidates] == first_term_id) * 0.5
+
+        limit = max(1, min(limit, len(candidates)))
+        if len(candidates) > limit:
+            top = np.argpartition(-candidate_scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.lexsort((self.fdc_ids[candidates[top]], -candidate_scores[top]))]
+        return [self.record(int(candidates[i])) for i in top]
+
+
+# ----------------------------------------------------------------------
+# Bulk dump importers
+# ----------------------------------------------------------------------
+
+def iter_json_dump(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield normalized foods from a FoodData Central JSON download
+
+    Accepts the official downloads (a single top-level key such as
+    ``FoundationFoods``, ``SRLegacyFoods`` or ``BrandedFoods`` holding a list)
+    as well as a bare list of food objects.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if isinstance(data, dict):
+        foods = next((value for value in data.values() if isinstance(value, list)), [])
+    else:
+        foods = data
+
+    for food in foods:
+        yield parse_food(food)
+
+
+def iter_csv_dump(directory: str) -> Iterator[Dict[str, Any]]:
+    """Yield normalized foods from a FoodData Central CSV download directory
+
+    Reads ``food.csv`` and ``food_nutrient.csv``, plus ``nutrient.csv`` for
+    units and ``branded_food.csv`` for brand owners when present.
+    """
+    base = Path(directory)
+    units: Dict[int, str] = {}
+    nutrient_path = base / "nutrient.csv"
+    if nutrient_path.exists():
+        with open(nutrient_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    units[int(row["id"])] = row.get("unit_name")
+                except (KeyError, ValueError):
+                    continue
+
+    nutrients_by_food: Dict[int, Dict[str, float]] = {}
+    ranks_by_food: Dict[int, Dict[str, int]] = {}
+    with open(base / "food_nutrient.csv", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                nutrient_id = int(row["nutrient_id"])
+                spec = NUTRIENTS_BY_ID.get(nutrient_id)
+                if not spec or not row.get("amount"):
+                    continue
+                fdc_id = int(row["fdc_id"])
+                ranks = ranks_by_food.setdefault(fdc_id, {})
+                if ranks.get(spec.column, len(NUTRIENT_SPECS)) <= spec.rank:
+                    continue
+                value = convert_unit(row["amount"], units.get(nutrient_id), spec.unit)
+                if value is None:
+                    continue
+                nutrients_by_food.setdefault(fdc_id, {})[spec.column] = round(value, 2)
+                ranks[spec.column] = spec.rank
+            except (KeyError, ValueError):
+                continue
+
+    brands: Dict[int, str] = {}
+    branded_path = base / "branded_food.csv"
+    if branded_path.exists():
+        with open(branded_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row.get("brand_owner"):
+                    brands[int(row["fdc_id"])] = row["brand_owner"]
+
+    with open(base / "food.csv", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            fdc_id = int(row["fdc_id"])
+            yield {
+                "fdc_id": fdc_id,
+                "description": row.get("description"),
+                "brand_name": brands.get(fdc_id),
+                "nutrients": nutrients_by_food.get(fdc_id, {}),
+            }
+
+
+def import_dump(source: str) -> FoodDataIndex:
+    """Build an index from a JSON file or CSV directory"""
+    foods = iter_csv_dump(source) if os.path.isdir(source) else iter_json_dump(source)
+    return FoodDataIndex.build(food for food in foods if food.get("fdc_id") is not None)
+
+
+# Global local food index (populated on startup when FDC_INDEX_PATH is set)
+food_index = FoodDataIndex()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    index = import_dump(sys.argv[1])
+    index.save(sys.argv[2])
+    print(f"Indexed {len(index)} foods with {len(index.vocabulary)} terms -> {sys.argv[2]}")
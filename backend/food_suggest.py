@@ -0,0 +1,402 @@
+"""
+In-memory autocomplete for food descriptions.
+
+Suggestions come from two sorted-array segments: a base segment built once
+from the offline FDC index, and a small delta segment over the foods in
+``db.nutrition`` that the dump doesn't have. The delta is rebuilt as the
+nutrition cache grows. Foods sharing a normalized description collapse into
+one phrase.
+
+A segment packs its normalized phrases into one byte buffer. For every phrase
+it keeps an entry per word start (the first MAX_WORD_STARTS words), so "brown
+ri" finds "brown rice, cooked" and "rice" finds "rice, brown, cooked" via its
+first word and "brown" via its second. Entries are sorted by the suffix text.
+A prefix therefore maps to one contiguous entry range found by binary search,
+and the best-scoring phrases in that range are picked with ``argpartition``.
+A multi-word query also matches phrases that contain its earlier words as
+whole words, in any order, and a word starting with its last one: "brown ri"
+finds "rice, brown, cooked" by scanning the best-scoring entries for "brown". Results for one- and two-character prefixes, and for any
+prefix that spans a large range, are precomputed or memoized until
+popularity next changes. That keeps lookups in the tens of microseconds.
+
+Popularity is the number of times a food was picked (detail lookups, top
+search results). Hits are counted in memory and flushed to
+``db.nutrition.search_hits`` with ``$inc``. Each refresh reads back only the
+documents cached or hit since the previous one, so every worker converges
+on the same ranking.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from food_index import FoodDataIndex, tokenize
+
+# Word starts indexed per phrase; later words are not matched
+MAX_WORD_STARTS = 4
+MAX_SUGGESTIONS = 20
+# Prefix ranges longer than this are memoized after their first lookup
+LARGE_RANGE = 2048
+# Score bonuses: the prefix matches the start of the phrase; the food came from a real search
+PHRASE_START_BONUS = 1.0
+CACHED_FOOD_BONUS = 0.5
+LENGTH_PENALTY = 0.05  # per word, so generic foods beat long branded descriptions
+
+
+def normalize_phrase(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+def hit_arrays(hits: Dict[int, float]) -> Tuple[np.ndarray, np.ndarray]:
+    return (np.fromiter(hits.keys(), dtype=np.int64, count=len(hits)),
+            np.fromiter(hits.values(), dtype=np.float32, count=len(hits)))
+
+
+class SuggestSegment:
+    """Immutable sorted-array prefix index over (fdc_id, description) pairs"""
+
+    def __init__(self, foods: Iterable[Tuple[int, str]], bonus: float = 0.0):
+        phrase_ids: Dict[str, int] = {}
+        displays: List[bytes] = []
+        food_ids: List[int] = []
+        food_phrases: List[int] = []
+        for fdc_id, description in foods:
+            phrase = normalize_phrase(description)
+            if not phrase:
+                continue
+            phrase_id = phrase_ids.setdefault(phrase, len(phrase_ids))
+            if phrase_id == len(displays):
+                displays.append(description.strip().encode("utf-8"))
+            food_ids.append(int(fdc_id))
+            food_phrases.append(phrase_id)
+
+        phrases = [phrase.encode("ascii") for phrase in phrase_ids]
+        self._text, self._offsets = FoodDataIndex._pack_strings(phrases)
+        self._display, self._display_offsets = FoodDataIndex._pack_strings(displays)
+
+        starts: List[int] = []
+        owners: List[int] = []
+        static: List[float] = []
+        for phrase_id, phrase in enumerate(phrases):
+            base = int(self._offsets[phrase_id])
+            word_starts = [0] + [i + 1 for i, char in enumerate(phrase) if char == 0x20]
+            penalty = LENGTH_PENALTY * len(word_starts)
+            for position, start in enumerate(word_starts[:MAX_WORD_STARTS]):
+                starts.append(base + start)
+                owners.append(phrase_id)
+                static.append(bonus - penalty + (PHRASE_START_BONUS if position == 0 else 0.0))
+
+        text = self._text
+        ends = self._offsets[1:]
+        order = sorted(range(len(starts)), key=lambda i: text[starts[i]:ends[owners[i]]])
+        self.entry_starts = np.asarray(starts, dtype=np.int64)[order]
+        self.entry_phrases = np.asarray(owners, dtype=np.int32)[order]
+        self.entry_ends = self._offsets[1:][self.entry_phrases] if len(order) else np.zeros(0, dtype=np.int64)
+        self._entry_static = np.asarray(static, dtype=np.float32)[order]
+
+        food_order = np.argsort(np.asarray(food_ids, dtype=np.int64), kind="stable")
+        self.food_ids = np.asarray(food_ids, dtype=np.int64)[food_order]
+        self.food_phrases = np.asarray(food_phrases, dtype=np.int32)[food_order]
+        self.food_hits = np.zeros(len(self.food_ids), dtype=np.float32)
+        self._rescore()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def phrase(self, phrase_id: int) -> str:
+        return self._text[self._offsets[phrase_id]:self._offsets[phrase_id + 1]].decode("ascii")
+
+    def display(self, phrase_id: int) -> str:
+        return self._display[self._display_offsets[phrase_id]:self._display_offsets[phrase_id + 1]].decode("utf-8")
+
+    def contains(self, fdc_ids: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self.food_ids, fdc_ids)
+        positions = np.minimum(positions, max(len(self.food_ids) - 1, 0))
+        return (self.food_ids[positions] == fdc_ids) if len(self.food_ids) else np.zeros(len(fdc_ids), dtype=bool)
+
+    def set_hits(self, fdc_ids: np.ndarray, hits: np.ndarray) -> bool:
+        """Set absolute hit counts for foods in this segment; True if any changed"""
+        known = self.contains(fdc_ids)
+        if not known.any():
+            return False
+        positions = np.searchsorted(self.food_ids, fdc_ids[known])
+        self.food_hits[positions] = hits[known]
+        self._rescore()
+        return True
+
+    def _rescore(self):
+        """Recompute entry scores and the prefix result caches after popularity changes"""
+        self.phrase_hits = np.bincount(self.food_phrases, weights=self.food_hits, minlength=len(self))
+        self.entry_scores = (np.log1p(self.phrase_hits)[self.entry_phrases] + self._entry_static).astype(np.float32)
+        # Most-picked food per phrase: sort by (phrase, -hits) and take each phrase's first row
+        order = np.lexsort((-self.food_hits, self.food_phrases))
+        phrases, first = np.unique(self.food_phrases[order], return_index=True)
+        self.phrase_top_food = np.zeros(len(self), dtype=np.int64)
+        self.phrase_top_food[phrases] = self.food_ids[order[first]]
+
+        # Every one- and two-character prefix spans a contiguous run of sorted entries
+        memo: Dict[bytes, List[Tuple[float, int]]] = {}
+        text = np.frombuffer(self._text, dtype=np.uint8)
+        if len(self.entry_starts):
+            first_bytes = text[self.entry_starts].astype(np.int32)
+            has_second = self.entry_starts + 1 < self.entry_ends
+            second_bytes = np.where(has_second, text[np.minimum(self.entry_starts + 1, len(text) - 1)], 0)
+            for width, codes in ((1, first_bytes), (2, first_bytes * 256 + second_bytes)):
+                bounds = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1, [len(codes)])).tolist()
+                for lo, hi in zip(bounds[:-1], bounds[1:]):
+                    if width == 2 and not has_second[lo]:
+                        continue
+                    memo[self._suffix(lo, width)] = self._best(lo, hi, MAX_SUGGESTIONS)
+        self._memo = memo
+
+    def _suffix(self, entry: int, length: int) -> bytes:
+        start = self.entry_starts[entry]
+        return self._text[start:min(start + length, self.entry_ends[entry])]
+
+    def _range(self, prefix: bytes) -> Tuple[int, int]:
+        """Entries whose suffix starts with prefix, as a [lo, hi) slice"""
+        length = len(prefix)
+        lo, hi = 0, len(self.entry_starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._suffix(mid, length) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        start, hi = lo, len(self.entry_starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._suffix(mid, length) == prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+
+    def _best(self, lo: int, hi: int, limit: int) -> List[Tuple[float, int]]:
+        """Top (score, phrase_id) pairs in an entry range, one per phrase"""
+        scores = self.entry_scores[lo:hi]
+        # A phrase has at most MAX_WORD_STARTS entries in any range
+        take = min(len(scores), limit * MAX_WORD_STARTS)
+        top = np.argpartition(-scores, take - 1)[:take] if len(scores) > take else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        best, seen = [], set()
+        for i in top.tolist():
+            phrase_id = int(self.entry_phrases[lo + i])
+            if phrase_id not in seen:
+                seen.add(phrase_id)
+                best.append((float(scores[i]), phrase_id))
+                if len(best) == limit:
+                    break
+        return best
+
+    def lookup_words(self, words: List[bytes], limit: int) -> List[Tuple[float, int]]:
+        """Top phrases containing every word but the last as a whole word and a word starting with the last"""
+        *whole, last = words
+        anchor = max(whole, key=len)
+        lo, hi = self._range(anchor)
+        scores = self.entry_scores[lo:hi]
+        take = min(len(scores), LARGE_RANGE)
+        top = np.argpartition(-scores, take - 1)[:take] if len(scores) > take else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        wanted = {word.decode("ascii") for word in whole}
+        last = last.decode("ascii")
+        best, seen = [], set()
+        for i in top.tolist():
+            phrase_id = int(self.entry_phrases[lo + i])
+            if phrase_id in seen:
+                continue
+            seen.add(phrase_id)
+            phrase_words = self.phrase(phrase_id).split()
+            remaining = list(phrase_words)
+            for word in wanted:
+                if word in remaining:
+                    remaining.remove(word)
+            if len(remaining) != len(phrase_words) - len(wanted):
+                continue
+            if any(word.startswith(last) for word in remaining):
+                best.append((float(scores[i]), phrase_id))
+                if len(best) == limit:
+                    break
+        return best
+
+    def lookup(self, prefix: bytes, limit: int) -> List[Tuple[float, int]]:
+        memoized = self._memo.get(prefix)
+        if memoized is not None and len(memoized) >= min(limit, MAX_SUGGESTIONS):
+            return memoized[:limit]
+        lo, hi = self._range(prefix)
+        if hi - lo <= LARGE_RANGE:
+            return self._best(lo, hi, limit)
+        self._memo[prefix] = self._best(lo, hi, MAX_SUGGESTIONS)
+        return self._memo[prefix][:limit]
+
+
+class FoodSuggester:
+    """Popularity-ranked food autocomplete over the FDC index and db.nutrition"""
+
+    def __init__(self, db, food_index: FoodDataIndex, refresh_seconds: float = 60.0, max_cached_foods: int = 100000):
+        self.db = db
+        self.food_index = food_index
+        self.refresh_seconds = refresh_seconds
+        self.max_cached_foods = max_cached_foods
+        self.base: Optional[SuggestSegment] = None
+        self.delta: Optional[SuggestSegment] = None
+        self._delta_foods: Dict[int, str] = {}
+        self._hits: Dict[int, float] = {}
+        self._pending: Counter = Counter()
+        self._watermark = ""
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        self.stats = {"lookups": 0, "lookup_seconds": 0.0, "refreshes": 0, "refresh_errors": 0, "hits_recorded": 0}
+
+    async def ensure_indexes(self):
+        # Each refresh reads the documents cached or hit since its watermark
+        await self.db.nutrition.create_index("cached_at")
+        await self.db.nutrition.create_index("hits_updated_at", sparse=True)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_hits()
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                logging.error(f"Food suggest refresh failed: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def record_hits(self, fdc_ids: Iterable[Optional[str]]):
+        """Count foods the user picked; they rank higher after the next refresh"""
+        for fdc_id in fdc_ids:
+            if fdc_id and str(fdc_id).isdigit():
+                self._pending[int(fdc_id)] += 1
+                self.stats["hits_recorded"] += 1
+
+    async def flush_hits(self):
+        """Persist pending hit counts; on failure they are kept for the next flush"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, Counter()
+        now = datetime.now(timezone.utc).isoformat()
+        try:
+            await self.db.nutrition.bulk_write([
+                UpdateOne({"fdc_id": str(fdc_id)}, {"$inc": {"search_hits": count}, "$set": {"hits_updated_at": now}})
+                for fdc_id, count in pending.items()
+            ], ordered=False)
+        except Exception as e:
+            logging.error(f"Food suggest hit flush failed, keeping {len(pending)} counters: {e}")
+            self._pending.update(pending)
+
+    async def refresh(self):
+        """Flush hits, then fold in foods cached or hit since the last refresh"""
+        async with self._refresh_lock:
+            if self.base is None and self.food_index.loaded:
+                index = self.food_index
+                base = await asyncio.to_thread(
+                    SuggestSegment, ((int(index.fdc_ids[row]), index.description(row)) for row in range(len(index)))
+                )
+                if self._hits:
+                    fdc_ids, hits = hit_arrays(self._hits)
+                    await asyncio.to_thread(base.set_hits, fdc_ids, hits)
+                self.base = base
+                logging.info(f"Food suggest base index: {len(self.base)} phrases from {len(index)} foods")
+
+            await self.flush_hits()
+            watermark = self._watermark
+            docs = await self.db.nutrition.find(
+                {"$or": [{"cached_at": {"$gt": watermark}}, {"hits_updated_at": {"$gt": watermark}}]},
+                {"_id": 0, "fdc_id": 1, "description": 1, "food_name": 1, "search_hits": 1, "cached_at": 1, "hits_updated_at": 1}
+            ).to_list(self.max_cached_foods)
+
+            delta_changed = False
+            changed_hits: Dict[int, float] = {}
+            for doc in docs:
+                for field in ("cached_at", "hits_updated_at"):
+                    if isinstance(doc.get(field), str) and doc[field] > self._watermark:
+                        self._watermark = doc[field]
+                fdc_id = str(doc.get("fdc_id") or "")
+                if not fdc_id.isdigit():
+                    continue
+                fdc_id = int(fdc_id)
+                description = doc.get("description") or doc.get("food_name")
+                in_base = self.base is not None and bool(self.base.contains(np.array([fdc_id]))[0])
+                if description and not in_base and self._delta_foods.get(fdc_id) != description:
+                    self._delta_foods[fdc_id] = description
+                    delta_changed = True
+                hits = float(doc.get("search_hits") or 0)
+                if self._hits.get(fdc_id, 0.0) != hits:
+                    self._hits[fdc_id] = changed_hits[fdc_id] = hits
+
+            # Builds and rescoring run off the event loop; lookups meanwhile see the previous ranking
+            if delta_changed:
+                delta = await asyncio.to_thread(SuggestSegment, list(self._delta_foods.items()), CACHED_FOOD_BONUS)
+                fdc_ids, hits = hit_arrays(self._hits)
+                await asyncio.to_thread(delta.set_hits, fdc_ids, hits)
+                self.delta = delta
+            if changed_hits:
+                fdc_ids, hits = hit_arrays(changed_hits)
+                for segment in (self.base, None if delta_changed else self.delta):
+                    if segment is not None:
+                        await asyncio.to_thread(segment.set_hits, fdc_ids, hits)
+            self.stats["refreshes"] += 1
+
+    def suggest(self, query: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """Top phrases matching the query at word boundaries, most popular first"""
+        started = time.perf_counter()
+        prefix = normalize_phrase(query).encode("ascii")
+        words = prefix.split()
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        candidates = []
+        if prefix:
+            for segment in (self.base, self.delta):
+                if segment is not None:
+                    candidates.extend((score, segment, phrase_id) for score, phrase_id in segment.lookup(prefix, limit))
+                    if len(words) > 1:
+                        candidates.extend((score, segment, phrase_id) for score, phrase_id in segment.lookup_words(words, limit))
+        candidates.sort(key=lambda candidate: -candidate[0])
+
+        suggestions, seen = [], set()
+        for score, segment, phrase_id in candidates:
+            phrase = segment.phrase(phrase_id)
+            if phrase in seen:
+                continue
+            seen.add(phrase)
+            suggestions.append({
+                "text": segment.display(phrase_id),
+                "fdc_id": str(int(segment.phrase_top_food[phrase_id])),
+                "popularity": int(segment.phrase_hits[phrase_id]),
+            })
+            if len(suggestions) == limit:
+                break
+        self.stats["lookups"] += 1
+        self.stats["lookup_seconds"] += time.perf_counter() - started
+        return suggestions
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["lookups"]
+        return {
+            "base_phrases": len(self.base) if self.base else 0,
+            "delta_phrases": len(self.delta) if self.delta else 0,
+            "pending_hits": sum(self._pending.values()),
+            "avg_lookup_ms": round(self.stats["lookup_seconds"] / lookups * 1000, 4) if lookups else 0.0,
+            "refreshes": self.stats["refreshes"],
+            "refresh_errors": self.stats["refresh_errors"],
+            "hits_recorded": self.stats["hits_recorded"],
+            "lookups": lookups,
+        }
@@ -0,0 +1,252 @@
+"""
+Process-wide LLM gateway.
+
+Endpoints ask the gateway for a completion with a per-call system prompt and
+session id instead of constructing an LLM client per request. The gateway
+keeps one client per (provider, model), created on first use and closed at
+shutdown, so connection pools stay warm across chat turns.
+
+The backend is chosen with LLM_BACKEND:
+- ``emergent`` (default): the emergentintegrations SDK with EMERGENT_LLM_KEY
+- ``openai``: any OpenAI-compatible /chat/completions API at LLM_API_BASE,
+  using LLM_API_KEY, over a pooled keep-alive httpx client
+- ``fake``: a seeded local stand-in with configurable latency, token rate and
+  error injection for offline load tests (see fake_llm)
+
+Callers may pass a JSON schema for structured output. The OpenAI-compatible
+backend sends it as ``response_format``; the emergent SDK has no such option,
+so the schema is appended to the prompt and the caller validates the reply.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from fake_llm import FakeLLMClient
+from llm_scheduler import llm_scheduler
+from llm_usage import llm_usage
+from resilience import upstream_policies
+
+DEFAULT_PROVIDER = "openai"
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+def schema_instructions(json_schema: Dict[str, Any]) -> str:
+    return (
+        "\n\nRespond with only a JSON object (no markdown, no commentary) that matches this JSON schema:\n"
+        + json.dumps(json_schema)
+    )
+
+
+class EmergentClient:
+    """emergentintegrations backend
+
+    The SDK binds the system message and session to the LlmChat object, so a
+    lightweight LlmChat is built per call; the key and model config are shared.
+    """
+
+    def __init__(self, provider: str, model: str):
+        # Imported here so the other backends don't require the SDK
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+        self.chat_class = LlmChat
+        self.message_class = UserMessage
+        self.provider = provider
+        self.model = model
+        self.api_key = os.environ.get('EMERGENT_LLM_KEY')
+
+    def _chat(self, system_message: str, session_id: str):
+        return self.chat_class(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+
+    async def complete(self, system_message: str, text: str, session_id: str, json_schema: Optional[Dict] = None) -> str:
+        if json_schema:
+            text += schema_instructions(json_schema)
+        return await self._chat(system_message, session_id).send_message(self.message_class(text=text))
+
+    async def stream(self, system_message: str, text: str, session_id: str) -> AsyncIterator[str]:
+        chat = self._chat(system_message, session_id)
+        user_message = self.message_class(text=text)
+        stream_message = getattr(chat, "stream_message", None)
+        if stream_message is None:
+            # No streaming API in this SDK version: emit the whole completion as one chunk
+            yield await chat.send_message(user_message)
+            return
+        async for chunk in stream_message(user_message):
+            if chunk:
+                yield chunk
+
+    async def close(self):
+        pass
+
+
+class OpenAICompatibleClient:
+    """OpenAI-compatible /chat/completions backend over a pooled httpx client"""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        max_connections = int(os.environ.get('LLM_MAX_CONNECTIONS', 20))
+        self.http = httpx.AsyncClient(
+            base_url=os.environ.get('LLM_API_BASE', 'https://api.openai.com/v1'),
+            headers={"Authorization": f"Bearer {os.environ.get('LLM_API_KEY', '')}"},
+            timeout=upstream_policies['llm'].http_timeout(),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def _payload(self, system_message: str, text: str, session_id: str, stream: bool, json_schema: Optional[Dict] = None) -> Dict:
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": text})
+        payload = {"model": self.model, "messages": messages, "user": session_id, "stream": stream}
+        if json_schema:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": json_schema, "strict": True},
+            }
+        return payload
+
+    async def complete(self, system_message: str, text: str, session_id: str, json_schema: Optional[Dict] = None) -> str:
+        payload = self._payload(system_message, text, session_id, False, json_schema)
+        response = await self.http.post("/chat/completions", json=payload)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+    async def stream(self, system_message: str, text: str, session_id: str) -> AsyncIterator[str]:
+        payload = self._payload(system_message, text, session_id, True)
+        async with self.http.stream("POST", "/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                chunk = choices[0].get("delta", {}).get("content") if choices else None
+                if chunk:
+                    yield chunk
+
+    async def close(self):
+        await self.http.aclose()
+
+
+LLM_BACKENDS = {
+    "emergent": EmergentClient,
+    "openai": OpenAICompatibleClient,
+    "fake": FakeLLMClient,
+}
+
+
+class LLMGateway:
+    """Holds one LLM client per (provider, model) for the life of the process"""
+
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = backend or os.environ.get('LLM_BACKEND', 'emergent')
+        if self.backend not in LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend '{self.backend}'; expected one of {sorted(LLM_BACKENDS)}")
+        self.clients: Dict[Tuple[str, str], object] = {}
+
+    async def start(self):
+        # Warm the default model so the first request doesn't pay for client setup
+        self.client()
+        logging.info(f"LLM gateway started with '{self.backend}' backend")
+
+    async def close(self):
+        for client in self.clients.values():
+            try:
+                await client.close()
+            except Exception as e:
+                logging.error(f"Error closing LLM client: {e}")
+        self.clients.clear()
+
+    def client(self, provider: str = DEFAULT_PROVIDER, model: str = DEFAULT_MODEL):
+        key = (provider, model)
+        if key not in self.clients:
+            self.clients[key] = LLM_BACKENDS[self.backend](provider, model)
+        return self.clients[key]
+
+    async def complete(
+        self,
+        text: str,
+        system_message: str = "",
+        session_id: str = "",
+        provider: str = DEFAULT_PROVIDER,
+        model: str = DEFAULT_MODEL,
+        tenant_id: str = "default",
+        tier: Optional[str] = None,
+        queue_deadline: Optional[float] = None,
+        json_schema: Optional[Dict[str, Any]] = None,
+        endpoint: str = "other",
+    ) -> str:
+        """Single completion, admitted by the scheduler and run under the LLM upstream policy
+
+        With ``json_schema`` the model is asked for JSON matching the schema.
+        Usage is recorded against ``tenant_id`` and ``endpoint``.
+        """
+        client = self.client(provider, model)
+        async with llm_scheduler.slot(tenant_id, tier, queue_deadline):
+            started = time.monotonic()
+            reply = ""
+            succeeded = False
+            try:
+                # Sessions may keep history, so a retry could duplicate the turn: deadline + breaker only
+                reply = await upstream_policies['llm'].call(
+                    lambda: client.complete(system_message, text, session_id, json_schema),
+                    idempotent=False
+                )
+                succeeded = True
+                return reply
+            finally:
+                llm_usage.record_text(
+                    tenant_id, endpoint, model, system_message + text, reply,
+                    time.monotonic() - started, error=not succeeded
+                )
+
+    def stream(
+        self,
+        text: str,
+        system_message: str = "",
+        session_id: str = "",
+        provider: str = DEFAULT_PROVIDER,
+        model: str = DEFAULT_MODEL,
+        tenant_id: str = "default",
+        endpoint: str = "other",
+    ) -> AsyncIterator[str]:
+        """Token stream; callers hold a scheduler ticket and relay it via llm_streaming"""
+        return self._metered_stream(
+            self.client(provider, model).stream(system_message, text, session_id),
+            tenant_id, endpoint, model, system_message + text
+        )
+
+    async def _metered_stream(self, tokens: AsyncIterator[str], tenant_id: str, endpoint: str, model: str, prompt: str):
+        """Pass tokens through, recording usage when the stream ends, fails or is abandoned"""
+        started = time.monotonic()
+        chunks = []
+        completed = False
+        try:
+            async for chunk in tokens:
+                chunks.append(chunk)
+                yield chunk
+            completed = True
+        finally:
+            llm_usage.record_text(
+                tenant_id, endpoint, model, prompt, "".join(chunks),
+                time.monotonic() - started, error=not completed
+            )
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "clients": [f"{provider}/{model}" for provider, model in self.clients],
+        }
+
+
+# Global LLM gateway instance
+llm_gateway = LLMGateway()
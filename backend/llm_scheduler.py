@@ -0,0 +1,223 @@
+"""
+Admission control for LLM calls.
+
+Every LLM request takes a slot from the scheduler before it reaches the
+provider. Slots are limited globally and per tenant; requests that can't run
+yet wait in a bounded priority queue where premium tenants are served before
+basic ones (FIFO within a tier) and background work comes last.
+
+Requests are shed with LLMOverloadedError (served as 429 + Retry-After) when:
+- the queue is full and nothing lower-priority can be displaced
+- the expected wait already exceeds the request's deadline
+- the deadline passes while still queued
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+TIER_PRIORITY = {"premium": 0, "basic": 1, "background": 2}
+DEFAULT_TIER = "basic"
+
+
+class LLMOverloadedError(Exception):
+    """Raised when an LLM request is shed instead of queued"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"LLM capacity exceeded ({reason}); retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class LLMTicket:
+    """A granted slot; release() is idempotent"""
+
+    def __init__(self, scheduler: "LLMScheduler", tenant_id: str):
+        self.scheduler = scheduler
+        self.tenant_id = tenant_id
+        self.started_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self)
+
+
+class _Waiter:
+    __slots__ = ("tenant_id", "tier", "future", "enqueued_at", "cancelled")
+
+    def __init__(self, tenant_id: str, tier: str, future: asyncio.Future):
+        self.tenant_id = tenant_id
+        self.tier = tier
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """Global + per-tenant concurrency limits with a tiered, bounded wait queue"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        per_tenant_concurrency: int = 4,
+        max_queue: int = 200,
+        queue_timeout: float = 15.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_tenant_concurrency = per_tenant_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.running_by_tenant: Dict[str, int] = defaultdict(int)
+        self._queue: List[tuple] = []  # (priority, seq, waiter)
+        self._queued = 0
+        self._seq = itertools.count()
+        # Exponential moving average of how long a slot is held, for wait estimates
+        self.avg_service_seconds = 1.0
+        self.stats = {"admitted": 0, "queued": 0, "shed_full": 0, "shed_deadline": 0, "shed_timeout": 0, "displaced": 0}
+        self.wait_seconds_total = 0.0
+        self.wait_samples = 0
+
+    def _priority(self, tier: Optional[str]) -> int:
+        return TIER_PRIORITY.get(tier or DEFAULT_TIER, TIER_PRIORITY[DEFAULT_TIER])
+
+    def _has_capacity(self, tenant_id: str) -> bool:
+        return self.running < self.max_concurrency and self.running_by_tenant[tenant_id] < self.per_tenant_concurrency
+
+    def _grant(self, tenant_id: str) -> LLMTicket:
+        self.running += 1
+        self.running_by_tenant[tenant_id] += 1
+        self.stats["admitted"] += 1
+        return LLMTicket(self, tenant_id)
+
+    def estimated_wait(self, ahead: int) -> float:
+        """Rough seconds until a request with ``ahead`` requests in front of it starts"""
+        return (ahead + 1) / self.max_concurrency * self.avg_service_seconds
+
+    def _queued_ahead(self, priority: int) -> int:
+        return sum(1 for p, _, w in self._queue if p <= priority and not w.cancelled)
+
+    def _shed_lowest(self, priority: int) -> bool:
+        """Displace the newest waiter of a strictly lower tier to make room"""
+        candidates = [(p, seq, w) for p, seq, w in self._queue if p > priority and not w.cancelled]
+        if not candidates:
+            return False
+        _, _, victim = max(candidates, key=lambda entry: (entry[0], entry[1]))
+        victim.cancelled = True
+        self._queued -= 1
+        self.stats["displaced"] += 1
+        victim.future.set_exception(LLMOverloadedError("displaced by higher-priority requests", self.estimated_wait(self._queued)))
+        victim.future.exception()
+        return True
+
+    async def acquire(self, tenant_id: str, tier: Optional[str] = None, deadline: Optional[float] = None) -> LLMTicket:
+        """Wait for a slot; ``deadline`` is the longest acceptable queue wait in seconds"""
+        tenant_id = tenant_id or "default"
+        priority = self._priority(tier)
+        deadline = self.queue_timeout if deadline is None else deadline
+
+        if not self._queued_ahead(priority) and self._has_capacity(tenant_id):
+            return self._grant(tenant_id)
+
+        ahead = self._queued_ahead(priority)
+        expected = self.estimated_wait(ahead)
+        if expected > deadline:
+            self.stats["shed_deadline"] += 1
+            raise LLMOverloadedError("expected wait exceeds deadline", expected)
+        if self._queued >= self.max_queue and not self._shed_lowest(priority):
+            self.stats["shed_full"] += 1
+            raise LLMOverloadedError("queue full", expected)
+
+        waiter = _Waiter(tenant_id, tier or DEFAULT_TIER, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self._queued += 1
+        self.stats["queued"] += 1
+        # Waiters ahead may be blocked only by their own tenant's limit
+        self._dispatch()
+        try:
+            ticket = await asyncio.wait_for(asyncio.shield(waiter.future), timeout=deadline)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.exception():
+                # Granted just as the deadline hit: hand the slot straight back
+                waiter.future.result().release()
+            elif not waiter.cancelled:
+                waiter.cancelled = True
+                self._queued -= 1
+            self.stats["shed_timeout"] += 1
+            raise LLMOverloadedError("deadline passed while queued", self.estimated_wait(self._queued))
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.exception():
+                waiter.future.result().release()
+            elif not waiter.cancelled:
+                waiter.cancelled = True
+                self._queued -= 1
+            raise
+        self.wait_seconds_total += time.monotonic() - waiter.enqueued_at
+        self.wait_samples += 1
+        return ticket
+
+    def _release(self, ticket: LLMTicket):
+        self.running -= 1
+        self.running_by_tenant[ticket.tenant_id] -= 1
+        if not self.running_by_tenant[ticket.tenant_id]:
+            del self.running_by_tenant[ticket.tenant_id]
+        held = time.monotonic() - ticket.started_at
+        self.avg_service_seconds = 0.9 * self.avg_service_seconds + 0.1 * held
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots to the best queued waiters whose tenant is under its limit"""
+        skipped = []
+        while self._queue and self.running < self.max_concurrency:
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if waiter.cancelled:
+                continue
+            if not self._has_capacity(waiter.tenant_id):
+                skipped.append(entry)
+                continue
+            self._queued -= 1
+            waiter.future.set_result(self._grant(waiter.tenant_id))
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    @asynccontextmanager
+    async def slot(self, tenant_id: str, tier: Optional[str] = None, deadline: Optional[float] = None):
+        ticket = await self.acquire(tenant_id, tier, deadline)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        depth_by_tier: Dict[str, int] = defaultdict(int)
+        for _, _, waiter in self._queue:
+            if not waiter.cancelled:
+                depth_by_tier[waiter.tier] += 1
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "per_tenant_concurrency": self.per_tenant_concurrency,
+            "queue_depth": self._queued,
+            "queue_depth_by_tier": dict(depth_by_tier),
+            "max_queue": self.max_queue,
+            "tenants_running": len(self.running_by_tenant),
+            "avg_service_seconds": round(self.avg_service_seconds, 3),
+            "avg_queue_wait_seconds": round(self.wait_seconds_total / self.wait_samples, 3) if self.wait_samples else 0.0,
+            **self.stats,
+        }
+
+
+# Global LLM scheduler instance
+llm_scheduler = LLMScheduler(
+    max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 16)),
+    per_tenant_concurrency=int(os.environ.get('LLM_TENANT_CONCURRENCY', 4)),
+    max_queue=int(os.environ.get('LLM_MAX_QUEUE', 200)),
+    queue_timeout=float(os.environ.get('LLM_QUEUE_TIMEOUT', 15)),
+)
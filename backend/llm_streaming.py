@@ -0,0 +1,63 @@
+"""
+Server-Sent Events relay for LLM completions.
+
+Chat endpoints with a ``/stream`` variant return a text/event-stream made of:
+
+    event: token   data: {"text": "..."}      one per chunk from the provider
+    event: done    data: {...}                 the persisted result, once complete
+    event: error   data: {"detail": "..."}     if the completion fails mid-stream
+
+The final message is persisted only after the stream completes, so a client
+that disconnects early leaves no partial chat turn behind.
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from resilience import CircuitOpenError, UpstreamPolicy
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream
+}
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one SSE event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def replay_text(text: str) -> AsyncIterator[str]:
+    """Token stream for an answer that is already known (e.g. a cache hit)"""
+    yield text
+
+
+async def relay_completion(
+    token_stream: Callable[[], AsyncIterator[str]],
+    on_complete: Callable[[str], Awaitable[Dict[str, Any]]],
+    on_finish: Optional[Callable[[], None]] = None,
+    policy: Optional[UpstreamPolicy] = None,
+) -> AsyncIterator[str]:
+    """Relay tokens as SSE events, then persist via on_complete and emit 'done'
+
+    ``on_finish`` runs however the stream ends (e.g. to release a scheduler slot).
+    Provider streams pass their ``policy`` (breaker, deadline, metrics); replayed
+    text doesn't, so a cache hit neither trips nor probes the breaker.
+    """
+    parts = []
+    try:
+        chunks = policy.stream(token_stream) if policy is not None else token_stream()
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield sse_event("token", {"text": chunk})
+        result = await on_complete("".join(parts))
+        yield sse_event("done", result)
+    except CircuitOpenError as e:
+        yield sse_event("error", {"detail": f"{e.upstream} is temporarily unavailable", "retry_after": int(e.retry_after)})
+    except Exception as e:
+        logging.error(f"Streaming chat error: {e}")
+        yield sse_event("error", {"detail": "Failed to process chat message"})
+    finally:
+        if on_finish is not None:
+            on_finish()
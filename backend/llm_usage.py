@@ -0,0 +1,157 @@
+"""
+Per-tenant LLM usage accounting.
+
+The gateway reports every LLM call (completions and streams) with its tenant,
+endpoint, model, prompt/completion token counts, latency and outcome. Counters
+are aggregated in memory per (tenant, endpoint, model) and flushed in batches
+to the ``api_usage`` collection as ``$inc`` upserts, so recording a call never
+touches the database and concurrent workers add up correctly.
+
+Each api_usage document has ``service = "llm:<endpoint>:<model>"``, so
+DatabaseManager.get_api_usage(tenant_id, service) reads one counter set.
+Token counts use the local estimator from conversation_context; cost is
+estimated from MODEL_PRICES.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from conversation_context import count_tokens
+
+# USD per 1K (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+}
+DEFAULT_PRICE = MODEL_PRICES["gpt-4o-mini"]
+
+COUNTERS = ("calls_made", "errors", "prompt_tokens", "completion_tokens", "latency_ms_total", "cost_usd")
+
+
+def llm_service(endpoint: str, model: str) -> str:
+    return f"llm:{endpoint}:{model}"
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = MODEL_PRICES.get(model, DEFAULT_PRICE)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class LLMUsageMeter:
+    """Aggregates LLM call counters in memory and flushes them in batches"""
+
+    def __init__(self, flush_interval: float = 30.0, max_pending_keys: int = 5000):
+        self.flush_interval = flush_interval
+        # Flush early if this many distinct (tenant, endpoint, model) keys are pending
+        self.max_pending_keys = max_pending_keys
+        self._pending: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+        self._store: Optional[Callable[[List[Dict[str, Any]]], Awaitable[Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._early_flush: Optional[asyncio.Task] = None
+        self.stats = {"recorded": 0, "flushes": 0, "flush_errors": 0, "documents_written": 0}
+
+    def start(self, store: Callable[[List[Dict[str, Any]]], Awaitable[Any]]):
+        """Begin periodic flushing; ``store`` persists a batch of usage increments"""
+        self._store = store
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def record(
+        self,
+        tenant_id: str,
+        endpoint: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency_seconds: float,
+        error: bool = False,
+    ):
+        key = (tenant_id or "default", endpoint, model)
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = dict.fromkeys(COUNTERS, 0)
+            counters["latency_ms_max"] = 0
+        latency_ms = latency_seconds * 1000
+        counters["calls_made"] += 1
+        counters["errors"] += int(error)
+        counters["prompt_tokens"] += prompt_tokens
+        counters["completion_tokens"] += completion_tokens
+        counters["latency_ms_total"] += latency_ms
+        counters["latency_ms_max"] = max(counters["latency_ms_max"], latency_ms)
+        counters["cost_usd"] += estimate_cost(model, prompt_tokens, completion_tokens)
+        self.stats["recorded"] += 1
+        if len(self._pending) >= self.max_pending_keys and self._store and (self._early_flush is None or self._early_flush.done()):
+            self._early_flush = asyncio.get_running_loop().create_task(self.flush())
+
+    def record_text(
+        self,
+        tenant_id: str,
+        endpoint: str,
+        model: str,
+        prompt: str,
+        completion: str,
+        latency_seconds: float,
+        error: bool = False,
+    ):
+        self.record(tenant_id, endpoint, model, count_tokens(prompt), count_tokens(completion), latency_seconds, error)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Write pending counters; on failure they are merged back for the next flush"""
+        async with self._flush_lock:
+            if not self._pending or not self._store:
+                return
+            batch, self._pending = self._pending, {}
+            documents = [
+                {"tenant_id": tenant_id, "endpoint": endpoint, "model": model,
+                 "service": llm_service(endpoint, model), **counters}
+                for (tenant_id, endpoint, model), counters in batch.items()
+            ]
+            try:
+                await self._store(documents)
+                self.stats["flushes"] += 1
+                self.stats["documents_written"] += len(documents)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logging.error(f"LLM usage flush failed, keeping {len(documents)} counters for retry: {e}")
+                for key, counters in batch.items():
+                    self._merge(key, counters)
+
+    def _merge(self, key: Tuple[str, str, str], counters: Dict[str, float]):
+        current = self._pending.get(key)
+        if current is None:
+            self._pending[key] = counters
+            return
+        for name in COUNTERS:
+            current[name] += counters[name]
+        current["latency_ms_max"] = max(current["latency_ms_max"], counters["latency_ms_max"])
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Unflushed counters, in the same shape as stored documents"""
+        return [
+            {"tenant_id": tenant_id, "endpoint": endpoint, "model": model, **counters}
+            for (tenant_id, endpoint, model), counters in self._pending.items()
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "pending_keys": len(self._pending), "flush_interval": self.flush_interval}
+
+
+# Global LLM usage meter
+llm_usage = LLMUsageMeter(flush_interval=float(os.environ.get('LLM_USAGE_FLUSH_SECONDS', 30)))
@@ -0,0 +1,303 @@
+"""
+Local carb-constrained meal optimizer.
+
+Builds meals of one protein, one carbohydrate source and one vegetable from
+foods we already hold locally: the cached ``db.nutrition`` documents plus the
+best candidates per role from the offline FDC index. No LLM call is involved.
+
+For every allowed (protein, carb, vegetable) triple the portions that hit the
+net-carb, fiber and calorie targets solve a 3x3 linear system. All triples
+are solved at once as a batched (ridge-regularized) least-squares problem, clipped to sensible
+portion bounds and rounded to 5 g. The results are then scored on how close
+they come to the targets: net carbs and calories both ways, fiber only when
+short. Alternatives never reuse a food from a better-ranked meal.
+
+Foods matching the profile's allergies (expanded through ALLERGEN_TERMS) or
+dislikes are excluded. Results are deterministic and take a few
+milliseconds. They can be returned directly or passed to the LLM as
+grounded options via describe_meal.
+"""
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from food_index import FoodDataIndex, tokenize
+from usda_nutrients import NUTRIENT_COLUMNS
+
+ROLES = ("protein", "carb", "vegetable")
+
+# Portion bounds in grams per role
+PORTION_BOUNDS = {"protein": (60.0, 250.0), "carb": (20.0, 250.0), "vegetable": (50.0, 300.0)}
+
+# Candidates per role taken from the FDC index, and per role per request
+INDEX_CANDIDATES_PER_ROLE = 400
+REQUEST_CANDIDATES_PER_ROLE = 20
+
+DEFAULT_MEAL_TARGETS = {"net_carbs": 45.0, "fiber": 8.0, "calories": 500.0}
+
+# Allergy names expanded to the ingredient words that signal them
+ALLERGEN_TERMS = {
+    "nuts": ["nut", "almond", "walnut", "pecan", "cashew", "pistachio", "hazelnut", "macadamia", "peanut"],
+    "tree nuts": ["almond", "walnut", "pecan", "cashew", "pistachio", "hazelnut", "macadamia"],
+    "peanuts": ["peanut"],
+    "dairy": ["milk", "cheese", "yogurt", "butter", "cream", "whey", "casein"],
+    "lactose": ["milk", "cheese", "yogurt", "cream"],
+    "gluten": ["wheat", "bread", "pasta", "barley", "rye", "couscous", "bulgur", "seitan"],
+    "wheat": ["wheat", "bread", "pasta", "couscous", "bulgur"],
+    "shellfish": ["shrimp", "crab", "lobster", "prawn", "scallop", "clam", "mussel", "oyster"],
+    "fish": ["fish", "salmon", "tuna", "cod", "tilapia", "trout", "sardine", "halibut", "mackerel"],
+    "eggs": ["egg"],
+    "soy": ["soy", "tofu", "tempeh", "edamame", "soybean"],
+    "sesame": ["sesame", "tahini"],
+}
+
+CALORIES, CARBS, SUGARS, FIBER, PROTEIN, FAT, SODIUM = (NUTRIENT_COLUMNS.index(c) for c in (
+    "calories", "carbohydrates", "sugars", "fiber", "protein", "fat", "sodium"
+))
+
+
+def _singular(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def exclusion_terms(allergies: Sequence[str], dislikes: Sequence[str]) -> List[List[str]]:
+    """Token sequences that exclude a food when they appear in its description"""
+    terms = []
+    for allergy in allergies or []:
+        key = allergy.strip().lower()
+        for term in ALLERGEN_TERMS.get(key, [key]):
+            terms.append(term)
+    terms.extend(d.strip().lower() for d in dislikes or [])
+    return [[_singular(t) for t in tokenize(term)] for term in terms if tokenize(term)]
+
+
+def role_masks(nutrients: np.ndarray) -> Dict[str, np.ndarray]:
+    """Which foods can fill each role, from per-100g nutrients"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        calories = nutrients[:, CALORIES]
+        net = nutrients[:, CARBS] - np.nan_to_num(nutrients[:, FIBER])
+        protein_share = nutrients[:, PROTEIN] * 4 / calories
+        complete = ~np.isnan(nutrients[:, [CALORIES, CARBS, PROTEIN]]).any(axis=1) & (calories > 0)
+        return {
+            "protein": complete & (protein_share >= 0.4) & (calories >= 60) & (net <= 10),
+            "carb": complete & (net >= 12) & (net <= 80) & (np.nan_to_num(nutrients[:, FIBER]) >= 1.5),
+            "vegetable": complete & (calories <= 60) & (net <= 8) & (np.nan_to_num(nutrients[:, FIBER]) >= 1),
+        }
+
+
+def role_quality(nutrients: np.ndarray) -> Dict[str, np.ndarray]:
+    """Diabetes-friendliness within each role (higher is better)"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        calories = np.maximum(nutrients[:, CALORIES], 1)
+        fiber = np.nan_to_num(nutrients[:, FIBER])
+        sugars = np.nan_to_num(nutrients[:, SUGARS])
+        sodium = np.nan_to_num(nutrients[:, SODIUM])
+        net = np.maximum(nutrients[:, CARBS] - fiber, 1)
+        return {
+            "protein": nutrients[:, PROTEIN] * 4 / calories - sodium / 2000,
+            "carb": fiber / net - 0.5 * sugars / net,
+            "vegetable": fiber - 0.2 * sugars - sodium / 500,
+        }
+
+
+def describe_meal(meal: Dict[str, Any]) -> str:
+    """One-line summary, e.g. for grounding an LLM prompt"""
+    items = " + ".join(f"{item['description']} {item['grams']:.0f} g" for item in meal["items"])
+    totals = meal["totals"]
+    return (f"{items} (about {totals['net_carbs']:.0f} g net carbs, {totals['fiber']:.0f} g fiber, "
+            f"{totals['calories']:.0f} kcal)")
+
+
+class MealOptimizer:
+    """Vectorized portion optimizer over locally cached foods"""
+
+    def __init__(self, db, food_index: FoodDataIndex, refresh_seconds: float = 600, max_cached_foods: int = 20000):
+        self.db = db
+        self.food_index = food_index
+        self.refresh_seconds = refresh_seconds
+        self.max_cached_foods = max_cached_foods
+        self._loaded_at = 0.0
+        self._empty()
+        self.stats = {"optimizations": 0, "pool_refreshes": 0, "no_solution": 0}
+
+    def _empty(self):
+        self.fdc_ids: List[Optional[str]] = []
+        self.descriptions: List[str] = []
+        self.token_rows: Dict[str, np.ndarray] = {}
+        self.nutrients = np.zeros((0, len(NUTRIENT_COLUMNS)), dtype=np.float64)
+        self.roles = {role: np.zeros(0, dtype=bool) for role in ROLES}
+        self.quality = {role: np.zeros(0) for role in ROLES}
+
+    def build_pool(self, foods: Iterable[Dict[str, Any]]):
+        """Index foods (FoodNutrition-shaped dicts, per 100 g) for optimization"""
+        seen = set()
+        fdc_ids, descriptions, rows = [], [], []
+        for food in foods:
+            key = food.get("fdc_id") or food.get("description")
+            description = food.get("description") or food.get("food_name")
+            if not description or key in seen:
+                continue
+            seen.add(key)
+            fdc_ids.append(food.get("fdc_id"))
+            descriptions.append(description)
+            rows.append([np.nan if food.get(c) is None else float(food[c]) for c in NUTRIENT_COLUMNS])
+        self.fdc_ids = fdc_ids
+        self.descriptions = descriptions
+        token_rows: Dict[str, List[int]] = {}
+        for row, description in enumerate(descriptions):
+            for token in {_singular(t) for t in tokenize(description)}:
+                token_rows.setdefault(token, []).append(row)
+        self.token_rows = {token: np.asarray(rows_, dtype=np.int64) for token, rows_ in token_rows.items()}
+        self.nutrients = np.asarray(rows, dtype=np.float64).reshape(-1, len(NUTRIENT_COLUMNS))
+        self.roles = role_masks(self.nutrients)
+        self.quality = role_quality(self.nutrients)
+
+    def _index_candidates(self) -> List[Dict[str, Any]]:
+        """Best-quality foods per role from the offline FDC index"""
+        if not self.food_index.loaded:
+            return []
+        nutrients = self.food_index.nutrients.astype(np.float64)
+        masks, quality = role_masks(nutrients), role_quality(nutrients)
+        rows = set()
+        for role in ROLES:
+            candidates = np.flatnonzero(masks[role])
+            if len(candidates) > INDEX_CANDIDATES_PER_ROLE:
+                top = np.argpartition(-quality[role][candidates], INDEX_CANDIDATES_PER_ROLE - 1)[:INDEX_CANDIDATES_PER_ROLE]
+                candidates = candidates[top]
+            rows.update(int(row) for row in candidates)
+        return [self.food_index.record(row) for row in sorted(rows)]
+
+    async def refresh(self, force: bool = False):
+        """Rebuild the pool from db.nutrition and the FDC index when stale"""
+        if not force and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        self._loaded_at = time.monotonic()
+        projection = {"_id": 0, "fdc_id": 1, "description": 1, "food_name": 1, **{c: 1 for c in NUTRIENT_COLUMNS}}
+        cached = await self.db.nutrition.find({"carbohydrates": {"$ne": None}}, projection).to_list(self.max_cached_foods)
+        self.build_pool(cached + self._index_candidates())
+        self.stats["pool_refreshes"] += 1
+        logging.info(f"Meal optimizer pool: {len(self.descriptions)} foods "
+                     f"({', '.join(f'{r}: {int(self.roles[r].sum())}' for r in ROLES)})")
+
+    def _allowed(self, excluded: List[List[str]]) -> np.ndarray:
+        allowed = np.ones(len(self.descriptions), dtype=bool)
+        empty = np.zeros(0, dtype=np.int64)
+        for term in excluded:
+            rows = self.token_rows.get(term[0], empty)
+            for token in term[1:]:
+                rows = np.intersect1d(rows, self.token_rows.get(token, empty), assume_unique=True)
+            allowed[rows] = False
+        return allowed
+
+    def optimize(
+        self,
+        net_carbs: float = DEFAULT_MEAL_TARGETS["net_carbs"],
+        fiber: float = DEFAULT_MEAL_TARGETS["fiber"],
+        calories: float = DEFAULT_MEAL_TARGETS["calories"],
+        allergies: Sequence[str] = (),
+        dislikes: Sequence[str] = (),
+        alternatives: int = 3,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """Best meals for the targets, each with items, portions and totals
+
+        ``offset`` skips that many top-ranked meals first, so callers can rotate
+        options (e.g. one per day of a plan).
+        """
+        self.stats["optimizations"] += 1
+        allowed = self._allowed(exclusion_terms(allergies, dislikes))
+        candidates = []
+        for role in ROLES:
+            rows = np.flatnonzero(self.roles[role] & allowed)
+            if len(rows) > REQUEST_CANDIDATES_PER_ROLE:
+                rows = rows[np.argsort(-self.quality[role][rows], kind="stable")[:REQUEST_CANDIDATES_PER_ROLE]]
+            candidates.append(rows)
+        if any(len(rows) == 0 for rows in candidates):
+            self.stats["no_solution"] += 1
+            return []
+
+        # Every (protein, carb, vegetable) combination: shape (T, 3) of pool rows
+        triples = np.stack(np.meshgrid(*candidates, indexing="ij"), axis=-1).reshape(-1, 3)
+        per_gram = self.nutrients[triples] / 100.0  # (T, 3 foods, nutrients)
+        per_gram = np.nan_to_num(per_gram)
+        net_per_gram = np.maximum(per_gram[:, :, CARBS] - per_gram[:, :, FIBER], 0)
+        # Rows: net carbs, fiber, calories; columns: the three foods
+        system = np.stack([net_per_gram, per_gram[:, :, FIBER], per_gram[:, :, CALORIES]], axis=1)
+        targets = np.array([net_carbs, fiber, calories], dtype=np.float64)
+        # Scale rows so each target counts equally in the least-squares fit
+        scale = 1.0 / np.maximum(targets, 1.0)
+        scaled = system * scale[None, :, None]
+        # Ridge-regularized normal equations: one batched 3x3 solve, stable for degenerate triples
+        normal = np.einsum("tki,tkj->tij", scaled, scaled)
+        ridge = 1e-6 * np.trace(normal, axis1=1, axis2=2)[:, None, None] * np.eye(3) + 1e-12 * np.eye(3)
+        rhs = np.einsum("tki,k->ti", scaled, targets * scale)
+        grams = np.linalg.solve(normal + ridge, rhs[..., None])[..., 0]
+
+        low = np.array([PORTION_BOUNDS[r][0] for r in ROLES])
+        high = np.array([PORTION_BOUNDS[r][1] for r in ROLES])
+        grams = np.round(np.clip(np.nan_to_num(grams, nan=low), low, high) / 5) * 5
+
+        totals = np.einsum("tfn,tf->tn", per_gram, grams)
+        total_net = np.einsum("tf,tf->t", net_per_gram, grams)
+        score = (
+            3 * ((total_net - net_carbs) / max(net_carbs, 1)) ** 2
+            + ((totals[:, CALORIES] - calories) / max(calories, 1)) ** 2
+            + 2 * (np.maximum(fiber - totals[:, FIBER], 0) / max(fiber, 1)) ** 2
+        )
+        # Small preference for better-quality foods among near-equal fits
+        quality = sum(self.quality[role][triples[:, i]] for i, role in enumerate(ROLES))
+        score = score - 0.01 * np.tanh(quality)
+        order = np.lexsort((np.arange(len(score)), score))
+
+        meals, used = [], set()
+        skip = offset
+        for t in order:
+            rows = [int(r) for r in triples[t]]
+            if used.intersection(rows):
+                continue
+            if skip:
+                skip -= 1
+                used.update(rows)
+                continue
+            used.update(rows)
+            meals.append(self._meal(rows, grams[t], totals[t], total_net[t], score[t]))
+            if len(meals) >= alternatives:
+                break
+        return meals
+
+    def _meal(self, rows: List[int], grams: np.ndarray, totals: np.ndarray, net: float, score: float) -> Dict[str, Any]:
+        items = []
+        for role, row, portion in zip(ROLES, rows, grams):
+            factor = portion / 100.0
+            values = np.nan_to_num(self.nutrients[row]) * factor
+            items.append({
+                "role": role,
+                "fdc_id": self.fdc_ids[row],
+                "description": self.descriptions[row],
+                "grams": float(portion),
+                "net_carbs": round(float(max(values[CARBS] - values[FIBER], 0)), 1),
+                "fiber": round(float(values[FIBER]), 1),
+                "calories": round(float(values[CALORIES]), 0),
+                "protein": round(float(values[PROTEIN]), 1),
+            })
+        return {
+            "items": items,
+            "totals": {
+                "net_carbs": round(float(net), 1),
+                "fiber": round(float(totals[FIBER]), 1),
+                "calories": round(float(totals[CALORIES]), 0),
+                "protein": round(float(totals[PROTEIN]), 1),
+                "fat": round(float(totals[FAT]), 1),
+                "sodium": round(float(totals[SODIUM]), 0),
+            },
+            "score": round(float(score), 4),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pool_size": len(self.descriptions),
+            **{f"{role}_candidates": int(self.roles[role].sum()) for role in ROLES},
+        }
@@ -0,0 +1,300 @@
+"""
+Parallel multi-day meal plan generation.
+
+A plan is generated one day per LLM call, with the days running concurrently
+under a semaphore, so a 7-day plan takes roughly as long as its slowest day
+instead of one long sequential completion. Each day is requested as JSON
+(DAY_SCHEMA) and checked against the daily net-carb target. The check uses
+nutrition data from the local food index and nutrition cache for each
+ingredient, with the model's own estimate only for ingredients that can't be
+resolved. A food only resolves an ingredient when its description covers all
+of the ingredient's words, preparation state included (cooked rice has about
+a third of the carbs of raw rice), and its primary segment names one of them. Lookups across all days share a
+``lookup_concurrency`` limit, so cache misses don't flood USDA. A day outside the target is regenerated with feedback, up to
+``max_attempts`` times.
+
+Days get different protein focuses so the plan varies without the days
+having to be generated sequentially. Progress is reported as events
+(``day`` per state change, then ``completed`` or ``failed``) for SSE.
+"""
+import asyncio
+import json
+import logging
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from shopping_list_engine import normalize_name
+
+MEAL_TYPES = ["breakfast", "lunch", "dinner", "snack"]
+# Preparation words treated as the same state when matching ingredients to foods
+STATE_SYNONYMS = {"uncooked": "raw"}
+
+DAY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "meals": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "meal": {"type": "string", "enum": MEAL_TYPES},
+                    "name": {"type": "string"},
+                    "ingredients": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "grams": {"type": "number"},
+                                "net_carbs": {"type": "number"},
+                            },
+                            "required": ["name", "grams", "net_carbs"],
+                            "additionalProperties": False,
+                        },
+                    },
+                    "instructions": {"type": "string"},
+                },
+                "required": ["meal", "name", "ingredients", "instructions"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["meals"],
+    "additionalProperties": False,
+}
+
+# Default daily net-carb targets (grams) by diabetes type
+DAILY_NET_CARB_TARGETS = {"type1": 150, "type2": 120, "prediabetes": 130}
+DEFAULT_NET_CARB_TARGET = 130
+
+# Main protein per day, so independently generated days don't repeat each other
+PROTEIN_ROTATION = ["chicken", "salmon", "beans and lentils", "turkey", "eggs and tofu", "white fish", "lean beef"]
+
+DAY_PROMPT = """Create day {day} of a {days}-day diabetes-friendly meal plan.
+
+Person: {profile}
+Daily net-carb target: {target:.0f} g (stay between {low:.0f} and {high:.0f} g), spread evenly across meals.
+Main protein focus for this day: {protein}.
+Include breakfast, lunch, dinner and one snack. For every ingredient give its name as a plain
+grocery item (e.g. "brown rice, cooked"), its weight in grams and your estimate of its net carbs.
+Never include: {avoid}.{grounding}{feedback}"""
+
+
+def carb_target(profile: Optional[Dict[str, Any]], override: Optional[float] = None) -> float:
+    if override:
+        return float(override)
+    diabetes_type = ((profile or {}).get("diabetes_type") or "").lower()
+    return float(DAILY_NET_CARB_TARGETS.get(diabetes_type, DEFAULT_NET_CARB_TARGET))
+
+
+def describe_profile(profile: Optional[Dict[str, Any]]) -> str:
+    profile = profile or {}
+    parts = [f"{profile.get('diabetes_type') or 'diabetes'}"]
+    for label, key in (("activity", "activity_level"), ("cuisine", "cultural_background"), ("cooking skill", "cooking_skill")):
+        if profile.get(key):
+            parts.append(f"{label}: {profile[key]}")
+    for label, key in (("goals", "health_goals"), ("likes", "food_preferences")):
+        if profile.get(key):
+            parts.append(f"{label}: {', '.join(profile[key])}")
+    return "; ".join(parts)
+
+
+def parse_day(response: str) -> Optional[List[Dict[str, Any]]]:
+    """Meals from a DAY_SCHEMA reply (tolerating a markdown code fence), or None"""
+    body = re.sub(r"^```(?:json)?\s*|\s*```$", "", (response or "").strip())
+    try:
+        meals = json.loads(body).get("meals")
+    except (ValueError, AttributeError):
+        return None
+    meals = [meal for meal in meals or [] if isinstance(meal, dict) and meal.get("name")] if isinstance(meals, list) else []
+    return meals or None
+
+
+def _match_words(text: str) -> set:
+    return {STATE_SYNONYMS.get(word, word) for word in normalize_name(text).split()}
+
+
+def ingredient_matches(name: str, description: Optional[str]) -> bool:
+    """Whether a food description covers every word of an ingredient name and names it first
+
+    "cooked brown rice" matches "Rice, brown, long-grain, cooked" but neither
+    "Rice, brown, long-grain, raw" nor "Crackers, brown rice".
+    """
+    description = description or ""
+    wanted = _match_words(name)
+    return bool(wanted) and wanted <= _match_words(description) and bool(wanted & _match_words(description.split(",", 1)[0]))
+
+
+class MealPlanGenerator:
+    """Fans day generations out concurrently and validates them against carb targets"""
+
+    def __init__(
+        self,
+        complete: Callable[[str, Dict[str, str]], Awaitable[str]],
+        lookup_food: Callable[[str], Awaitable[Optional[Dict[str, Any]]]],
+        max_concurrency: int = 7,
+        max_attempts: int = 2,
+        tolerance: float = 0.15,
+        suggest_meals: Optional[Callable[[Dict[str, Any], int, float], Awaitable[List[str]]]] = None,
+        lookup_concurrency: int = 8,
+    ):
+        """``complete(prompt, priority)`` returns JSON matching DAY_SCHEMA;
+        ``lookup_food(name)`` returns a per-100g nutrition dict or None;
+        ``suggest_meals(profile, day, daily_target)`` optionally returns
+        portion-checked meal options to ground the prompt"""
+        self.complete = complete
+        self.lookup_food = lookup_food
+        self.suggest_meals = suggest_meals
+        self.max_concurrency = max_concurrency
+        self._lookup_semaphore = asyncio.Semaphore(lookup_concurrency)
+        self.max_attempts = max_attempts
+        self.tolerance = tolerance
+        self.stats = {"plans": 0, "plans_failed": 0, "days": 0, "day_retries": 0, "days_out_of_range": 0}
+
+    async def _lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        async with self._lookup_semaphore:
+            return await self.lookup_food(name)
+
+    async def net_carbs(self, meals: List[Dict[str, Any]]) -> Tuple[float, float]:
+        """(net carbs for the day, share of ingredients resolved from local nutrition data)"""
+        for meal in meals:
+            meal["ingredients"] = [i for i in meal.get("ingredients") or [] if isinstance(i, dict) and i.get("name")]
+        ingredients = [ingredient for meal in meals for ingredient in meal["ingredients"]]
+        names = list(dict.fromkeys((ingredient.get("name") or "").strip().lower() for ingredient in ingredients))
+        foods = await asyncio.gather(*(self._lookup(name) for name in names), return_exceptions=True)
+        by_name = {name: food for name, food in zip(names, foods) if isinstance(food, dict)}
+
+        total = 0.0
+        resolved = 0
+        for ingredient in ingredients:
+            grams = float(ingredient.get("grams") or 0)
+            food = by_name.get((ingredient.get("name") or "").strip().lower())
+            if food and food.get("carbohydrates") is not None:
+                per_100g = max(0.0, food["carbohydrates"] - (food.get("fiber") or 0))
+                ingredient["net_carbs_local"] = round(per_100g * grams / 100, 1)
+                total += ingredient["net_carbs_local"]
+                resolved += 1
+            else:
+                total += float(ingredient.get("net_carbs") or 0)
+        for meal in meals:
+            meal["net_carbs"] = round(sum(
+                i.get("net_carbs_local", i.get("net_carbs") or 0) for i in meal["ingredients"]
+            ), 1)
+        return round(total, 1), (resolved / len(ingredients) if ingredients else 0.0)
+
+    async def generate_day(
+        self,
+        day: int,
+        days: int,
+        profile: Optional[Dict[str, Any]],
+        target: float,
+        priority: Dict[str, str],
+        progress: Callable[[Dict[str, Any]], None],
+    ) -> Dict[str, Any]:
+        low, high = target * (1 - self.tolerance), target * (1 + self.tolerance)
+        profile = profile or {}
+        avoid = ", ".join((profile.get("allergies") or []) + (profile.get("dislikes") or [])) or "nothing in particular"
+        grounding = ""
+        if self.suggest_meals:
+            try:
+                options = await self.suggest_meals(profile, day, target)
+            except Exception as e:
+                logging.warning(f"Meal suggestions unavailable for day {day}: {e}")
+                options = []
+            if options:
+                grounding = ("\nPortion-checked options from our nutrition database (use or adapt them):\n"
+                             + "\n".join(f"- {option}" for option in options))
+        feedback = ""
+        best = None
+        for attempt in range(1, self.max_attempts + 1):
+            progress({"day": day, "status": "generating" if attempt == 1 else "retrying", "attempt": attempt})
+            prompt = DAY_PROMPT.format(
+                day=day, days=days, profile=describe_profile(profile), target=target, low=low, high=high,
+                protein=PROTEIN_ROTATION[(day - 1) % len(PROTEIN_ROTATION)], avoid=avoid,
+                grounding=grounding, feedback=feedback
+            )
+            response = await self.complete(prompt, priority)
+            meals = parse_day(response)
+            if not meals:
+                feedback = "\n\nYour previous answer was not valid JSON for the schema. Answer with the JSON object only."
+                continue
+
+            net_carbs, coverage = await self.net_carbs(meals)
+            candidate = {
+                "day": day,
+                "meals": meals,
+                "net_carbs": net_carbs,
+                "carb_target": target,
+                "within_target": low <= net_carbs <= high,
+                "nutrition_coverage": round(coverage, 2),
+                "attempts": attempt,
+            }
+            if best is None or abs(net_carbs - target) < abs(best["net_carbs"] - target):
+                best = candidate
+            if candidate["within_target"]:
+                break
+            if attempt < self.max_attempts:
+                self.stats["day_retries"] += 1
+            feedback = (
+                f"\n\nA previous version of this day had {net_carbs:.0f} g net carbs by our nutrition data, "
+                f"which is {'over' if net_carbs > high else 'under'} the target. Adjust portions or swap ingredients."
+            )
+
+        if best is None:
+            raise ValueError(f"Day {day}: the model did not return a usable plan")
+        if not best["within_target"]:
+            self.stats["days_out_of_range"] += 1
+        self.stats["days"] += 1
+        return best
+
+    async def generate(
+        self,
+        days: int,
+        profile: Optional[Dict[str, Any]],
+        priority: Dict[str, str],
+        daily_net_carbs: Optional[float] = None,
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ("day", progress) events, then ("completed", {"days": [...]}) or ("failed", {...})"""
+        target = carb_target(profile, daily_net_carbs)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def run_day(day: int):
+            async with semaphore:
+                try:
+                    result = await self.generate_day(day, days, profile, target, priority, events.put_nowait)
+                    events.put_nowait({
+                        "day": day, "status": "completed", "net_carbs": result["net_carbs"],
+                        "within_target": result["within_target"], "attempts": result["attempts"],
+                    })
+                    return result
+                except Exception as e:
+                    logging.error(f"Meal plan day {day} failed: {e}")
+                    events.put_nowait({"day": day, "status": "failed", "error": str(e)})
+                    raise
+
+        tasks = [asyncio.create_task(run_day(day)) for day in range(1, days + 1)]
+        gathered = asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            while not gathered.done() or not events.empty():
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, gathered}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield "day", getter.result()
+                else:
+                    getter.cancel()
+            results = gathered.result()
+            failed = [day for day, result in enumerate(results, 1) if isinstance(result, BaseException)]
+            if failed:
+                self.stats["plans_failed"] += 1
+                yield "failed", {"error": f"{len(failed)} of {days} days could not be generated", "failed_days": failed}
+                return
+            self.stats["plans"] += 1
+            yield "completed", {"days": results, "carb_target": target}
+        finally:
+            # Client went away or the plan finished: don't leave day generations running
+            for task in tasks:
+                task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "max_concurrency": self.max_concurrency}
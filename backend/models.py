@@ -94,6 +94,15 @@ class APIUsage(BaseModel):
     calls_made: int = 0
     monthly_limit: int
     last_reset: datetime = Field(default_factory=datetime.utcnow)
+    # LLM accounting (service "llm:<endpoint>:<model>")
+    endpoint: Optional[str] = None
+    model: Optional[str] = None
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms_total: float = 0.0
+    latency_ms_max: float = 0.0
+    cost_usd: float = 0.0
 
 # Admin Models
 class AdminUser(BaseModel):
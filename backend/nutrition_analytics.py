@@ -0,0 +1,187 @@
+"""
+Vectorized nutrition analytics for foods.
+
+Takes a list of per-100g foods and returns, in one NumPy pass:
+
+- net carbs (carbohydrates - fiber)
+- glycemic index from the bundled GI_REFERENCE table
+- glycemic load per 100 g serving (GI * net carbs / 100)
+- the diabetic rating (diabetic_scoring.rate_foods)
+
+GI_REFERENCE holds typical values from the international GI tables
+(Atkinson, Foster-Powell & Brand-Miller, 2008), keyed by description phrase.
+A food takes the GI of the most specific phrase whose words all appear in
+its description ("brown rice" beats "rice") and which names the food itself:
+at least one of its words must be in the primary segment, the text before
+the first comma. "Oil, corn" and "Chicken, broilers, corn-fed, breast" don't
+take corn's GI. When the first segment is only a USDA category ("Beverages,
+orange juice", "Nuts, almonds") the next segment is the primary one. Words
+are compared in singular form, so "Bananas, raw" matches "banana"; among
+equally specific phrases the one naming the primary segment's last word wins
+("Candies, milk chocolate" is chocolate, not milk). Foods with essentially no
+carbohydrate have no GI (it is undefined for them) and a glycemic load of 0.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from diabetic_scoring import rate_foods
+from food_index import tokenize
+
+# (description phrase, glycemic index)
+GI_REFERENCE = [
+    # Breads and bakery
+    ("bread", 75), ("white bread", 75), ("whole wheat bread", 74), ("whole grain bread", 53),
+    ("multigrain bread", 53), ("rye bread", 58), ("pumpernickel", 50), ("sourdough", 54),
+    ("bagel", 72), ("croissant", 67), ("doughnut", 76), ("muffin", 60), ("pancake", 66),
+    ("waffle", 76), ("pita", 68), ("tortilla", 30), ("corn tortilla", 46), ("crackers", 74),
+    ("rice cakes", 82), ("pretzels", 83), ("cake", 51), ("cookies", 55), ("pizza", 80),
+    # Grains, pasta and cereals
+    ("rice", 73), ("white rice", 73), ("brown rice", 68), ("basmati rice", 58), ("jasmine rice", 89),
+    ("wild rice", 57), ("quinoa", 53), ("oats", 55), ("oatmeal", 55), ("instant oatmeal", 79),
+    ("rolled oats", 55), ("steel cut oats", 52), ("cornflakes", 81), ("corn flakes", 81), ("muesli", 57),
+    ("granola", 55), ("bran", 43), ("couscous", 65), ("pasta", 49), ("spaghetti", 49),
+    ("whole wheat pasta", 48), ("macaroni", 47), ("noodles", 47), ("rice noodles", 53), ("udon", 55),
+    ("barley", 28), ("bulgur", 48), ("buckwheat", 45), ("millet", 71), ("polenta", 68), ("popcorn", 65),
+    # Starchy vegetables
+    ("potato", 78), ("potatoes", 78), ("baked potato", 85), ("mashed potatoes", 87), ("french fries", 63),
+    ("sweet potato", 63), ("yam", 54), ("pumpkin", 64), ("squash", 51), ("corn", 52), ("sweet corn", 52),
+    ("peas", 51), ("green peas", 51), ("carrots", 39), ("carrot", 39), ("beets", 64), ("parsnips", 52),
+    # Legumes
+    ("chickpeas", 28), ("garbanzo", 28), ("hummus", 6), ("kidney beans", 24), ("lentils", 32),
+    ("black beans", 30), ("pinto beans", 39), ("navy beans", 31), ("baked beans", 40), ("soybeans", 16),
+    ("edamame", 18), ("split peas", 32), ("beans", 30),
+    # Fruit
+    ("apple", 36), ("apples", 36), ("banana", 51), ("orange", 43), ("grapefruit", 25), ("grapes", 59),
+    ("mango", 51), ("pineapple", 59), ("papaya", 60), ("watermelon", 76), ("cantaloupe", 65),
+    ("strawberries", 40), ("blueberries", 53), ("raspberries", 32), ("blackberries", 25), ("cherries", 22),
+    ("pear", 38), ("peach", 42), ("plum", 39), ("apricot", 34), ("kiwi", 50), ("dates", 42),
+    ("raisins", 64), ("prunes", 29), ("figs", 61), ("avocado", 15),
+    # Dairy and alternatives
+    ("milk", 39), ("skim milk", 37), ("yogurt", 41), ("greek yogurt", 11), ("ice cream", 51),
+    ("soy milk", 34), ("almond milk", 25), ("oat milk", 69), ("cheese", 0),
+    # Sugars, sweets and drinks
+    ("sugar", 65), ("honey", 61), ("maple syrup", 54), ("agave", 11), ("glucose", 103), ("fructose", 15),
+    ("chocolate", 40), ("dark chocolate", 23), ("jam", 51), ("orange juice", 50), ("apple juice", 41),
+    ("juice", 50), ("cola", 59), ("soda", 59), ("sports drink", 78), ("potato chips", 56), ("corn chips", 42),
+    # Nuts and seeds
+    ("peanuts", 7), ("peanut butter", 14), ("cashews", 22), ("almonds", 0), ("walnuts", 0), ("nuts", 15),
+    # Non-starchy vegetables (commonly assigned ~15)
+    ("broccoli", 15), ("cauliflower", 15), ("spinach", 15), ("lettuce", 15), ("kale", 15), ("cabbage", 15),
+    ("cucumber", 15), ("zucchini", 15), ("celery", 15), ("asparagus", 15), ("green beans", 15),
+    ("mushrooms", 15), ("peppers", 15), ("tomato", 15), ("tomatoes", 15), ("onion", 10), ("eggplant", 15),
+    ("brussels sprouts", 15), ("artichoke", 15), ("okra", 20),
+]
+
+# First description segments that name a USDA food category rather than the food
+CATEGORY_SEGMENT_WORDS = {
+    "beverage", "nut", "seed", "cereal", "snack", "candy", "spice", "babyfood", "fast", "restaurant",
+    "alcoholic", "dessert", "sweetener", "topping", "formulated", "bar",
+}
+
+# Below this many grams of available carbohydrate per 100 g, glycemic load is 0
+NEGLIGIBLE_NET_CARBS = 1.0
+
+
+def singular(word: str) -> str:
+    """Crude English singular, applied alike to reference phrases and descriptions"""
+    if len(word) <= 3 or word.endswith(("ss", "us")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes", "sses")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _words(text: str) -> List[str]:
+    return [singular(token) for token in tokenize(text)]
+
+
+def _compile(reference):
+    """Phrase token tuples grouped by first token, most specific first"""
+    by_first: Dict[str, List[tuple]] = {}
+    for phrase, gi in reference:
+        tokens = tuple(_words(phrase))
+        by_first.setdefault(tokens[0], []).append((tokens, gi))
+    for entries in by_first.values():
+        entries.sort(key=lambda entry: -len(entry[0]))
+    return by_first
+
+
+_GI_BY_FIRST_TOKEN = _compile(GI_REFERENCE)
+
+
+def glycemic_index(description: str) -> Optional[int]:
+    """GI of the most specific reference phrase contained in a description and naming its primary segment"""
+    segments = [_words(segment) for segment in description.split(",")]
+    primary_words = segments[0] if segments else []
+    if primary_words and primary_words[0] in CATEGORY_SEGMENT_WORDS and len(segments) > 1:
+        primary_words = segments[1]
+    primary = set(primary_words)
+    tokens = {word for segment in segments for word in segment}
+    best_length, best_gi = 0, None
+    # Ties between equally specific phrases go to the primary segment's head word (its last), then description order
+    ordered = list(dict.fromkeys(list(reversed(primary_words)) + [word for segment in segments for word in segment]))
+    for token in ordered:
+        for phrase, gi in _GI_BY_FIRST_TOKEN.get(token, ()):
+            if len(phrase) <= best_length:
+                break
+            if all(word in tokens for word in phrase[1:]) and primary.intersection(phrase):
+                best_length, best_gi = len(phrase), gi
+                break
+    return best_gi
+
+
+def _column(foods: Sequence[Dict[str, Any]], field: str) -> np.ndarray:
+    return np.array([np.nan if food.get(field) is None else food[field] for food in foods], dtype=np.float64)
+
+
+def _food_gi(food: Dict[str, Any]) -> float:
+    gi = food.get("glycemic_index")
+    if gi is None:
+        gi = glycemic_index(food.get("description") or food.get("food_name") or "")
+    # A GI of 0 (cheese, nuts) is a real value, not an unknown one
+    return np.nan if gi is None else gi
+
+
+def analyze_foods(foods: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Net carbs, GI, glycemic load per 100 g and rating for many foods at once
+
+    Foods are FoodNutrition-shaped dicts. A known ``glycemic_index`` is kept;
+    otherwise it is looked up from the description. Either way it is dropped
+    for foods with negligible net carbs. NaN marks unknown values.
+    """
+    carbs = _column(foods, "carbohydrates")
+    fiber = np.nan_to_num(_column(foods, "fiber"))
+    sugars = np.nan_to_num(_column(foods, "sugars"))
+    gi = np.array([_food_gi(food) for food in foods], dtype=np.float64)
+
+    net_carbs = np.maximum(carbs - fiber, 0.0)
+    gi = np.where(net_carbs < NEGLIGIBLE_NET_CARBS, np.nan, gi)
+    glycemic_load = np.where(net_carbs < NEGLIGIBLE_NET_CARBS, 0.0, gi * net_carbs / 100.0)
+    return {
+        "net_carbs": np.round(net_carbs, 2),
+        "glycemic_index": gi,
+        "glycemic_load": np.round(glycemic_load, 1),
+        "diabetic_rating": rate_foods(np.nan_to_num(carbs), fiber, sugars),
+    }
+
+
+def food_analytics_records(foods: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """analyze_foods as one dict of fields per food (None for unknown values)"""
+    if not foods:
+        return []
+    results = analyze_foods(foods)
+    records = []
+    for i in range(len(foods)):
+        gi, net, load = results["glycemic_index"][i], results["net_carbs"][i], results["glycemic_load"][i]
+        records.append({
+            "net_carbs": None if np.isnan(net) else float(net),
+            "glycemic_index": None if np.isnan(gi) else int(gi),
+            "glycemic_load": None if np.isnan(load) else float(load),
+            "diabetic_rating": str(results["diabetic_rating"][i]),
+        })
+    return records
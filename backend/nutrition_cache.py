@@ -0,0 +1,360 @@
+"""
+Caches for nutrition lookups.
+
+NutritionSearchCache caches search results by normalized query as an ordered
+list of FDC IDs in ``db.nutrition_search_cache`` (expired by a TTL index), and
+hydrates them from ``db.nutrition`` with a single ``$in`` read. The hottest
+queries are also kept fully hydrated in a bounded in-process LRU so they never
+leave the worker.
+
+NutritionDetailCache fronts per-food detail lookups: ``db.nutrition`` is
+unique on ``fdc_id``, stale entries are served while a background refresh runs,
+and unknown IDs are remembered briefly so they don't reach USDA repeatedly.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+QUERY_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query: lowercase, strip punctuation, collapse whitespace"""
+    return " ".join(QUERY_TOKEN_PATTERN.findall((query or "").lower()))
+
+
+class NutritionSearchCache:
+    """Two-level (memory + MongoDB) cache of nutrition search results"""
+
+    def __init__(self, db, ttl_seconds: int = 7 * 86400, memory_ttl_seconds: int = 3600, memory_size: int = 512):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.memory_ttl_seconds = memory_ttl_seconds
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+    async def ensure_indexes(self):
+        """Create the unique key and TTL indexes for the cache collection"""
+        await self.db.nutrition_search_cache.create_index("query_key", unique=True)
+        await self.db.nutrition_search_cache.create_index("expires_at", expireAfterSeconds=0)
+
+    @staticmethod
+    def cache_key(query: str, page_size: int) -> str:
+        return f"{normalize_query(query)}|{page_size}"
+
+    def _remember(self, key: str, foods: List[Dict[str, Any]]):
+        self._memory[key] = (time.monotonic() + self.memory_ttl_seconds, foods)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def get(self, query: str, page_size: int) -> Optional[List[Dict[str, Any]]]:
+        """Return cached foods for a query in ranked order, or None on a miss"""
+        key = self.cache_key(query, page_size)
+
+        entry = self._memory.get(key)
+        if entry:
+            expires_at, foods = entry
+            if expires_at > time.monotonic():
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return foods
+            del self._memory[key]
+
+        try:
+            cached = await self.db.nutrition_search_cache.find_one({"query_key": key})
+            expires_at = cached.get("expires_at") if cached else None
+            if expires_at and expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if not expires_at or expires_at <= datetime.now(timezone.utc):
+                self.stats["misses"] += 1
+                return None
+
+            fdc_ids = cached.get("fdc_ids", [])
+            docs = await self.db.nutrition.find(
+                {"fdc_id": {"$in": fdc_ids}}, {"_id": 0}
+            ).to_list(len(fdc_ids))
+            by_id = {doc["fdc_id"]: doc for doc in docs}
+            if any(fdc_id not in by_id for fdc_id in fdc_ids):
+                # A food fell out of db.nutrition; refetch the whole query
+                self.stats["misses"] += 1
+                return None
+
+            foods = [by_id[fdc_id] for fdc_id in fdc_ids]
+            self._remember(key, foods)
+            self.stats["db_hits"] += 1
+            return foods
+        except Exception as e:
+            logging.error(f"Nutrition search cache read error: {e}")
+            self.stats["misses"] += 1
+            return None
+
+    async def put(self, query: str, page_size: int, foods: List[Dict[str, Any]]):
+        """Store the ranked FDC IDs for a query (foods must already be in db.nutrition)"""
+        if not foods:
+            # Empty results are usually upstream failures; don't pin them
+            return
+
+        key = self.cache_key(query, page_size)
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.nutrition_search_cache.update_one(
+                {"query_key": key},
+                {"$set": {
+                    "query_key": key,
+                    "query": normalize_query(query),
+                    "fdc_ids": [food["fdc_id"] for food in foods],
+                    "cached_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds)
+                }},
+                upsert=True
+            )
+            self._remember(key, foods)
+            self.stats["stores"] += 1
+        except Exception as e:
+            logging.error(f"Nutrition search cache write error: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit counters and hit rates"""
+        hits = self.stats["memory_hits"] + self.stats["db_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_hit_rate": round(self.stats["memory_hits"] / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+def _parse_cached_at(value) -> Optional[datetime]:
+    """Read a cached_at value stored either as a datetime or an ISO string"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return None
+
+
+class NutritionDetailCache:
+    """Expiring, negative-caching, stale-while-revalidate cache over db.nutrition"""
+
+    def __init__(self, db, ttl_seconds: int = 30 * 86400, negative_ttl_seconds: int = 600):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._negative: Dict[str, float] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._refresh_tasks: set = set()
+        self.stats = {"fresh_hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0, "refreshes": 0, "warm_hits": 0}
+
+    async def ensure_indexes(self):
+        """Make fdc_id unique in db.nutrition, collapsing legacy duplicates first if needed"""
+        try:
+            await self.db.nutrition.create_index("fdc_id", unique=True)
+        except Exception as e:
+            logging.warning(f"Rebuilding nutrition fdc_id index: {e}")
+            try:
+                await self.db.nutrition.drop_index("fdc_id_1")
+            except Exception:
+                pass
+            removed = await self._remove_duplicates()
+            logging.info(f"Removed {removed} duplicate nutrition documents")
+            await self.db.nutrition.create_index("fdc_id", unique=True)
+        await self.db.nutrition_negative_cache.create_index("fdc_id", unique=True)
+        await self.db.nutrition_negative_cache.create_index("expires_at", expireAfterSeconds=0)
+
+    async def _remove_duplicates(self) -> int:
+        """Keep the newest document per fdc_id and delete the rest"""
+        pipeline = [
+            {"$sort": {"cached_at": -1}},
+            {"$group": {"_id": "$fdc_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]
+        removed = 0
+        async for group in self.db.nutrition.aggregate(pipeline):
+            result = await self.db.nutrition.delete_many({"_id": {"$in": group["ids"][1:]}})
+            removed += result.deleted_count
+        return removed
+
+    def _is_fresh(self, doc: Dict[str, Any]) -> bool:
+        cached_at = _parse_cached_at(doc.get("cached_at"))
+        if not cached_at:
+            return False
+        return (datetime.now(timezone.utc) - cached_at).total_seconds() < self.ttl_seconds
+
+    async def _is_negative(self, fdc_id: str) -> bool:
+        expires_at = self._negative.get(fdc_id)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                return True
+            del self._negative[fdc_id]
+
+        doc = await self.db.nutrition_negative_cache.find_one({"fdc_id": fdc_id})
+        expires = _parse_cached_at(doc.get("expires_at")) if doc else None
+        if expires and expires > datetime.now(timezone.utc):
+            remaining = (expires - datetime.now(timezone.utc)).total_seconds()
+            self._negative[fdc_id] = time.monotonic() + remaining
+            return True
+        return False
+
+    async def _remember_missing(self, fdc_id: str):
+        self._negative[fdc_id] = time.monotonic() + self.negative_ttl_seconds
+        try:
+            await self.db.nutrition_negative_cache.update_one(
+                {"fdc_id": fdc_id},
+                {"$set": {
+                    "fdc_id": fdc_id,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.negative_ttl_seconds)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Nutrition negative cache write error: {e}")
+
+    async def store(self, doc: Dict[str, Any]):
+        """Upsert a food document (already prepared for Mongo) by fdc_id
+
+        Fields the document doesn't carry, such as the autocomplete
+        ``search_hits``, are kept; ``refreshed_by`` is reset unless given.
+        """
+        await self.db.nutrition.update_one({"fdc_id": doc["fdc_id"]}, {"$set": {"refreshed_by": None, **doc}}, upsert=True)
+        self._negative.pop(doc["fdc_id"], None)
+
+    async def refresh(self, fdc_id: str, fetch: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        """Re-fetch a food ahead of expiry (cache warming); fresh hits on it count as warm hits"""
+
+        async def fetch_warmed(fdc_id: str):
+            doc = await fetch(fdc_id)
+            return {**doc, "refreshed_by": "warmer"} if doc is not None else None
+
+        doc = await self._fetch(fdc_id, fetch_warmed)
+        self.stats["refreshes"] += 1
+        return doc
+
+    async def _fetch(self, fdc_id: str, fetch: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]):
+        """Fetch upstream once per fdc_id no matter how many callers are waiting"""
+        task = self._inflight.get(fdc_id)
+        if task is None:
+            # A shared task, so a cancelled first caller doesn't strand the others
+            task = asyncio.create_task(self._fetch_and_store(fdc_id, fetch))
+            self._inflight[fdc_id] = task
+            task.add_done_callback(lambda done: self._finish(fdc_id, done))
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, fdc_id: str, fetch: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]):
+        doc = await fetch(fdc_id)
+        if doc is None:
+            await self._remember_missing(fdc_id)
+        else:
+            await self.store(doc)
+        return doc
+
+    def _finish(self, fdc_id: str, task: asyncio.Task):
+        if self._inflight.get(fdc_id) is task:
+            del self._inflight[fdc_id]
+        if not task.cancelled():
+            # Mark retrieved so a failure nobody waited for doesn't log "never retrieved"
+            task.exception()
+
+    def _refresh_in_background(self, fdc_id: str, fetch):
+        if fdc_id in self._inflight:
+            return
+
+        async def refresh():
+            try:
+                await self._fetch(fdc_id, fetch)
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                logging.warning(f"Background nutrition refresh failed for {fdc_id}: {e}")
+
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def get(self, fdc_id: str, fetch: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        """Return the cached food document for fdc_id, fetching upstream on a miss
+
+        ``fetch`` returns a Mongo-ready food document, or None when USDA reports
+        the food does not exist; any other upstream failure should raise.
+        """
+        doc = await self.db.nutrition.find_one({"fdc_id": fdc_id}, {"_id": 0})
+        if doc:
+            if self._is_fresh(doc):
+                self.stats["fresh_hits"] += 1
+                if doc.get("refreshed_by") == "warmer":
+                    self.stats["warm_hits"] += 1
+            else:
+                self.stats["stale_hits"] += 1
+                self._refresh_in_background(fdc_id, fetch)
+            return doc
+
+        if await self._is_negative(fdc_id):
+            self.stats["negative_hits"] += 1
+            return None
+
+        self.stats["misses"] += 1
+        return await self._fetch(fdc_id, fetch)
+
+    async def get_many(
+        self,
+        fdc_ids: List[str],
+        fetch: Callable[[str], Awaitable[Optional[Dict[str, Any]]]],
+        fetch_many: Callable[[List[str]], Awaitable[Dict[str, Dict[str, Any]]]],
+    ) -> Dict[str, Dict[str, Any]]:
+        """Resolve several fdc_ids with one $in read and one bulk upstream fetch for misses
+
+        ``fetch_many`` returns a dict of fdc_id -> Mongo-ready document; IDs it
+        omits are negatively cached. ``fetch`` is used for background refreshes.
+        """
+        fdc_ids = list(dict.fromkeys(fdc_ids))
+        docs = await self.db.nutrition.find({"fdc_id": {"$in": fdc_ids}}, {"_id": 0}).to_list(len(fdc_ids))
+        found = {doc["fdc_id"]: doc for doc in docs}
+        for fdc_id, doc in found.items():
+            if self._is_fresh(doc):
+                self.stats["fresh_hits"] += 1
+                if doc.get("refreshed_by") == "warmer":
+                    self.stats["warm_hits"] += 1
+            else:
+                self.stats["stale_hits"] += 1
+                self._refresh_in_background(fdc_id, fetch)
+
+        missing = []
+        for fdc_id in fdc_ids:
+            if fdc_id in found:
+                continue
+            if await self._is_negative(fdc_id):
+                self.stats["negative_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                missing.append(fdc_id)
+
+        if missing:
+            fetched = await fetch_many(missing)
+            for fdc_id in missing:
+                doc = fetched.get(fdc_id)
+                if doc is None:
+                    await self._remember_missing(fdc_id)
+                else:
+                    await self.store(doc)
+                    found[fdc_id] = doc
+        return found
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = sum(self.stats[k] for k in ("fresh_hits", "stale_hits", "negative_hits", "misses"))
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "warm_hit_rate": round(self.stats["warm_hits"] / lookups, 4) if lookups else 0.0,
+            "refreshing": len(self._refresh_tasks),
+        }
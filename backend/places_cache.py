@@ -0,0 +1,193 @@
+"""
+Popularity-tracking cache for Google Places lookups.
+
+``db.places_cache`` holds one document per (kind, key):
+
+- ``geocode``: normalized location text -> coordinates
+- ``search``: a nearby-search tile -> ranked place_ids (restaurants live in
+  ``db.restaurants``)
+- ``place``: a place_id whose details are cached in ``db.restaurants``; the
+  entry only tracks demand and freshness
+
+Every request for an existing entry increments ``hits`` and stamps
+``last_hit_at``, so the collection doubles as the demand log the cache warmer
+mines. Reads never create entries: an entry is written only once its lookup
+succeeded, so arbitrary typed locations leave nothing behind. Entries nobody
+has asked for in ``idle_ttl_seconds`` are dropped by a TTL index.
+
+Nearby searches are cached per cell of a ``tile_degrees`` grid (about 550 m
+at the default), radius and keyword, so nearby users share one cached search.
+The tile is only the cache key: the search itself runs from the requesting
+user's coordinates, which the entry keeps for the warmer. ``refreshed_by`` records whether the last refresh came from a user
+request or from the warmer; a fresh hit on a warmer-refreshed entry counts
+as a warm hit. Entries the warmer failed to refresh carry ``retry_after``
+so it doesn't spend quota on them again right away.
+"""
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from nutrition_cache import normalize_query
+
+KINDS = ("geocode", "search", "place")
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    # Mongo hands back naive UTC datetimes unless the client is tz_aware
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
+
+class PlacesCache:
+    """Geocode and nearby-search cache that also records demand per location"""
+
+    def __init__(
+        self,
+        db,
+        search_ttl_seconds: int = 86400,
+        geocode_ttl_seconds: int = 30 * 86400,
+        idle_ttl_seconds: int = 30 * 86400,
+        tile_degrees: float = 0.005,
+    ):
+        self.db = db
+        # Place details are cached in db.restaurants for 24 hours
+        self.ttl_seconds = {"geocode": geocode_ttl_seconds, "search": search_ttl_seconds, "place": 86400}
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.tile_degrees = tile_degrees
+        self.stats = {kind: {"lookups": 0, "hits": 0, "warm_hits": 0} for kind in KINDS}
+
+    async def ensure_indexes(self):
+        await self.db.places_cache.create_index([("kind", 1), ("key", 1)], unique=True)
+        await self.db.places_cache.create_index("last_hit_at", expireAfterSeconds=self.idle_ttl_seconds)
+        await self.db.places_cache.create_index([("hits", -1)])
+
+    @staticmethod
+    def geocode_key(location: str) -> str:
+        return normalize_query(location)
+
+    def search_tile(self, latitude: float, longitude: float, radius: int, keyword: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+        """(cache key from the tile, search parameters at the caller's coordinates) for a nearby search"""
+        row = math.floor(latitude / self.tile_degrees)
+        column = math.floor(longitude / self.tile_degrees)
+        keyword = normalize_query(keyword or "") or None
+        params = {
+            "latitude": round(latitude, 6),
+            "longitude": round(longitude, 6),
+            "radius": radius,
+            "keyword": keyword,
+        }
+        return f"{row}:{column}:{radius}:{keyword or ''}", params
+
+    async def _touch(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Count a request for an existing entry and return it; None if there is no entry yet"""
+        return await self.db.places_cache.find_one_and_update(
+            {"kind": kind, "key": key},
+            {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.now(timezone.utc)}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _count(self, kind: str, hit: bool, doc: Optional[Dict[str, Any]]):
+        stats = self.stats[kind]
+        stats["lookups"] += 1
+        if hit:
+            stats["hits"] += 1
+            if doc and doc.get("refreshed_by") == "warmer":
+                stats["warm_hits"] += 1
+
+    def _is_fresh(self, doc: Dict[str, Any]) -> bool:
+        expires_at = _aware(doc.get("expires_at"))
+        return expires_at is not None and expires_at > datetime.now(timezone.utc)
+
+    async def get(self, kind: str, key: str) -> Optional[Any]:
+        """Cached value for a geocode or search entry, or None if missing or expired"""
+        try:
+            doc = await self._touch(kind, key)
+        except Exception as e:
+            logging.error(f"Places cache read error: {e}")
+            return None
+        hit = doc is not None and self._is_fresh(doc) and doc.get("value") is not None
+        self._count(kind, hit, doc)
+        return doc["value"] if hit else None
+
+    async def record(self, kind: str, key: str, hit: bool):
+        """Count a request for an entry whose data is cached elsewhere (place details)"""
+        try:
+            doc = await self._touch(kind, key)
+        except Exception as e:
+            logging.error(f"Places cache read error: {e}")
+            doc = None
+        self._count(kind, hit, doc)
+
+    async def put(self, kind: str, key: str, value: Any = None, refreshed_by: str = "user", params: Optional[Dict[str, Any]] = None):
+        """Store a fresh value (or just freshness, for place entries)
+
+        A user refresh creating the entry counts as its first request; a
+        refresh of an existing entry was already counted by get/record.
+        """
+        now = datetime.now(timezone.utc)
+        fields = {
+            "value": value,
+            "refreshed_at": now,
+            "refreshed_by": refreshed_by,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds[kind]),
+            "retry_after": None,
+        }
+        if params:
+            fields["params"] = params
+        try:
+            await self.db.places_cache.update_one(
+                {"kind": kind, "key": key},
+                # last_hit_at keeps warmer-only entries inside the idle TTL until demand stops
+                {"$set": fields, "$setOnInsert": {"hits": 1 if refreshed_by == "user" else 0, "last_hit_at": now}},
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Places cache write error: {e}")
+
+    async def defer(self, kind: str, key: str, seconds: int):
+        """Keep the warmer off an entry it just failed to refresh"""
+        try:
+            await self.db.places_cache.update_one(
+                {"kind": kind, "key": key},
+                {"$set": {"retry_after": datetime.now(timezone.utc) + timedelta(seconds=seconds)}}
+            )
+        except Exception as e:
+            logging.error(f"Places cache write error: {e}")
+
+    async def warm_candidates(self, limit: int, active_days: int, horizon_seconds: int) -> List[Dict[str, Any]]:
+        """Most-requested recent entries that are missing or expire within the horizon
+
+        The horizon is capped at half of each kind's TTL, so an entry warmed
+        in one run is not picked again by the next.
+        """
+        now = datetime.now(timezone.utc)
+        stale = [
+            {"kind": kind, "$or": [
+                {"expires_at": {"$exists": False}},
+                {"expires_at": {"$lt": now + timedelta(seconds=min(horizon_seconds, ttl // 2))}},
+            ]}
+            for kind, ttl in self.ttl_seconds.items()
+        ]
+        return await self.db.places_cache.find(
+            {
+                "last_hit_at": {"$gte": now - timedelta(days=active_days)},
+                "retry_after": {"$not": {"$gt": now}},
+                "$or": stale,
+            },
+            {"_id": 0, "kind": 1, "key": 1, "params": 1, "hits": 1}
+        ).sort("hits", -1).to_list(limit)
+
+    def get_stats(self) -> Dict[str, Any]:
+        report = {}
+        for kind, stats in self.stats.items():
+            lookups, hits = stats["lookups"], stats["hits"]
+            report[kind] = {
+                **stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                # Share of all lookups answered by an entry the warmer refreshed
+                "warm_hit_rate": round(stats["warm_hits"] / lookups, 4) if lookups else 0.0,
+            }
+        return report
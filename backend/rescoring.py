@@ -0,0 +1,151 @@
+"""
+Bulk re-scoring of cached restaurants and foods.
+
+When the restaurant scoring table or the food rating rules change version,
+documents already in ``db.restaurants`` and ``db.nutrition`` keep their old
+scores. RescoringJob walks each collection in cursor batches, recomputes
+outdated scores from the stored fields (no upstream API calls), and writes
+them back with unordered ``bulk_write`` batches.
+
+Each batch is stamped with the scorer version it was actually scored with.
+If the table changes while a run is in progress, that run can't revisit the
+documents it already passed, so ``start(follow_up=True)`` queues one more run
+to start as soon as the current one finishes.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from diabetic_scoring import restaurant_scorer, FOOD_RATING_VERSION
+from nutrition_analytics import food_analytics_records
+
+
+class RescoringJob:
+    """Background job that brings stored scores up to the current scorer versions"""
+
+    def __init__(self, db, batch_size: int = 500):
+        self.db = db
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._follow_up = False
+        self.status: Dict[str, Any] = {"running": False}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, follow_up: bool = False) -> bool:
+        """Start the job in the background; returns False if it is already running
+
+        With ``follow_up`` a run already in progress is followed by another one,
+        e.g. because the scoring table changed under it.
+        """
+        if self.running:
+            if follow_up:
+                self._follow_up = True
+                self.status["follow_up_queued"] = True
+            return False
+        self._task = asyncio.create_task(self._run_until_current())
+        return True
+
+    async def _run_until_current(self):
+        while True:
+            self._follow_up = False
+            await self.run()
+            if not self._follow_up:
+                return
+            logging.info("Scoring changed during rescoring; running again")
+
+    async def run(self) -> Dict[str, Any]:
+        # Another worker may have saved a newer scoring table
+        await restaurant_scorer.load(self.db)
+        self.status = {
+            "running": True,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "restaurant_version": restaurant_scorer.version,
+            "food_version": FOOD_RATING_VERSION,
+            "restaurants": {"scanned": 0, "updated": 0},
+            "foods": {"scanned": 0, "updated": 0},
+        }
+        try:
+            await self.rescore_restaurants()
+            await self.rescore_foods()
+        except Exception as e:
+            logging.error(f"Rescoring job failed: {e}")
+            self.status["error"] = str(e)
+        finally:
+            self.status["running"] = False
+            self.status["finished_at"] = datetime.now(timezone.utc).isoformat()
+            logging.info(f"Rescoring job finished: {self.status}")
+        return self.status
+
+    async def _flush(self, collection, operations: List[UpdateOne], counters: Dict[str, int]):
+        if not operations:
+            return
+        result = await collection.bulk_write(operations, ordered=False)
+        counters["updated"] += result.modified_count
+
+    async def rescore_restaurants(self):
+        """Recompute diabetic_friendly_score for restaurants scored by an older table"""
+        version = restaurant_scorer.version
+        counters = self.status["restaurants"]
+        cursor = self.db.restaurants.find(
+            {"scoring_version": {"$ne": version}},
+            {"_id": 1, "name": 1, "cuisine_types": 1, "rating": 1, "scoring_version": 1}
+        ).batch_size(self.batch_size)
+
+        batch = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                await self._rescore_restaurant_batch(batch, counters)
+                batch = []
+        await self._rescore_restaurant_batch(batch, counters)
+
+    async def _rescore_restaurant_batch(self, docs: List[Dict[str, Any]], counters: Dict[str, int]):
+        if not docs:
+            return
+        # Read together with the scores, so a table saved mid-run is stamped with its own version
+        version = restaurant_scorer.version
+        scores = restaurant_scorer.score_many(docs)
+        operations = [
+            # Match the old version too, so a fresher upstream write is never overwritten
+            UpdateOne(
+                {"_id": doc["_id"], "scoring_version": doc.get("scoring_version")},
+                {"$set": {"diabetic_friendly_score": float(score), "scoring_version": version}}
+            )
+            for doc, score in zip(docs, scores)
+        ]
+        counters["scanned"] += len(docs)
+        await self._flush(self.db.restaurants, operations, counters)
+
+    async def rescore_foods(self):
+        """Recompute diabetic_rating and glycemic fields for foods rated by older rules"""
+        counters = self.status["foods"]
+        cursor = self.db.nutrition.find(
+            {"rating_version": {"$ne": FOOD_RATING_VERSION}},
+            {"_id": 1, "description": 1, "food_name": 1, "carbohydrates": 1, "fiber": 1, "sugars": 1, "rating_version": 1}
+        ).batch_size(self.batch_size)
+
+        docs = []
+        async for doc in cursor:
+            docs.append(doc)
+            if len(docs) >= self.batch_size:
+                await self._rescore_food_batch(docs, counters)
+                docs = []
+        await self._rescore_food_batch(docs, counters)
+
+    async def _rescore_food_batch(self, docs: List[Dict[str, Any]], counters: Dict[str, int]):
+        # One vectorized pass per batch; GI is looked up afresh from the description
+        operations = [
+            UpdateOne(
+                {"_id": doc["_id"], "rating_version": doc.get("rating_version")},
+                {"$set": {**analytics, "rating_version": FOOD_RATING_VERSION}}
+            )
+            for doc, analytics in zip(docs, food_analytics_records(docs))
+        ]
+        counters["scanned"] += len(docs)
+        await self._flush(self.db.nutrition, operations, counters)
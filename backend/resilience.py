@@ -0,0 +1,308 @@
+"""
+Resilience policies for upstream calls (Google Places, USDA, LLM provider).
+
+Each upstream gets an UpstreamPolicy with:
+- a per-attempt deadline, so a slow upstream can't pin worker slots, and an
+  overall deadline per call that retries and backoff must fit into
+- jittered exponential-backoff retries, only for idempotent calls
+- optional hedging: a second attempt is started if the first is still
+  running after ``hedge_after`` seconds, and the first success wins
+- a circuit breaker that fails fast (CircuitOpenError) while the upstream is
+  unhealthy, so callers can serve stale cache instead of waiting
+
+Policy state and counters are exposed through get_metrics().
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is short-circuited because the upstream's breaker is open"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} circuit open; retry in {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class UpstreamStatusError(Exception):
+    """Raised for retryable HTTP responses (429/5xx) once retries are exhausted"""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"Upstream returned HTTP {response.status_code}")
+        self.response = response
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Return whether a call may proceed, moving open -> half-open when due"""
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Let another half-open probe through after one ended without an outcome"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.warning(f"Circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Transport errors, timeouts and 429/5xx responses are worth retrying"""
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, UpstreamStatusError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+class UpstreamPolicy:
+    """Deadline, retry, hedging and circuit-breaker policy for one upstream"""
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+        hedge_after: Optional[float] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        any_error_is_failure: bool = False,
+        total_timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        # Budget for a whole call, attempts and backoff included
+        self.total_timeout = total_timeout or timeout * 2
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # SDK clients (e.g. the LLM provider) raise their own exception types, so
+        # every error counts against the breaker rather than only httpx/5xx ones
+        self.any_error_is_failure = any_error_is_failure
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0,
+            "timeouts": 0, "hedges": 0, "hedge_wins": 0, "short_circuits": 0,
+        }
+
+    def http_timeout(self) -> httpx.Timeout:
+        """httpx timeout matching this policy's deadline, for AsyncClient(timeout=...)"""
+        return httpx.Timeout(self.timeout, connect=min(self.timeout, 3.0))
+
+    async def _attempt(self, fn: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        timeout = min(self.timeout, deadline - asyncio.get_running_loop().time())
+        try:
+            result = await asyncio.wait_for(fn(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise
+        if isinstance(result, httpx.Response) and (result.status_code == 429 or result.status_code >= 500):
+            raise UpstreamStatusError(result)
+        return result
+
+    async def _hedged_attempt(self, fn: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        """Run an attempt, racing a second copy if the first is slower than hedge_after"""
+        primary = asyncio.ensure_future(self._attempt(fn, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self.counters["hedges"] += 1
+        hedge = asyncio.ensure_future(self._attempt(fn, deadline))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], idempotent: bool = True) -> Any:
+        """Call ``fn`` (a zero-argument coroutine factory) under this policy
+
+        Non-idempotent calls get a deadline and the breaker but are never
+        retried or hedged. No retry starts once it couldn't finish within
+        ``total_timeout`` of the call starting. httpx responses with 429/5xx status count as
+        failures; other responses (including 4xx) are returned unchanged.
+        """
+        self.counters["calls"] += 1
+        if not self.breaker.allow():
+            self.counters["short_circuits"] += 1
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        hedge = idempotent and self.hedge_after is not None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.total_timeout
+        for attempt in range(attempts):
+            try:
+                result = await (self._hedged_attempt(fn, deadline) if hedge else self._attempt(fn, deadline))
+                self.breaker.record_success()
+                self.counters["successes"] += 1
+                return result
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                retryable = is_retryable_error(e)
+                if not retryable and not self.any_error_is_failure:
+                    # Caller errors (bad request, parse failures) say nothing about upstream health
+                    self.breaker.record_success()
+                    raise
+                # Full jitter keeps synchronized clients from retrying in lockstep
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                # A retry left with under a quarter of the usual deadline isn't worth starting
+                out_of_time = deadline - loop.time() - delay < self.timeout / 4
+                if not retryable or attempt + 1 >= attempts or out_of_time:
+                    self.breaker.record_failure()
+                    self.counters["failures"] += 1
+                    if isinstance(e, UpstreamStatusError):
+                        # Hand the final 429/5xx response back like an unwrapped call would
+                        return e.response
+                    raise
+                self.counters["retries"] += 1
+                logging.info(f"Retrying {self.name} after {type(e).__name__} (attempt {attempt + 2}/{attempts}) in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def stream(self, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Relay an async iterator (e.g. LLM tokens) under the breaker
+
+        The deadline applies to the wait for each item, so a stalled stream is
+        cut off without limiting the total length of a healthy one. Streams are
+        never retried: tokens may already have reached the client.
+        """
+        self.counters["calls"] += 1
+        if not self.breaker.allow():
+            self.counters["short_circuits"] += 1
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+
+        iterator = fn().__aiter__()
+        outcome_recorded = False
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(iterator.__anext__(), timeout=self.timeout)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    self.counters["timeouts"] += 1
+                    raise
+                yield item
+            self.breaker.record_success()
+            self.counters["successes"] += 1
+            outcome_recorded = True
+        except Exception as e:
+            if is_retryable_error(e) or self.any_error_is_failure:
+                self.breaker.record_failure()
+                self.counters["failures"] += 1
+            else:
+                self.breaker.record_success()
+            outcome_recorded = True
+            raise
+        finally:
+            if not outcome_recorded:
+                # The consumer went away (client disconnect); that says nothing about upstream health
+                self.breaker.release_probe()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "retry_after_seconds": round(self.breaker.retry_after(), 1) if self.breaker.state == CircuitBreaker.OPEN else 0,
+            "timeout_seconds": self.timeout,
+            "total_timeout_seconds": self.total_timeout,
+            **self.counters,
+        }
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Per-upstream policies. Places calls are billed per request, so they get a
+# single retry and no hedging; LLM calls are never retried (see call sites).
+upstream_policies: Dict[str, UpstreamPolicy] = {
+    "google_places": UpstreamPolicy(
+        "google_places",
+        timeout=_env_float("GOOGLE_PLACES_TIMEOUT", 5.0),
+        total_timeout=_env_float("GOOGLE_PLACES_TOTAL_TIMEOUT", 8.0),
+        max_retries=1,
+    ),
+    "usda": UpstreamPolicy(
+        "usda",
+        timeout=_env_float("USDA_TIMEOUT", 5.0),
+        total_timeout=_env_float("USDA_TOTAL_TIMEOUT", 8.0),
+        max_retries=2,
+        hedge_after=_env_float("USDA_HEDGE_AFTER", 0) or None,
+    ),
+    "llm": UpstreamPolicy(
+        "llm",
+        timeout=_env_float("LLM_TIMEOUT", 60.0),
+        max_retries=0,
+        failure_threshold=3,
+        reset_timeout=60.0,
+        any_error_is_failure=True,
+    ),
+}
+
+
+def get_upstream_metrics() -> Dict[str, Dict[str, Any]]:
+    """Breaker state and counters for every upstream"""
+    return {name: policy.get_metrics() for name, policy in upstream_policies.items()}
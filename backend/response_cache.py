@@ -0,0 +1,199 @@
+"""
+Opt-in response cache for AI health-coach questions.
+
+Many chat messages are near-identical FAQs ("what can I eat for breakfast",
+"is rice ok"). Answers are cached per profile segment (chat_segment: every
+profile field the coach prompt includes) and looked up in two steps:
+
+1. exact match on the normalized message text
+2. similarity match: each message is sketched locally as a hashed vector of
+   word and character-trigram features, and the closest cached question in
+   the segment is reused if its cosine similarity clears the threshold
+
+Questions that differ in negations or numbers ("is rice ok" / "is rice not
+ok", "2 eggs" / "4 eggs") never match by similarity. Entries expire after a
+TTL and the cache is bounded by LRU eviction. Everything is in-process.
+
+Only answers to prompts without conversation history are shareable: once a
+user's summary or recent turns are in the prompt, the answer is personal, so
+callers skip the cache for that turn.
+"""
+import hashlib
+import json
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Profile fields the coach prompt includes (server.build_coach_system_message)
+CHAT_PROFILE_FIELDS = ["diabetes_type", "age", "gender", "activity_level", "cultural_background", "cooking_skill"]
+CHAT_PROFILE_LIST_FIELDS = ["health_goals", "food_preferences", "allergies", "dislikes"]
+SKETCH_DIMENSIONS = 1024
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+# Tokens that flip or quantify meaning; similar questions must agree on them exactly
+GUARD_WORDS = frozenset({
+    "no", "not", "never", "without", "avoid", "dont", "don't", "cant", "can't",
+    "shouldnt", "shouldn't", "isnt", "isn't", "arent", "aren't", "less", "more",
+})
+
+
+def normalize_message(text: str) -> str:
+    return " ".join(TOKEN_PATTERN.findall((text or "").lower()))
+
+
+def chat_segment(profile: Dict[str, Any]) -> str:
+    """Hash of every profile field the coach prompt uses, order- and case-insensitive"""
+    facets: Dict[str, Any] = {field: str(profile.get(field) or "").strip().lower() for field in CHAT_PROFILE_FIELDS}
+    for field in CHAT_PROFILE_LIST_FIELDS:
+        facets[field] = sorted({str(v).strip().lower() for v in profile.get(field) or [] if str(v).strip()})
+    return hashlib.sha256(json.dumps(facets, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def _guard_tokens(tokens: List[str]) -> frozenset:
+    return frozenset(t for t in tokens if t in GUARD_WORDS or t.isdigit())
+
+
+def sketch(normalized: str) -> np.ndarray:
+    """Unit-length hashed bag of words and character trigrams"""
+    features = normalized.split()
+    padded = f"  {normalized}  "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    vector = np.zeros(SKETCH_DIMENSIONS, dtype=np.float32)
+    if not features:
+        return vector
+    hashes = np.array([zlib.crc32(f.encode()) for f in features], dtype=np.uint32)
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % SKETCH_DIMENSIONS, signs)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Entry:
+    __slots__ = ("segment", "response", "vector", "guards", "expires_at")
+
+    def __init__(self, segment: str, response: str, vector: np.ndarray, guards: frozenset, expires_at: float):
+        self.segment = segment
+        self.response = response
+        self.vector = vector
+        self.guards = guards
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """Exact + similarity cache of chat answers, scoped by profile segment"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        similarity_threshold: float = 0.9,
+        ttl_seconds: int = 86400,
+        max_entries: int = 5000,
+    ):
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Per-segment (keys, stacked vectors), rebuilt lazily after the segment changes
+        self._segments: Dict[str, List[str]] = {}
+        self._matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self.stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "personal_skips": 0}
+
+    @staticmethod
+    def _key(segment: str, normalized: str) -> str:
+        return hashlib.sha256(f"{segment}|{normalized}".encode()).hexdigest()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._segments.get(entry.segment)
+        if keys is not None:
+            keys.remove(key)
+            if not keys:
+                del self._segments[entry.segment]
+        self._matrices.pop(entry.segment, None)
+
+    def _segment_matrix(self, segment: str) -> Tuple[List[str], Optional[np.ndarray]]:
+        cached = self._matrices.get(segment)
+        if cached is None:
+            keys = list(self._segments.get(segment, []))
+            matrix = np.stack([self._entries[k].vector for k in keys]) if keys else None
+            cached = (keys, matrix)
+            self._matrices[segment] = cached
+        return cached
+
+    def get(self, segment: str, message: str) -> Optional[str]:
+        """Return a cached answer for this message within the segment, if any"""
+        if not self.enabled:
+            return None
+        normalized = normalize_message(message)
+        now = time.monotonic()
+
+        key = self._key(segment, normalized)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry.response
+            self._remove(key)
+
+        keys, matrix = self._segment_matrix(segment)
+        if matrix is not None:
+            similarities = matrix @ sketch(normalized)
+            guards = _guard_tokens(normalized.split())
+            for row in np.argsort(similarities)[::-1]:
+                if similarities[row] < self.similarity_threshold:
+                    break
+                candidate = self._entries[keys[row]]
+                if candidate.expires_at > now and candidate.guards == guards:
+                    self._entries.move_to_end(keys[row])
+                    self.stats["similar_hits"] += 1
+                    return candidate.response
+
+        self.stats["misses"] += 1
+        return None
+
+    def skip_personal(self):
+        """Count a turn that bypassed the cache because its prompt carried history"""
+        if self.enabled:
+            self.stats["personal_skips"] += 1
+
+    def put(self, segment: str, message: str, response: str):
+        if not self.enabled or not response:
+            return
+        normalized = normalize_message(message)
+        if not normalized:
+            return
+        key = self._key(segment, normalized)
+        self._remove(key)
+        self._entries[key] = _Entry(
+            segment,
+            response,
+            sketch(normalized),
+            _guard_tokens(normalized.split()),
+            time.monotonic() + self.ttl_seconds,
+        )
+        self._segments.setdefault(segment, []).append(key)
+        self._matrices.pop(segment, None)
+        self.stats["stores"] += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["exact_hits"] + self.stats["similar_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            **self.stats,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "segments": len(self._segments),
+        }
@@ -0,0 +1,138 @@
+"""
+Cache for AI restaurant analyses.
+
+An analysis depends only on the restaurant and four profile facets (diabetes
+type, health goals, food preferences, allergies), so it is cached in
+``db.restaurant_analysis_cache`` under ``place_id`` plus a hash of those
+normalized facets. Users in the same profile segment share one analysis.
+
+Each entry records a fingerprint of the restaurant fields the prompt uses;
+when the restaurant record changes the fingerprint no longer matches and the
+entry is treated as a miss and replaced. Entries expire through a TTL index,
+and concurrent misses for the same key share a single LLM call.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+PROFILE_FACETS = ["diabetes_type", "health_goals", "food_preferences", "allergies"]
+RESTAURANT_FIELDS = ["name", "address", "rating", "cuisine_types"]
+
+
+def normalize_profile_facets(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """The profile fields an analysis depends on, order- and case-insensitive"""
+    facets = {"diabetes_type": str(profile.get("diabetes_type") or "").strip().lower()}
+    for facet in PROFILE_FACETS[1:]:
+        facets[facet] = sorted({str(v).strip().lower() for v in profile.get(facet) or [] if str(v).strip()})
+    return facets
+
+
+def _digest(data: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+def profile_hash(profile: Dict[str, Any]) -> str:
+    return _digest(normalize_profile_facets(profile))
+
+
+def restaurant_fingerprint(restaurant: Dict[str, Any]) -> str:
+    return _digest({field: restaurant.get(field) for field in RESTAURANT_FIELDS})
+
+
+class RestaurantAnalysisCache:
+    """TTL'd, single-flight cache of restaurant analyses per profile segment"""
+
+    def __init__(self, db, ttl_seconds: int = 7 * 86400):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidated": 0, "shared": 0}
+
+    async def ensure_indexes(self):
+        await self.db.restaurant_analysis_cache.create_index([("place_id", 1), ("profile_hash", 1)], unique=True)
+        await self.db.restaurant_analysis_cache.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(
+        self,
+        restaurant: Dict[str, Any],
+        profile: Dict[str, Any],
+        analyze: Callable[[], Awaitable[str]],
+    ) -> str:
+        """Return the analysis for a restaurant and profile, running ``analyze`` on a miss"""
+        place_id = restaurant["place_id"]
+        segment = profile_hash(profile)
+        fingerprint = restaurant_fingerprint(restaurant)
+
+        entry = await self.db.restaurant_analysis_cache.find_one(
+            {"place_id": place_id, "profile_hash": segment},
+            {"_id": 0, "analysis": 1, "restaurant_fingerprint": 1, "expires_at": 1}
+        )
+        if entry:
+            expires_at = entry.get("expires_at")
+            if expires_at and expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if entry.get("restaurant_fingerprint") != fingerprint:
+                self.stats["invalidated"] += 1
+            elif expires_at and expires_at > datetime.now(timezone.utc):
+                # The TTL monitor only runs once a minute, so check expiry here too
+                self.stats["hits"] += 1
+                return entry["analysis"]
+
+        self.stats["misses"] += 1
+        key = f"{place_id}|{segment}|{fingerprint}"
+        task = self._inflight.get(key)
+        if task:
+            self.stats["shared"] += 1
+        else:
+            # A shared task rather than the first caller's coroutine: cancelling one caller
+            # (client disconnect, timeout) must not leave the others waiting forever
+            task = asyncio.create_task(self._analyze(place_id, segment, fingerprint, analyze))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    async def _analyze(self, place_id: str, segment: str, fingerprint: str, analyze: Callable[[], Awaitable[str]]) -> str:
+        analysis = await analyze()
+        await self._store(place_id, segment, fingerprint, analysis)
+        return analysis
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark retrieved so a failure nobody waited for doesn't log "never retrieved"
+            task.exception()
+
+    async def _store(self, place_id: str, segment: str, fingerprint: str, analysis: str):
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.restaurant_analysis_cache.replace_one(
+                {"place_id": place_id, "profile_hash": segment},
+                {
+                    "place_id": place_id,
+                    "profile_hash": segment,
+                    "restaurant_fingerprint": fingerprint,
+                    "analysis": analysis,
+                    "cached_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Restaurant analysis cache write error: {e}")
+
+    async def invalidate(self, place_ids: List[str]) -> int:
+        """Drop every cached analysis for the given restaurants"""
+        result = await self.db.restaurant_analysis_cache.delete_many({"place_id": {"$in": place_ids}})
+        return result.deleted_count
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "lookups": lookups,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
@@ -7,17 +7,21 @@ ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Header, Form
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import logging
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 import httpx
 import json
 import asyncio
+import time
 import phonenumbers
 from phonenumbers import NumberParseException
 
@@ -27,15 +31,96 @@ from models import (
     UserRegistrationResponse, SUBSCRIPTION_PLANS, DataExportRequest, DataDeletionRequest
 )
 from database import db_manager
-from auth import AuthService, TenantMiddleware, get_current_user, get_current_active_user, get_premium_user, TrialManager
+from auth import AuthService, TenantMiddleware, get_current_user, get_current_active_user, get_premium_user, get_optional_user, TrialManager
 from payment_service import payment_service
 from admin_service import admin_service
+from food_index import food_index
+from food_suggest import FoodSuggester
+from usda_nutrients import parse_food, REQUESTED_NUTRIENT_NUMBERS
+from resilience import upstream_policies, get_upstream_metrics, CircuitOpenError
+from diabetic_scoring import restaurant_scorer, FOOD_RATING_VERSION
+from nutrition_analytics import food_analytics_records
+from rescoring import RescoringJob
+from nutrition_cache import NutritionSearchCache, NutritionDetailCache, normalize_query
+from llm_streaming import SSE_HEADERS, relay_completion, replay_text, sse_event
+from llm_gateway import llm_gateway
+from llm_usage import llm_usage
+from llm_scheduler import llm_scheduler, LLMOverloadedError
+from restaurant_analysis_cache import RestaurantAnalysisCache, restaurant_fingerprint
+from places_cache import PlacesCache
+from cache_warmer import CacheWarmer, parse_hours
+from response_cache import ResponseCache, chat_segment
+from conversation_context import ConversationContextBuilder
+from shopping_list_jobs import ShoppingListJobs, TERMINAL_STATUSES
+from shopping_list_engine import SHOPPING_LIST_SCHEMA, build_shopping_list_items, consolidate_items, with_merge_fields
+from shopping_list_patch import build_item_update, validate_operations, backfill_list_items, backfill_list_tenants
+from shopping_list_view import consolidated_pipeline, format_consolidated
+from meal_plan_generator import DAY_SCHEMA, MealPlanGenerator, ingredient_matches
+from meal_optimizer import MealOptimizer, DEFAULT_MEAL_TARGETS, describe_meal
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Query-level cache for nutrition searches
+nutrition_search_cache = NutritionSearchCache(
+    db,
+    ttl_seconds=int(os.environ.get('NUTRITION_SEARCH_CACHE_TTL', 7 * 86400))
+)
+
+# Background job that refreshes stored scores after scoring rules change
+rescoring_job = RescoringJob(db)
+
+# Per-food detail cache (TTL refresh, negative entries for unknown fdc_ids)
+nutrition_detail_cache = NutritionDetailCache(
+    db,
+    ttl_seconds=int(os.environ.get('NUTRITION_DETAIL_CACHE_TTL', 30 * 86400)),
+    negative_ttl_seconds=int(os.environ.get('NUTRITION_NEGATIVE_CACHE_TTL', 600))
+)
+
+# In-memory, popularity-ranked autocomplete over food descriptions
+food_suggester = FoodSuggester(
+    db,
+    food_index,
+    refresh_seconds=float(os.environ.get('FOOD_SUGGEST_REFRESH_SECONDS', 60))
+)
+
+# AI restaurant analyses shared per restaurant and profile segment
+restaurant_analysis_cache = RestaurantAnalysisCache(
+    db,
+    ttl_seconds=int(os.environ.get('RESTAURANT_ANALYSIS_CACHE_TTL', 7 * 86400))
+)
+
+# Geocode and nearby-search cache that records per-location demand for warming
+places_cache = PlacesCache(
+    db,
+    search_ttl_seconds=int(os.environ.get('PLACES_SEARCH_CACHE_TTL', 86400)),
+    geocode_ttl_seconds=int(os.environ.get('GEOCODE_CACHE_TTL', 30 * 86400)),
+    tile_degrees=float(os.environ.get('PLACES_SEARCH_TILE_DEGREES', 0.005))
+)
+
+# Opt-in exact + similarity cache of health-coach answers per profile segment
+response_cache = ResponseCache(
+    enabled=os.environ.get('CHAT_RESPONSE_CACHE', 'false').lower() == 'true',
+    similarity_threshold=float(os.environ.get('CHAT_RESPONSE_CACHE_SIMILARITY', 0.9)),
+    ttl_seconds=int(os.environ.get('CHAT_RESPONSE_CACHE_TTL', 86400)),
+    max_entries=int(os.environ.get('CHAT_RESPONSE_CACHE_SIZE', 5000))
+)
+
+# Budgeted chat history: recent turns verbatim, older ones folded into a stored summary
+conversation_context = ConversationContextBuilder(
+    db,
+    summarize=lambda prompt, tenant_id: llm_gateway.complete(prompt, session_id="chat_summary", tenant_id=tenant_id, tier="background", endpoint="chat_summary"),
+    max_recent_turns=int(os.environ.get('CHAT_CONTEXT_RECENT_TURNS', 8))
+)
+CHAT_CONTEXT_MAX_TURNS = 50  # Unsummarized turns loaded per request
+
+# Background shopping list generation, de-duplicated by meal plan content
+shopping_list_jobs = ShoppingListJobs(db)
+SHOPPING_LIST_JOB_QUEUE_DEADLINE = 120  # Background jobs can wait longer for an LLM slot than requests
+SHOPPING_LIST_STRUCTURED_OUTPUT = os.environ.get('SHOPPING_LIST_STRUCTURED_OUTPUT', 'true').lower() == 'true'
+
 # Demo Mode Configuration
 DEMO_MODE = os.environ.get('DEMO_MODE', 'true').lower() == 'true'
 LAUNCH_DATE = os.environ.get('LAUNCH_DATE', '2025-02-01')  # Set your launch date
@@ -59,10 +144,56 @@ async def startup_event():
         except ValueError:
             logging.info("Admin user already exists")
         
+        await nutrition_search_cache.ensure_indexes()
+        await nutrition_detail_cache.ensure_indexes()
+        await restaurant_analysis_cache.ensure_indexes()
+        await places_cache.ensure_indexes()
+        await cache_warmer.ensure_indexes()
+        await food_suggester.ensure_indexes()
+        await conversation_context.ensure_indexes()
+        await shopping_list_jobs.ensure_indexes()
+        await backfill_list_items(db)
+        await backfill_list_tenants(db)
+        await restaurant_scorer.load(db)
+        rescoring_job.start()
+        await llm_gateway.start()
+        llm_usage.start(db_manager.increment_api_usage)
+        
+        # Load the offline USDA FoodData Central index if one has been built
+        fdc_index_path = os.environ.get('FDC_INDEX_PATH')
+        if fdc_index_path and os.path.exists(fdc_index_path):
+            food_index.load(fdc_index_path)
+        food_suggester.start()
+        cache_warmer.start()
+        
         logging.info("GlucoPlanner SaaS started successfully")
     except Exception as e:
         logging.error(f"Startup error: {e}")
 
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Fail fast with 503 while an upstream's circuit breaker is open"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{exc.upstream} is temporarily unavailable, please retry shortly"},
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))}
+    )
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloadedError):
+    """Shed LLM requests with 429 when the scheduler can't admit them in time"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "The AI coach is busy right now, please retry shortly"},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))}
+    )
+
+def llm_priority(current_user: Optional[dict], user_id: Optional[str] = None) -> Dict[str, str]:
+    """Scheduler tenant and tier for an LLM call, from the JWT when there is one"""
+    if current_user:
+        return {"tenant_id": current_user.get("tenant_id") or "default", "tier": current_user.get("subscription_tier") or "basic"}
+    return {"tenant_id": f"user:{user_id}" if user_id else "default", "tier": "basic"}
+
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -117,7 +248,8 @@ When users ask about restaurants or specific foods, provide detailed analysis in
 SHOPPING LIST FEATURE:
 When providing meal plans, always offer to create a shopping list. If the user agrees, organize the shopping list by store sections using imperial measurements:
 - Fresh Produce (e.g., "2 lbs broccoli", "1 lb carrots")
-- Proteins (Meat/Fish/Dairy) (e.g., "1 lb chicken breast", "8 oz salmon filets")
+- Proteins (Meat/Fish) (e.g., "1 lb chicken breast", "8 oz salmon filets")
+- Dairy (e.g., "1/2 gallon milk", "16 oz plain Greek yogurt")
 - Pantry Items (e.g., "1 lb brown rice", "16 oz olive oil")
 - Frozen Foods (e.g., "1 lb frozen berries")
 - Other Items
@@ -225,6 +357,7 @@ class Restaurant(BaseModel):
     opening_hours: Optional[Dict[str, Any]] = None
     photos: List[str] = []
     diabetic_friendly_score: Optional[float] = None
+    scoring_version: Optional[int] = None  # Scoring rules version that produced the score
     cached_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class FoodNutrition(BaseModel):
@@ -242,9 +375,21 @@ class FoodNutrition(BaseModel):
     fat: Optional[float] = None  # grams
     sodium: Optional[float] = None  # mg
     glycemic_index: Optional[int] = None
+    net_carbs: Optional[float] = None  # grams per 100g (carbohydrates - fiber)
+    glycemic_load: Optional[float] = None  # per 100g serving
     diabetic_rating: Optional[str] = None  # "excellent", "good", "moderate", "caution"
+    rating_version: Optional[int] = None  # Rating rules version that produced diabetic_rating
     cached_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class NutritionBatchItem(BaseModel):
+    fdc_id: Optional[str] = None  # USDA FoodData Central ID
+    query: Optional[str] = None  # Free-text ingredient, used when fdc_id is not given
+    quantity: float = 1.0
+    unit: str = "serving"  # "serving" (USDA 100g reference), "g", "oz", "lb", "kg"
+
+class NutritionBatchRequest(BaseModel):
+    items: List[NutritionBatchItem]
+
 class RestaurantAnalysisRequest(BaseModel):
     user_id: str
     restaurant_place_id: str
@@ -258,9 +403,25 @@ class MealPlan(BaseModel):
     meals: List[dict]  # Flexible structure for meals
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class MealOptimizeRequest(BaseModel):
+    user_id: Optional[str] = None  # adds the profile's allergies and dislikes
+    net_carbs: float = DEFAULT_MEAL_TARGETS["net_carbs"]  # grams per meal
+    fiber: float = DEFAULT_MEAL_TARGETS["fiber"]  # minimum grams per meal
+    calories: float = DEFAULT_MEAL_TARGETS["calories"]
+    allergies: List[str] = []
+    dislikes: List[str] = []
+    alternatives: int = 3
+
+class MealPlanGenerateRequest(BaseModel):
+    user_id: str
+    days: int = 7
+    daily_net_carbs: Optional[float] = None  # grams; defaults by diabetes type
+    title: Optional[str] = None
+
 class ShoppingListItem(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     item: str
-    category: str  # "produce", "proteins", "pantry", "frozen", "other"
+    category: str  # "produce", "proteins", "dairy", "pantry", "frozen", "other"
     quantity: Optional[str] = None
     checked: bool = False
 
@@ -270,6 +431,8 @@ class ShoppingList(BaseModel):
     title: str
     items: List[ShoppingListItem] = []
     meal_plan_reference: Optional[str] = None  # Reference to related meal plan
+    tenant_id: Optional[str] = None  # Set when created by an authenticated user
+    version: int = 1  # Bumped on every update, for optimistic concurrency
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ShoppingListCreate(BaseModel):
@@ -281,6 +444,21 @@ class ShoppingListCreate(BaseModel):
 class ShoppingListUpdate(BaseModel):
     title: Optional[str] = None
     items: Optional[List[ShoppingListItem]] = None
+    version: Optional[int] = None  # Reject the update with 409 unless the list is still at this version
+
+class ShoppingListItemOperation(BaseModel):
+    op: str  # "check", "uncheck", "add", "remove", "reorder"
+    item_id: Optional[str] = None  # check, uncheck, remove
+    item: Optional[str] = None  # add: item text, e.g. "2 lbs chicken breast"
+    quantity: Optional[str] = None  # add
+    category: Optional[str] = None  # add; inferred from the name when omitted
+    position: Optional[int] = None  # add: insert index (default: append)
+    item_ids: Optional[List[str]] = None  # reorder: these items first, in this order
+
+class ShoppingListPatch(BaseModel):
+    operations: List[ShoppingListItemOperation] = []
+    title: Optional[str] = None
+    version: Optional[int] = None  # Reject the patch with 409 unless the list is still at this version
 
 class SMSMessage(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -437,6 +615,7 @@ class GooglePlacesClient:
         self.geocoding_url = "https://maps.googleapis.com/maps/api/geocode"
         self.monthly_limit = 9000  # Set monthly limit to 9,000 calls
         self.daily_limit = 300     # Approximately 9,000 / 30 days
+        self.policy = upstream_policies['google_places']
         
     async def geocode_location(self, location: str):
         """Convert location string to coordinates using Google Geocoding API"""
@@ -452,7 +631,7 @@ class GooglePlacesClient:
             logging.error("Empty location provided for geocoding")
             return None
             
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(timeout=self.policy.http_timeout()) as client:
             params = {
                 'address': location,
                 'key': self.api_key
@@ -460,12 +639,9 @@ class GooglePlacesClient:
             
             try:
                 logging.info(f"Making Google Geocoding API request for: '{location}'")
-                response = await client.get(f"{self.geocoding_url}/json", params=params)
+                response = await self._billed_get(client, f"{self.geocoding_url}/json", params)
                 response.raise_for_status()
                 
-                # Increment usage counter for geocoding call
-                await self._increment_usage()
-                
                 data = response.json()
                 logging.info(f"Geocoding API response status: {data.get('status')}")
                 
@@ -487,6 +663,8 @@ class GooglePlacesClient:
                     logging.error(f"Geocoding failed for '{location}': {data.get('status')} - {error_msg}")
                     return None
                     
+            except CircuitOpenError:
+                raise
             except Exception as e:
                 logging.error(f"Geocoding API error for '{location}': {e}")
                 return None
@@ -529,20 +707,35 @@ class GooglePlacesClient:
             logging.error(f"Error checking API usage: {e}")
             return True, "Usage check failed, proceeding"
     
-    async def _increment_usage(self):
+    async def _increment_usage(self, calls: int = 1):
         """Increment API usage counter"""
         try:
             current_month = datetime.now(timezone.utc).strftime("%Y-%m")
             await db.api_usage.update_one(
                 {"api": "google_places", "month": current_month},
                 {
-                    "$inc": {"calls_made": 1},
+                    "$inc": {"calls_made": calls},
                     "$set": {"last_updated": datetime.now(timezone.utc).isoformat()}
                 },
                 upsert=True
             )
         except Exception as e:
             logging.error(f"Error incrementing API usage: {e}")
+    
+    async def _billed_get(self, client: httpx.AsyncClient, url: str, params: Dict[str, Any]) -> httpx.Response:
+        """GET under the Places policy, counting every request sent (retries are billed too)"""
+        requests_sent = 0
+        
+        async def request():
+            nonlocal requests_sent
+            requests_sent += 1
+            return await client.get(url, params=params)
+        
+        try:
+            return await self.policy.call(request)
+        finally:
+            if requests_sent:
+                await self._increment_usage(requests_sent)
         
     async def search_restaurants(self, latitude: float, longitude: float, radius: int = 2000, keyword: str = None):
         """Search for restaurants using Google Places API with rate limiting"""
@@ -552,7 +745,7 @@ class GooglePlacesClient:
             logging.error(f"API limit exceeded: {usage_message}")
             return []
         
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(timeout=self.policy.http_timeout()) as client:
             # Nearby search for restaurants
             params = {
                 'location': f"{latitude},{longitude}",
@@ -568,12 +761,9 @@ class GooglePlacesClient:
             
             try:
                 logging.info(f"Making Google Places API request. {usage_message}")
-                response = await client.get(f"{self.base_url}/nearbysearch/json", params=params)
+                response = await self._billed_get(client, f"{self.base_url}/nearbysearch/json", params)
                 response.raise_for_status()
                 
-                # Increment usage counter
-                await self._increment_usage()
-                
                 data = response.json()
                 
                 logging.info(f"Google Places API response status: {data.get('status')}")
@@ -581,14 +771,19 @@ class GooglePlacesClient:
                     logging.error(f"Google Places API error: {data.get('error_message', data.get('status'))}")
                     return []
                 
+                places = data.get('results', [])[:10]  # Limit to 10 results
+                scores = restaurant_scorer.score_many(places)
+                
                 restaurants = []
-                for place in data.get('results', [])[:10]:  # Limit to 10 results
-                    restaurant = await self._parse_place_data(place)
+                for place, score in zip(places, scores):
+                    restaurant = await self._parse_place_data(place, diabetic_score=float(score))
                     if restaurant:
                         restaurants.append(restaurant)
                 
                 logging.info(f"Successfully parsed {len(restaurants)} restaurants")
                 return restaurants
+            except CircuitOpenError:
+                raise
             except Exception as e:
                 logging.error(f"Google Places API error: {e}")
                 return []
@@ -601,7 +796,7 @@ class GooglePlacesClient:
             logging.error(f"API limit exceeded: {usage_message}")
             return None
             
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(timeout=self.policy.http_timeout()) as client:
             params = {
                 'place_id': place_id,
                 'fields': 'name,formatted_address,geometry,rating,price_level,formatted_phone_number,website,opening_hours,photos,reviews',
@@ -610,28 +805,28 @@ class GooglePlacesClient:
             
             try:
                 logging.info(f"Making Google Places Details API request. {usage_message}")
-                response = await client.get(f"{self.base_url}/details/json", params=params)
+                response = await self._billed_get(client, f"{self.base_url}/details/json", params)
                 response.raise_for_status()
                 
-                # Increment usage counter
-                await self._increment_usage()
-                
                 data = response.json()
                 
                 if data.get('status') == 'OK':
                     return await self._parse_place_details(data['result'])
                 return None
+            except CircuitOpenError:
+                raise
             except Exception as e:
                 logging.error(f"Google Places Details API error: {e}")
                 return None
     
-    async def _parse_place_data(self, place_data):
+    async def _parse_place_data(self, place_data, diabetic_score=None):
         """Parse basic place data from search results"""
         try:
             location = place_data.get('geometry', {}).get('location', {})
             
             # Calculate diabetic-friendly score based on keywords and rating
-            diabetic_score = self._calculate_diabetic_score(place_data)
+            if diabetic_score is None:
+                diabetic_score = self._calculate_diabetic_score(place_data)
             
             return Restaurant(
                 place_id=place_data.get('place_id', ''),
@@ -642,7 +837,8 @@ class GooglePlacesClient:
                 rating=place_data.get('rating'),
                 price_level=place_data.get('price_level'),
                 cuisine_types=place_data.get('types', []),
-                diabetic_friendly_score=diabetic_score
+                diabetic_friendly_score=diabetic_score,
+                scoring_version=restaurant_scorer.version
             )
         except Exception as e:
             logging.error(f"Error parsing place data: {e}")
@@ -673,68 +869,43 @@ class GooglePlacesClient:
                 website=place_details.get('website'),
                 opening_hours=place_details.get('opening_hours'),
                 photos=photos,
-                diabetic_friendly_score=diabetic_score
+                diabetic_friendly_score=diabetic_score,
+                scoring_version=restaurant_scorer.version
             )
         except Exception as e:
             logging.error(f"Error parsing place details: {e}")
             return None
     
     def _calculate_diabetic_score(self, place_data):
-        """Calculate how diabetic-friendly a restaurant might be"""
-        score = 3.0  # Base score out of 5
-        
-        name = place_data.get('name', '').lower()
-        types = [t.lower() for t in place_data.get('types', [])]
-        
-        # Positive indicators
-        healthy_keywords = ['salad', 'grill', 'fresh', 'organic', 'healthy', 'mediterranean', 'vegetarian', 'bowl']
-        for keyword in healthy_keywords:
-            if keyword in name:
-                score += 0.5
-        
-        # Restaurant types that are generally better for diabetics
-        good_types = ['meal_takeaway', 'health', 'vegetarian_restaurant']
-        for rtype in good_types:
-            if rtype in types:
-                score += 0.3
-        
-        # Negative indicators
-        fast_food_keywords = ['mcdonald', 'burger', 'pizza', 'kfc', 'taco bell', 'subway']
-        for keyword in fast_food_keywords:
-            if keyword in name:
-                score -= 1.0
-        
-        # Fast food types
-        fast_food_types = ['meal_delivery', 'meal_takeaway']
-        if any(t in types for t in fast_food_types) and 'healthy' not in name:
-            score -= 0.5
-        
-        # Factor in rating
-        rating = place_data.get('rating', 0)
-        if rating >= 4.0:
-            score += 0.3
-        elif rating >= 3.5:
-            score += 0.1
-        
-        return max(1.0, min(5.0, score))  # Keep between 1-5
+        """Calculate how diabetic-friendly a restaurant might be (see diabetic_scoring)"""
+        return restaurant_scorer.score(place_data)
 
 # USDA FoodData Central API Client
 class USDANutritionClient:
     def __init__(self):
         self.base_url = "https://api.nal.usda.gov/fdc/v1"
         self.api_key = os.environ.get('USDA_API_KEY')
-        
-    async def search_food(self, query: str):
-        """Search for food items in USDA database"""
-        async with httpx.AsyncClient() as client:
+        self.bulk_batch_size = 20  # Max fdcIds per POST /foods call
+        self.policy = upstream_policies['usda']
+        
+    async def search_food(self, query: str, page_size: int = 5):
+        """Search for food items, answering from the local FDC index when it matches every query term"""
+        if food_index.loaded:
+            # A partial local match ("egg salad sandwich" -> raw egg) is worse than asking USDA
+            local_foods = food_index.search(query, limit=page_size, require_all=True)
+            if local_foods:
+                return apply_food_analytics([self._food_from_index(record) for record in local_foods])
+        
+        # Fall back to the USDA API for foods missing from the local dump
+        async with httpx.AsyncClient(timeout=self.policy.http_timeout()) as client:
             params = {
                 'query': query,
-                'pageSize': 5,
+                'pageSize': page_size,
                 'api_key': self.api_key
             }
             
             try:
-                response = await client.get(f"{self.base_url}/foods/search", params=params)
+                response = await self.policy.call(lambda: client.get(f"{self.base_url}/foods/search", params=params))
                 response.raise_for_status()
                 data = response.json()
                 
@@ -744,85 +915,130 @@ class USDANutritionClient:
                     if nutrition:
                         foods.append(nutrition)
                 
-                return foods
+                return apply_food_analytics(foods)
+            except CircuitOpenError:
+                raise
             except Exception as e:
                 logging.error(f"USDA API error: {e}")
                 return []
     
     async def get_food_details(self, fdc_id: str):
         """Get detailed nutrition information for a specific food"""
-        async with httpx.AsyncClient() as client:
+        local_record = food_index.get(fdc_id)
+        if local_record:
+            return apply_food_analytics([self._food_from_index(local_record)])[0]
+        
+        async with httpx.AsyncClient(timeout=self.policy.http_timeout()) as client:
             params = {
                 'api_key': self.api_key
             }
             
             try:
-                response = await client.get(f"{self.base_url}/food/{fdc_id}", params=params)
+                response = await self.policy.call(lambda: client.get(f"{self.base_url}/food/{fdc_id}", params=params))
+                if response.status_code == 404:
+                    logging.info(f"USDA food not found: {fdc_id}")
+                    return None
                 response.raise_for_status()
                 food_data = response.json()
                 
-                return await self._parse_food_data(food_data)
+                food = await self._parse_food_data(food_data)
+                return apply_food_analytics([food])[0] if food else None
             except Exception as e:
+                # Upstream failures propagate so callers don't mistake them for a missing food
                 logging.error(f"USDA Food Details API error: {e}")
-                return None
+                raise
+    
+    async def get_food_details_batch(self, fdc_ids: List[str]):
+        """Get nutrition for several foods, using the bulk /foods endpoint for IDs not in the local index
+        
+        Returns a dict of fdc_id -> FoodNutrition; IDs USDA doesn't know are omitted.
+        """
+        foods = {}
+        remote_ids = []
+        for fdc_id in dict.fromkeys(str(i) for i in fdc_ids):
+            local_record = food_index.get(fdc_id)
+            if local_record:
+                foods[fdc_id] = self._food_from_index(local_record)
+            elif fdc_id.isdigit():
+                remote_ids.append(fdc_id)
+        
+        if not remote_ids:
+            apply_food_analytics(list(foods.values()))
+            return foods
+        
+        async with httpx.AsyncClient(timeout=self.policy.http_timeout()) as client:
+            async def fetch_chunk(chunk):
+                # POST /foods is a read, so it is safe to retry
+                response = await self.policy.call(lambda: client.post(
+                    f"{self.base_url}/foods",
+                    params={'api_key': self.api_key},
+                    json={
+                        'fdcIds': [int(fdc_id) for fdc_id in chunk],
+                        'format': 'full',
+                        'nutrients': REQUESTED_NUTRIENT_NUMBERS
+                    }
+                ))
+                response.raise_for_status()
+                return response.json()
+            
+            chunks = [remote_ids[i:i + self.bulk_batch_size] for i in range(0, len(remote_ids), self.bulk_batch_size)]
+            try:
+                results = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+            except Exception as e:
+                logging.error(f"USDA bulk foods API error: {e}")
+                raise
+        
+        for food_list in results:
+            for food_data in food_list:
+                nutrition = await self._parse_food_data(food_data)
+                if nutrition:
+                    foods[nutrition.fdc_id] = nutrition
+        
+        apply_food_analytics(list(foods.values()))
+        return foods
     
     async def _parse_food_data(self, food_data):
-        """Parse USDA food data into our nutrition model"""
+        """Parse USDA food data (search, detail or bulk payloads) into our nutrition model"""
         try:
-            nutrients = {}
-            for nutrient in food_data.get('foodNutrients', []):
-                nutrient_name = nutrient.get('nutrientName', '').lower()
-                nutrient_value = nutrient.get('value', 0)
-                
-                if 'carbohydrate' in nutrient_name:
-                    nutrients['carbohydrates'] = nutrient_value
-                elif 'sugars' in nutrient_name and 'added' not in nutrient_name:
-                    nutrients['sugars'] = nutrient_value
-                elif 'fiber' in nutrient_name:
-                    nutrients['fiber'] = nutrient_value
-                elif 'protein' in nutrient_name:
-                    nutrients['protein'] = nutrient_value
-                elif 'fat' in nutrient_name and 'total' in nutrient_name:
-                    nutrients['fat'] = nutrient_value
-                elif 'sodium' in nutrient_name:
-                    nutrients['sodium'] = nutrient_value
-                elif 'energy' in nutrient_name or 'calories' in nutrient_name:
-                    nutrients['calories'] = nutrient_value
-            
-            # Calculate diabetic rating
-            diabetic_rating = self._calculate_diabetic_rating(nutrients)
-            
+            food = parse_food(food_data)
             return FoodNutrition(
-                food_name=food_data.get('description', ''),
-                fdc_id=str(food_data.get('fdcId', '')),
-                description=food_data.get('description', ''),
-                brand_name=food_data.get('brandOwner'),
+                food_name=food['description'],
+                fdc_id=str(food['fdc_id'] or ''),
+                description=food['description'],
+                brand_name=food['brand_name'],
                 serving_size="3.5 oz (100g)",  # USDA data is per 100g, convert to imperial reference
-                **nutrients,
-                diabetic_rating=diabetic_rating
+                **food['nutrients']
             )
         except Exception as e:
             logging.error(f"Error parsing USDA food data: {e}")
             return None
     
-    def _calculate_diabetic_rating(self, nutrients):
-        """Calculate diabetic appropriateness rating"""
-        carbs = nutrients.get('carbohydrates', 0)
-        fiber = nutrients.get('fiber', 0)
-        sugars = nutrients.get('sugars', 0)
-        
-        # Net carbs calculation
-        net_carbs = carbs - fiber if fiber else carbs
-        
-        # Rating based on net carbs and sugar content
-        if net_carbs <= 5 and sugars <= 2:
-            return "excellent"
-        elif net_carbs <= 10 and sugars <= 5:
-            return "good"
-        elif net_carbs <= 20 and sugars <= 10:
-            return "moderate"
-        else:
-            return "caution"
+    def _food_from_index(self, record):
+        """Build a FoodNutrition from a local FDC index record"""
+        nutrients = {k: v for k, v in record.items() if k not in ('fdc_id', 'description', 'brand_name') and v is not None}
+        return FoodNutrition(
+            food_name=record['description'],
+            fdc_id=record['fdc_id'],
+            description=record['description'],
+            brand_name=record.get('brand_name'),
+            serving_size="3.5 oz (100g)",  # FDC bulk data is per 100g
+            **nutrients
+        )
+
+def apply_food_analytics(foods: List[FoodNutrition]) -> List[FoodNutrition]:
+    """Fill net carbs, glycemic index/load and diabetic rating for a list of foods in one pass
+
+    GI is always looked up afresh from the description: no upstream supplies
+    it, so a stored value is only an older lookup.
+    """
+    records = food_analytics_records([food.dict(include={'description', 'food_name', 'carbohydrates', 'fiber', 'sugars'}) for food in foods])
+    for food, record in zip(foods, records):
+        food.net_carbs = record['net_carbs']
+        food.glycemic_index = record['glycemic_index']
+        food.glycemic_load = record['glycemic_load']
+        food.diabetic_rating = record['diabetic_rating']
+        food.rating_version = FOOD_RATING_VERSION
+    return foods
 
 # Initialize API clients
 google_places = GooglePlacesClient()
@@ -1113,6 +1329,70 @@ async def get_admin_revenue_analytics(days: int = 30):
         logging.error(f"Admin revenue analytics error: {e}")
         raise HTTPException(status_code=500, detail="Failed to get revenue analytics")
 
+@api_router.get("/admin/scoring/restaurants")
+async def get_restaurant_scoring_config():
+    """Get the active restaurant diabetic-friendliness scoring table"""
+    return restaurant_scorer.config
+
+@api_router.put("/admin/scoring/restaurants")
+async def update_restaurant_scoring_config(config: dict):
+    """Replace the restaurant scoring table (missing keys keep their defaults)"""
+    try:
+        saved_config = await restaurant_scorer.save(db, config)
+        if not rescoring_job.start(follow_up=True):
+            logging.info("Rescoring already running; queued another run for the new scoring version")
+        return saved_config
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid scoring config: {str(e)}")
+    except Exception as e:
+        logging.error(f"Scoring config update error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update scoring config")
+
+@api_router.post("/admin/scoring/rescore")
+async def start_rescoring():
+    """Re-score cached restaurants and foods that were scored by older rules"""
+    started = rescoring_job.start()
+    return {"started": started, "status": rescoring_job.status}
+
+@api_router.get("/admin/scoring/rescore")
+async def get_rescoring_status():
+    """Get progress of the most recent rescoring job"""
+    return rescoring_job.status
+
+@api_router.get("/admin/cache-warming")
+async def get_cache_warming_stats():
+    """Cache warmer budget and runs, with hit and warm-hit ratios of the warmed caches"""
+    detail_stats = nutrition_detail_cache.get_stats()
+    return {
+        "warmer": await cache_warmer.get_stats(),
+        "places": places_cache.get_stats(),
+        "foods": {key: detail_stats[key] for key in ("lookups", "hit_rate", "warm_hits", "warm_hit_rate")}
+    }
+
+@api_router.post("/admin/cache-warming/run")
+async def run_cache_warming():
+    """Run a warming pass now, outside the off-peak window (still within the Places budget)"""
+    return await cache_warmer.run_once(force=True)
+
+@api_router.get("/admin/llm-usage")
+async def get_llm_usage(group_by: str = "tenant", sort_by: str = "cost_usd", limit: int = 20):
+    """Top LLM consumers by tenant, endpoint, model or tenant_endpoint
+
+    sort_by: cost_usd, calls_made, prompt_tokens, completion_tokens, latency_ms_total or errors
+    """
+    if group_by not in ("tenant", "endpoint", "model", "tenant_endpoint"):
+        raise HTTPException(status_code=400, detail="group_by must be tenant, endpoint, model or tenant_endpoint")
+    if sort_by not in ("cost_usd", "calls_made", "prompt_tokens", "completion_tokens", "latency_ms_total", "errors"):
+        raise HTTPException(status_code=400, detail="Unsupported sort_by field")
+    try:
+        # Include counters still waiting for the periodic flush
+        await llm_usage.flush()
+        consumers = await db_manager.get_top_api_consumers("llm:", group_by, sort_by, min(max(limit, 1), 200))
+        return {"group_by": group_by, "sort_by": sort_by, "consumers": consumers, "meter": llm_usage.get_stats()}
+    except Exception as e:
+        logging.error(f"LLM usage report error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get LLM usage")
+
 # =============================================
 # SAAS GDPR/HIPAA COMPLIANCE ENDPOINTS
 # =============================================
@@ -1176,6 +1456,65 @@ async def delete_user_data(
 # UPDATED GLUCOPLANNER ENDPOINTS (Now with Multi-Tenancy)
 # =============================================
 
+def build_saas_user_context(user) -> str:
+    """Profile block for the SaaS health coach prompt"""
+    return f"""
+        User Profile:
+        - Age: {user.age or 'Not specified'}
+        - Gender: {user.gender or 'Not specified'}  
+        - Diabetes Type: {user.diabetes_type or 'Not specified'}
+        - Activity Level: {user.activity_level or 'Not specified'}
+        - Health Goals: {', '.join(user.health_goals) if user.health_goals else 'Not specified'}
+        - Food Preferences: {', '.join(user.food_preferences) if user.food_preferences else 'Not specified'}
+        - Allergies: {', '.join(user.allergies) if user.allergies else 'None specified'}
+        - Cooking Skill: {user.cooking_skill or 'Not specified'}
+        """
+
+async def save_saas_chat_turn(user_id: str, tenant_id: str, user_message: str, ai_response: str):
+    """Append a chat turn to the user's latest session (tenant-isolated)"""
+    chat_data = {
+        "user_message": user_message,
+        "ai_response": ai_response,
+        "timestamp": datetime.utcnow()
+    }
+    
+    # Get or create chat session
+    chat_sessions = await db_manager.get_chat_sessions(user_id, tenant_id)
+    if chat_sessions:
+        # Update existing session
+        session = chat_sessions[0]
+        session.messages.append(chat_data)
+        await db_manager.update_chat_session(session.id, tenant_id, {"messages": session.messages})
+    else:
+        # Create new session
+        from models import ChatSession
+        new_session = ChatSession(
+            tenant_id=tenant_id,
+            user_id=user_id,
+            messages=[chat_data]
+        )
+        await db_manager.create_chat_session(new_session, tenant_id)
+
+async def build_saas_system_message(user, tenant_id: str, user_id: str, message: str) -> str:
+    """Coach prompt, profile and budgeted history for a SaaS chat turn"""
+    async def load_turns(since: str):
+        chat_sessions = await db_manager.get_chat_sessions(user_id, tenant_id)
+        turns = []
+        for turn in (chat_sessions[0].messages if chat_sessions else [])[-CHAT_CONTEXT_MAX_TURNS:]:
+            timestamp = turn.get("timestamp")
+            timestamp = timestamp.isoformat() if isinstance(timestamp, datetime) else str(timestamp or "")
+            if timestamp > since:
+                turns.append((turn.get("user_message", ""), turn.get("ai_response", ""), timestamp))
+        return turns
+    
+    return await conversation_context.build(
+        f"saas_{tenant_id}_{user_id}",
+        f"{HEALTH_COACH_PROMPT}\n\n{build_saas_user_context(user)}",
+        message,
+        load_turns,
+        tenant_id
+    )
+
 # Update the chat endpoint to support tenant isolation
 @api_router.post("/chat/send-saas")
 async def send_chat_message_saas(
@@ -1192,64 +1531,64 @@ async def send_chat_message_saas(
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Build context from user profile
-        user_context = f"""
-        User Profile:
-        - Age: {user.age or 'Not specified'}
-        - Gender: {user.gender or 'Not specified'}  
-        - Diabetes Type: {user.diabetes_type or 'Not specified'}
-        - Activity Level: {user.activity_level or 'Not specified'}
-        - Health Goals: {', '.join(user.health_goals) if user.health_goals else 'Not specified'}
-        - Food Preferences: {', '.join(user.food_preferences) if user.food_preferences else 'Not specified'}
-        - Allergies: {', '.join(user.allergies) if user.allergies else 'None specified'}
-        - Cooking Skill: {user.cooking_skill or 'Not specified'}
-        """
-        
-        # Create AI prompt
-        ai_prompt = f"""{HEALTH_COACH_PROMPT}
-        
-        {user_context}
-        
-        User Message: {message.get('message', '')}
-        """
+        # Build context from user profile and recent conversation
+        system_message = await build_saas_system_message(user, tenant_id, user_id, message.get('message', ''))
         
         # Call AI service
-        llm_chat = LlmChat(api_key=os.environ.get('EMERGENT_LLM_KEY'))
-        ai_response = await llm_chat.call_llm_async(
-            messages=[UserMessage(content=ai_prompt)],
-            model="gpt-4o-mini"
+        ai_response = await llm_gateway.complete(
+            message.get('message', ''),
+            system_message=system_message,
+            session_id=f"saas_chat_{tenant_id}_{user_id}",
+            endpoint="chat_saas",
+            **llm_priority(current_user)
         )
         
         # Save chat session (tenant-isolated)
-        chat_data = {
-            "user_message": message.get('message', ''),
-            "ai_response": ai_response,
-            "timestamp": datetime.utcnow()
-        }
-        
-        # Get or create chat session
-        chat_sessions = await db_manager.get_chat_sessions(user_id, tenant_id)
-        if chat_sessions:
-            # Update existing session
-            session = chat_sessions[0]
-            session.messages.append(chat_data)
-            await db_manager.update_chat_session(session.id, tenant_id, {"messages": session.messages})
-        else:
-            # Create new session
-            from models import ChatSession
-            new_session = ChatSession(
-                tenant_id=tenant_id,
-                user_id=user_id,
-                messages=[chat_data]
-            )
-            await db_manager.create_chat_session(new_session, tenant_id)
+        await save_saas_chat_turn(user_id, tenant_id, message.get('message', ''), ai_response)
         
         return {"response": ai_response}
         
+    except (CircuitOpenError, LLMOverloadedError):
+        raise
     except Exception as e:
         logging.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail="Failed to process chat message")
 
+@api_router.post("/chat/send-saas/stream")
+async def stream_chat_message_saas(
+    message: dict,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Stream the AI health coach reply as Server-Sent Events (tenant-isolated)"""
+    tenant_id = current_user["tenant_id"]
+    user_id = current_user["user_id"]
+    user_text = message.get('message', '')
+    
+    user = await db_manager.get_user_by_id(user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    system_message = await build_saas_system_message(user, tenant_id, user_id, user_text)
+    session_id = f"saas_chat_{tenant_id}_{user_id}"
+    
+    async def on_complete(ai_response: str) -> Dict[str, Any]:
+        await save_saas_chat_turn(user_id, tenant_id, user_text, ai_response)
+        return {"response": ai_response}
+    
+    # Admit before the response starts so an overloaded queue can still answer 429
+    ticket = await llm_scheduler.acquire(**llm_priority(current_user))
+    return StreamingResponse(
+        relay_completion(
+            lambda: llm_gateway.stream(user_text, system_message, session_id, tenant_id=tenant_id, endpoint="chat_saas_stream"),
+            on_complete,
+            ticket.release,
+            policy=upstream_policies["llm"]
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(ticket.release)
+    )
+
 @api_router.get("/chat/history-saas")
 async def get_chat_history_saas(current_user: dict = Depends(get_current_active_user)):
     """Get chat history (tenant-isolated SaaS version)"""
@@ -1307,28 +1646,110 @@ async def list_user_profiles():
     users = await db.user_profiles.find().to_list(1000)
     return [UserProfile(**parse_from_mongo(user)) for user in users]
 
+# Cached Places lookups
+async def geocode_cached(location: str, refreshed_by: str = "user"):
+    """Geocode through the Places cache; the warmer passes refreshed_by="warmer" to skip the read"""
+    key = places_cache.geocode_key(location)
+    if not key:
+        return None
+    if refreshed_by == "user":
+        cached = await places_cache.get("geocode", key)
+        if cached is not None:
+            return cached
+    
+    result = await google_places.geocode_location(location)
+    if result:
+        await places_cache.put("geocode", key, result, refreshed_by=refreshed_by, params={"location": location.strip()})
+    return result
+
+async def search_restaurants_cached(latitude: float, longitude: float, radius: int, keyword: Optional[str], refreshed_by: str = "user") -> List[Restaurant]:
+    """Nearby search through the tile cache (searches run from the caller's coordinates)"""
+    key, params = places_cache.search_tile(latitude, longitude, radius, keyword)
+    if refreshed_by == "user":
+        cached = await places_cache.get("search", key)
+        if cached is not None:
+            return [Restaurant(**parse_from_mongo(dict(restaurant))) for restaurant in cached]
+    
+    restaurants = await google_places.search_restaurants(
+        latitude=params["latitude"],
+        longitude=params["longitude"],
+        radius=radius,
+        keyword=params["keyword"]
+    )
+    
+    # Cache results in database
+    restaurants_data = [prepare_for_mongo(restaurant.dict()) for restaurant in restaurants]
+    for restaurant_data in restaurants_data:
+        await db.restaurants.replace_one(
+            {"place_id": restaurant_data["place_id"]},
+            restaurant_data,
+            upsert=True
+        )
+    # An empty result is usually a quota or upstream failure, not an empty area
+    if restaurants_data:
+        await places_cache.put("search", key, restaurants_data, refreshed_by=refreshed_by, params=params)
+    return restaurants
+
+async def refresh_restaurant(place_id: str, cached_restaurant: Optional[Dict[str, Any]] = None, refreshed_by: str = "user") -> Optional[Restaurant]:
+    """Fetch a restaurant's details from Places and update the cached copy"""
+    restaurant = await google_places.get_restaurant_details(place_id)
+    if not restaurant:
+        return None
+    
+    restaurant_data = prepare_for_mongo(restaurant.dict())
+    await db.restaurants.replace_one(
+        {"place_id": place_id},
+        restaurant_data,
+        upsert=True
+    )
+    if cached_restaurant and restaurant_fingerprint(cached_restaurant) != restaurant_fingerprint(restaurant_data):
+        await restaurant_analysis_cache.invalidate([place_id])
+    await places_cache.put("place", place_id, refreshed_by=refreshed_by)
+    return restaurant
+
+async def warm_places_entry(entry: Dict[str, Any]) -> bool:
+    """Refresh one popular Places cache entry for the cache warmer"""
+    params = entry.get("params") or {}
+    if entry["kind"] == "geocode":
+        return bool(params.get("location")) and await geocode_cached(params["location"], refreshed_by="warmer") is not None
+    if entry["kind"] == "search":
+        restaurants = await search_restaurants_cached(
+            params["latitude"], params["longitude"], params["radius"], params.get("keyword"), refreshed_by="warmer"
+        )
+        return bool(restaurants)
+    cached_restaurant = await db.restaurants.find_one({"place_id": entry["key"]}, {"_id": 0})
+    cached_restaurant = parse_from_mongo(cached_restaurant) if cached_restaurant else None
+    return await refresh_restaurant(entry["key"], cached_restaurant, refreshed_by="warmer") is not None
+
+# Off-peak refresh of popular search areas, places and foods
+cache_warmer = CacheWarmer(
+    db,
+    places_cache,
+    refresh_places_entry=warm_places_entry,
+    refresh_food=lambda fdc_id: nutrition_detail_cache.refresh(fdc_id, fetch_food_document),
+    places_available=lambda: google_places.policy.breaker.state == 'closed',
+    places_daily_limit=google_places.daily_limit,
+    food_ttl_seconds=nutrition_detail_cache.ttl_seconds,
+    quota_share=float(os.environ.get('CACHE_WARM_PLACES_QUOTA_SHARE', 0.2)),
+    hours=parse_hours(os.environ.get('CACHE_WARM_HOURS', '3-6')),
+    top_n=int(os.environ.get('CACHE_WARM_TOP_N', 50)),
+    food_top_n=int(os.environ.get('CACHE_WARM_FOOD_TOP_N', 200)),
+    interval_seconds=float(os.environ.get('CACHE_WARM_INTERVAL_SECONDS', 900))
+)
+
 # Restaurant Search Endpoints
 @api_router.post("/restaurants/search", response_model=List[Restaurant])
 async def search_restaurants(search_request: RestaurantSearchRequest):
     """Search for restaurants near a location using coordinates"""
     try:
-        restaurants = await google_places.search_restaurants(
+        return await search_restaurants_cached(
             latitude=search_request.latitude,
             longitude=search_request.longitude,
             radius=search_request.radius,
             keyword=search_request.keyword
         )
-        
-        # Cache results in database
-        for restaurant in restaurants:
-            restaurant_data = prepare_for_mongo(restaurant.dict())
-            await db.restaurants.replace_one(
-                {"place_id": restaurant.place_id},
-                restaurant_data,
-                upsert=True
-            )
-        
-        return restaurants
+    except CircuitOpenError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Restaurant search error: {str(e)}")
 
@@ -1337,30 +1758,19 @@ async def search_restaurants_by_location(search_request: LocationSearchRequest):
     """Search for restaurants by location name (city, address, etc.)"""
     try:
         # First geocode the location to get coordinates
-        location_data = await google_places.geocode_location(search_request.location)
+        location_data = await geocode_cached(search_request.location)
         
         if not location_data:
             raise HTTPException(status_code=400, detail=f"Could not find location: {search_request.location}")
         
         # Search restaurants using the geocoded coordinates
-        restaurants = await google_places.search_restaurants(
+        return await search_restaurants_cached(
             latitude=location_data['latitude'],
             longitude=location_data['longitude'],
             radius=search_request.radius,
             keyword=search_request.keyword
         )
-        
-        # Cache results in database
-        for restaurant in restaurants:
-            restaurant_data = prepare_for_mongo(restaurant.dict())
-            await db.restaurants.replace_one(
-                {"place_id": restaurant.place_id},
-                restaurant_data,
-                upsert=True
-            )
-        
-        return restaurants
-    except HTTPException:
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Location search error: {str(e)}")
@@ -1373,12 +1783,12 @@ async def geocode_location_endpoint(location_data: dict):
         if not location:
             raise HTTPException(status_code=400, detail="Location is required")
         
-        result = await google_places.geocode_location(location)
+        result = await geocode_cached(location)
         if not result:
             raise HTTPException(status_code=404, detail=f"Location not found: {location}")
         
         return result
-    except HTTPException:
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Geocoding error: {str(e)}")
@@ -1393,74 +1803,228 @@ async def get_restaurant_details(place_id: str):
         # Check if cache is recent (less than 24 hours)
         cache_age = datetime.now(timezone.utc) - cached_restaurant.get('cached_at', datetime.min.replace(tzinfo=timezone.utc))
         if cache_age.total_seconds() < 86400:  # 24 hours
+            await places_cache.record("place", place_id, hit=True)
             return Restaurant(**cached_restaurant)
     
     # Fetch fresh data
-    restaurant = await google_places.get_restaurant_details(place_id)
+    await places_cache.record("place", place_id, hit=False)
+    try:
+        restaurant = await refresh_restaurant(place_id, cached_restaurant)
+    except CircuitOpenError:
+        if not cached_restaurant:
+            raise
+        restaurant = None
     if not restaurant:
+        if cached_restaurant and google_places.policy.breaker.state != 'closed':
+            # Places is unhealthy: a stale record beats failing the request
+            logging.warning(f"Serving stale restaurant {place_id} while Google Places is unavailable")
+            return Restaurant(**cached_restaurant)
         raise HTTPException(status_code=404, detail="Restaurant not found")
     
-    # Update cache
-    restaurant_data = prepare_for_mongo(restaurant.dict())
-    await db.restaurants.replace_one(
-        {"place_id": place_id},
-        restaurant_data,
-        upsert=True
-    )
-    
     return restaurant
 
 # Nutrition Analysis Endpoints
+async def search_foods_cached(query: str, page_size: int = 5) -> List[FoodNutrition]:
+    """Search foods through the query cache, falling back to the USDA client"""
+    cached_foods = await nutrition_search_cache.get(query, page_size)
+    if cached_foods is not None:
+        # Cached entries may predate the current rating rules
+        return apply_food_analytics([FoodNutrition(**parse_from_mongo(dict(food))) for food in cached_foods])
+    
+    foods = await usda_nutrition.search_food(query, page_size=page_size)
+    
+    # Cache results
+    foods_data = []
+    for food in foods:
+        food_data = prepare_for_mongo(food.dict())
+        await nutrition_detail_cache.store(food_data)
+        foods_data.append(food_data)
+    
+    await nutrition_search_cache.put(query, page_size, foods_data)
+    
+    return foods
+
+async def fetch_food_document(fdc_id: str):
+    """Fetch one food from USDA as a Mongo-ready document (None if unknown)"""
+    food = await usda_nutrition.get_food_details(fdc_id)
+    return prepare_for_mongo(food.dict()) if food else None
+
+async def fetch_food_documents(fdc_ids: List[str]):
+    """Fetch several foods from USDA as Mongo-ready documents keyed by fdc_id"""
+    foods = await usda_nutrition.get_food_details_batch(fdc_ids)
+    return {fdc_id: prepare_for_mongo(food.dict()) for fdc_id, food in foods.items()}
+
 @api_router.get("/nutrition/search/{query}", response_model=List[FoodNutrition])
-async def search_nutrition(query: str):
+async def search_nutrition(query: str, limit: int = 5):
     """Search for nutrition information"""
     try:
-        foods = await usda_nutrition.search_food(query)
-        
-        # Cache results
-        for food in foods:
-            food_data = prepare_for_mongo(food.dict())
-            await db.nutrition.replace_one(
-                {"fdc_id": food.fdc_id},
-                food_data,
-                upsert=True
-            )
-        
-        return foods
+        foods = await search_foods_cached(query, page_size=max(1, min(limit, 50)))
+    except CircuitOpenError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Nutrition search error: {str(e)}")
+    # The top result stands in for the food the user was after
+    food_suggester.record_hits(food.fdc_id for food in foods[:1])
+    return foods
+
+@api_router.get("/nutrition/suggest")
+async def suggest_nutrition(q: str, limit: int = 8):
+    """Autocomplete food names as the user types, served from memory"""
+    return {"query": q, "suggestions": food_suggester.suggest(q, limit)}
+
+# Grams per unit accepted by the batch endpoint ("serving" is USDA's 100g reference)
+QUANTITY_UNIT_GRAMS = {
+    "serving": 100.0,
+    "g": 1.0, "gram": 1.0, "grams": 1.0,
+    "kg": 1000.0,
+    "oz": 28.3495, "ounce": 28.3495, "ounces": 28.3495,
+    "lb": 453.592, "lbs": 453.592, "pound": 453.592, "pounds": 453.592,
+}
+
+NUTRIENT_FIELDS = ["calories", "carbohydrates", "sugars", "fiber", "protein", "fat", "sodium"]
+
+def scale_food_nutrition(food: FoodNutrition, grams: float) -> dict:
+    """Scale a per-100g food to a portion and derive net carbs and glycemic load"""
+    factor = grams / 100.0
+    nutrients = {
+        field: round(getattr(food, field) * factor, 2)
+        for field in NUTRIENT_FIELDS
+        if getattr(food, field) is not None
+    }
+    net_carbs = None
+    if food.carbohydrates is not None:
+        net_carbs = round(max(0.0, nutrients['carbohydrates'] - nutrients.get('fiber', 0.0)), 2)
+    glycemic_load = None
+    if food.glycemic_index is not None and net_carbs is not None:
+        glycemic_load = round(food.glycemic_index * net_carbs / 100.0, 1)
+    return {"nutrients": nutrients, "net_carbs": net_carbs, "glycemic_load": glycemic_load}
+
+@api_router.post("/nutrition/batch")
+async def analyze_nutrition_batch(batch_request: NutritionBatchRequest):
+    """Resolve a meal's ingredients (fdc_ids and/or free-text queries) and total them"""
+    items = batch_request.items
+    if not items:
+        raise HTTPException(status_code=400, detail="At least one item is required")
+    if len(items) > 50:
+        raise HTTPException(status_code=400, detail="A batch can contain at most 50 items")
+    for item in items:
+        if not item.fdc_id and not normalize_query(item.query or ''):
+            raise HTTPException(status_code=400, detail="Each item needs an fdc_id or a query")
+        if item.unit.lower() not in QUANTITY_UNIT_GRAMS:
+            raise HTTPException(status_code=400, detail=f"Unsupported unit: {item.unit}")
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantities must be positive")
+    
+    fdc_ids = [item.fdc_id for item in items if item.fdc_id]
+    queries = list(dict.fromkeys(normalize_query(item.query) for item in items if not item.fdc_id))
+    
+    async def resolve_ids():
+        if not fdc_ids:
+            return {}
+        docs = await nutrition_detail_cache.get_many(fdc_ids, fetch_food_document, fetch_food_documents)
+        foods = {fdc_id: FoodNutrition(**parse_from_mongo(dict(doc))) for fdc_id, doc in docs.items()}
+        apply_food_analytics(list(foods.values()))
+        return foods
+    
+    async def resolve_query(query: str):
+        foods = await search_foods_cached(query)
+        return foods[0] if foods else None
+    
+    # Everything resolves concurrently: one bulk detail lookup plus one search per distinct query
+    id_result, *query_results = await asyncio.gather(
+        resolve_ids(),
+        *(resolve_query(query) for query in queries),
+        return_exceptions=True
+    )
+    query_foods = dict(zip(queries, query_results))
+    
+    results = []
+    totals = {field: 0.0 for field in NUTRIENT_FIELDS}
+    totals.update({"net_carbs": 0.0, "glycemic_load": 0.0})
+    glycemic_load_items = 0
+    
+    for index, item in enumerate(items):
+        grams = round(item.quantity * QUANTITY_UNIT_GRAMS[item.unit.lower()], 1)
+        entry = {
+            "index": index,
+            "fdc_id": item.fdc_id,
+            "query": item.query,
+            "quantity": item.quantity,
+            "unit": item.unit,
+            "grams": grams,
+            "food": None,
+            "nutrients": {},
+            "net_carbs": None,
+            "glycemic_load": None,
+            "error": None
+        }
+        
+        resolved = id_result if item.fdc_id else query_foods[normalize_query(item.query)]
+        if isinstance(resolved, Exception):
+            logging.error(f"Nutrition batch lookup error: {resolved}")
+            entry["error"] = "Nutrition service unavailable"
+            results.append(entry)
+            continue
+        
+        food = resolved.get(item.fdc_id) if item.fdc_id else resolved
+        if not food:
+            entry["error"] = "Nutrition information not found"
+            results.append(entry)
+            continue
+        
+        entry["food"] = food
+        entry.update(scale_food_nutrition(food, grams))
+        for field, value in entry["nutrients"].items():
+            totals[field] += value
+        if entry["net_carbs"] is not None:
+            totals["net_carbs"] += entry["net_carbs"]
+        if entry["glycemic_load"] is not None:
+            totals["glycemic_load"] += entry["glycemic_load"]
+            glycemic_load_items += 1
+        results.append(entry)
+    
+    resolved_items = sum(1 for entry in results if entry["food"])
+    return {
+        "items": results,
+        "totals": {key: round(value, 2) for key, value in totals.items()},
+        "items_resolved": resolved_items,
+        "items_total": len(items),
+        # Share of resolved items whose glycemic index is known (glycemic_load covers only those)
+        "glycemic_load_coverage": round(glycemic_load_items / resolved_items, 2) if resolved_items else 0.0
+    }
+
+@api_router.get("/nutrition/cache/stats")
+async def get_nutrition_cache_stats():
+    """Get nutrition search and detail cache hit rates"""
+    return {
+        "search": nutrition_search_cache.get_stats(),
+        "detail": nutrition_detail_cache.get_stats(),
+        "suggest": food_suggester.get_stats()
+    }
 
 @api_router.get("/nutrition/{fdc_id}", response_model=FoodNutrition)
 async def get_nutrition_details(fdc_id: str):
     """Get detailed nutrition information"""
-    # Check cache first
-    cached_food = await db.nutrition.find_one({"fdc_id": fdc_id})
-    if cached_food:
-        cached_food = parse_from_mongo(cached_food)
-        return FoodNutrition(**cached_food)
+    try:
+        food_data = await nutrition_detail_cache.get(fdc_id, fetch_food_document)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logging.error(f"Nutrition details error for {fdc_id}: {e}")
+        raise HTTPException(status_code=502, detail="Nutrition service unavailable")
     
-    # Fetch fresh data
-    food = await usda_nutrition.get_food_details(fdc_id)
-    if not food:
+    if not food_data:
         raise HTTPException(status_code=404, detail="Nutrition information not found")
     
-    # Cache result
-    food_data = prepare_for_mongo(food.dict())
-    await db.nutrition.insert_one(food_data)
-    
-    return food
+    food_suggester.record_hits([fdc_id])
+    return apply_food_analytics([FoodNutrition(**parse_from_mongo(dict(food_data)))])[0]
 
-# Enhanced AI Chat Endpoint
-@api_router.post("/chat", response_model=ChatMessage)
-async def chat_with_ai(chat_request: ChatMessageCreate):
-    """Chat with the AI health coach with restaurant and nutrition context"""
-    try:
-        # Get user profile for context
-        user_profile = await db.user_profiles.find_one({"id": chat_request.user_id})
-        user_context = ""
-        
-        if user_profile:
-            user_context = f"""
+def build_coach_system_message(user_profile: Optional[Dict[str, Any]]) -> str:
+    """Health coach system prompt with the user's profile context"""
+    user_context = ""
+    
+    if user_profile:
+        user_context = f"""
 User Profile Context:
 - Diabetes Type: {user_profile.get('diabetes_type', 'Not specified')}
 - Age: {user_profile.get('age', 'Not specified')}
@@ -1474,36 +2038,134 @@ User Profile Context:
 - Cooking Skill: {user_profile.get('cooking_skill', 'Not specified')}
 
 """
-        
-        # Initialize AI chat with enhanced prompt
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY'),
-            session_id=f"meal_planning_{chat_request.user_id}",
-            system_message=f"{HEALTH_COACH_PROMPT}\n\n{user_context}"
-        ).with_model("openai", "gpt-4o-mini")
-        
-        # Create user message
-        user_message = UserMessage(text=chat_request.message)
-        
-        # Get AI response
-        ai_response = await chat.send_message(user_message)
-        
-        # Create chat message object
-        chat_obj = ChatMessage(
-            user_id=chat_request.user_id,
-            message=chat_request.message,
-            response=ai_response
+    
+    return f"{HEALTH_COACH_PROMPT}\n\n{user_context}"
+
+async def build_chat_system_message(user_profile: Optional[Dict[str, Any]], user_id: str, message: str, tenant_id: str) -> Tuple[str, bool]:
+    """Coach prompt, profile and budgeted history for a /chat turn, and whether any history was included"""
+    async def load_turns(since: str):
+        query = {"user_id": user_id}
+        if since:
+            query["timestamp"] = {"$gt": since}
+        messages = await db.chat_messages.find(
+            query, {"_id": 0, "message": 1, "response": 1, "timestamp": 1}
+        ).sort("timestamp", -1).to_list(CHAT_CONTEXT_MAX_TURNS)
+        return [(msg["message"], msg["response"], msg["timestamp"]) for msg in reversed(messages)]
+    
+    static_block = build_coach_system_message(user_profile)
+    system_message = await conversation_context.build(
+        f"chat_{user_id}",
+        static_block,
+        message,
+        load_turns,
+        tenant_id
+    )
+    return system_message, system_message != static_block
+
+async def save_chat_message(user_id: str, message: str, response: str) -> ChatMessage:
+    """Persist a completed chat turn"""
+    chat_obj = ChatMessage(
+        user_id=user_id,
+        message=message,
+        response=response
+    )
+    chat_data = prepare_for_mongo(chat_obj.dict())
+    await db.chat_messages.insert_one(chat_data)
+    return chat_obj
+
+# Enhanced AI Chat Endpoint
+@api_router.post("/chat", response_model=ChatMessage)
+async def chat_with_ai(chat_request: ChatMessageCreate, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Chat with the AI health coach with restaurant and nutrition context"""
+    try:
+        # Get user profile for context
+        user_profile = await db.user_profiles.find_one({"id": chat_request.user_id})
+        segment = chat_segment(user_profile or {})
+        priority = llm_priority(current_user, chat_request.user_id)
+        system_message, personal = await build_chat_system_message(
+            user_profile, chat_request.user_id, chat_request.message, priority["tenant_id"]
         )
         
-        # Save to database
-        chat_data = prepare_for_mongo(chat_obj.dict())
-        await db.chat_messages.insert_one(chat_data)
+        # Reuse a cached answer to the same question when enabled, unless the prompt carries this user's history
+        ai_response = None
+        if personal:
+            response_cache.skip_personal()
+        else:
+            ai_response = response_cache.get(segment, chat_request.message)
+        if ai_response is None:
+            ai_response = await llm_gateway.complete(
+                chat_request.message,
+                system_message=system_message,
+                session_id=f"meal_planning_{chat_request.user_id}",
+                endpoint="chat",
+                **priority
+            )
+            if not personal:
+                response_cache.put(segment, chat_request.message, ai_response)
         
-        return chat_obj
+        # Save to database
+        return await save_chat_message(chat_request.user_id, chat_request.message, ai_response)
         
+    except (CircuitOpenError, LLMOverloadedError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI chat error: {str(e)}")
 
+@api_router.post("/chat/stream")
+async def stream_chat_with_ai(chat_request: ChatMessageCreate, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Stream the AI health coach reply as Server-Sent Events
+    
+    Emits ``token`` events as text arrives and a final ``done`` event carrying
+    the saved ChatMessage; the message is stored only once the stream completes.
+    """
+    user_profile = await db.user_profiles.find_one({"id": chat_request.user_id})
+    segment = chat_segment(user_profile or {})
+    priority = llm_priority(current_user, chat_request.user_id)
+    system_message, personal = await build_chat_system_message(
+        user_profile, chat_request.user_id, chat_request.message, priority["tenant_id"]
+    )
+    cached_response = None
+    if personal:
+        # The prompt carries this user's history, so the answer can't be shared
+        response_cache.skip_personal()
+    else:
+        cached_response = response_cache.get(segment, chat_request.message)
+    release = None
+    if cached_response is None:
+        # Admit before the response starts so an overloaded queue can still answer 429
+        release = (await llm_scheduler.acquire(**priority)).release
+    
+    def token_stream():
+        if cached_response is not None:
+            return replay_text(cached_response)
+        return llm_gateway.stream(
+            chat_request.message, system_message, f"meal_planning_{chat_request.user_id}",
+            tenant_id=priority["tenant_id"], endpoint="chat_stream"
+        )
+    
+    async def on_complete(ai_response: str) -> Dict[str, Any]:
+        if cached_response is None and not personal:
+            response_cache.put(segment, chat_request.message, ai_response)
+        chat_obj = await save_chat_message(chat_request.user_id, chat_request.message, ai_response)
+        return chat_obj.dict()
+    
+    return StreamingResponse(
+        relay_completion(token_stream, on_complete, release, policy=upstream_policies["llm"] if cached_response is None else None),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(release) if release else None
+    )
+
+@api_router.get("/chat/cache/stats")
+async def get_chat_cache_stats():
+    """Hit rates of the health-coach response cache"""
+    return response_cache.get_stats()
+
+@api_router.get("/chat/context/stats")
+async def get_chat_context_stats():
+    """Conversation context builder counters (summary folds, dropped turns)"""
+    return conversation_context.get_stats()
+
 @api_router.get("/chat/{user_id}", response_model=List[ChatMessage])
 async def get_chat_history(user_id: str):
     """Get chat history for a user"""
@@ -1512,7 +2174,7 @@ async def get_chat_history(user_id: str):
 
 # Restaurant Analysis Endpoint
 @api_router.post("/restaurants/analyze")
-async def analyze_restaurant_for_user(analysis_request: RestaurantAnalysisRequest):
+async def analyze_restaurant_for_user(analysis_request: RestaurantAnalysisRequest, current_user: Optional[dict] = Depends(get_optional_user)):
     """Analyze a restaurant for diabetic-friendly options"""
     try:
         # Get user profile
@@ -1547,14 +2209,18 @@ async def analyze_restaurant_for_user(analysis_request: RestaurantAnalysisReques
         """
         
         # Get AI analysis
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY'),
-            session_id=f"restaurant_analysis_{analysis_request.user_id}",
-            system_message=HEALTH_COACH_PROMPT
-        ).with_model("openai", "gpt-4o-mini")
-        
-        user_message = UserMessage(text=analysis_prompt)
-        ai_analysis = await chat.send_message(user_message)
+        # Same restaurant + same profile facets = same analysis, so share it across users
+        ai_analysis = await restaurant_analysis_cache.get(
+            restaurant.dict(),
+            user_profile,
+            lambda: llm_gateway.complete(
+                analysis_prompt,
+                system_message=HEALTH_COACH_PROMPT,
+                session_id=f"restaurant_analysis_{analysis_request.user_id}",
+                endpoint="restaurant_analysis",
+                **llm_priority(current_user, analysis_request.user_id)
+            )
+        )
         
         return {
             "restaurant": restaurant,
@@ -1562,160 +2228,406 @@ async def analyze_restaurant_for_user(analysis_request: RestaurantAnalysisReques
             "diabetic_friendly_score": restaurant.diabetic_friendly_score
         }
         
+    except (CircuitOpenError, LLMOverloadedError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Restaurant analysis error: {str(e)}")
 
+@api_router.get("/restaurants/analysis-cache/stats")
+async def get_restaurant_analysis_cache_stats():
+    """Hit rate of the shared restaurant analysis cache"""
+    return restaurant_analysis_cache.get_stats()
+
 # Shopping List Endpoints
+def tenant_scope(current_user: Optional[dict]) -> Dict[str, Any]:
+    """Filter limiting documents to the caller's tenant (tenantless documents for anonymous callers)"""
+    return {"tenant_id": current_user.get("tenant_id") if current_user else None}
+
+def shopping_list_document(shopping_list: ShoppingList) -> Dict[str, Any]:
+    """Mongo document for a shopping list, with each item's merge fields for consolidated views"""
+    data = prepare_for_mongo(shopping_list.dict())
+    data["items"] = [with_merge_fields(item) for item in data["items"]]
+    return data
+
+async def raise_shopping_list_conflict(list_id: str, scope: Dict[str, Any], version: Optional[int]):
+    """Explain why a conditional shopping list update matched nothing"""
+    current = await db.shopping_lists.find_one({"id": list_id, **scope}, {"_id": 0, "version": 1})
+    if not current:
+        raise HTTPException(status_code=404, detail="Shopping list not found")
+    if version is not None and current.get("version", 1) != version:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Shopping list was changed by someone else (now at version {current.get('version', 1)})"
+        )
+    raise HTTPException(status_code=404, detail="Shopping list item not found")
+
 @api_router.post("/shopping-lists", response_model=ShoppingList)
-async def create_shopping_list(shopping_list: ShoppingListCreate):
+async def create_shopping_list(shopping_list: ShoppingListCreate, current_user: Optional[dict] = Depends(get_optional_user)):
     """Create a new shopping list"""
-    shopping_list_obj = ShoppingList(**shopping_list.dict())
-    shopping_list_data = prepare_for_mongo(shopping_list_obj.dict())
-    await db.shopping_lists.insert_one(shopping_list_data)
+    shopping_list_obj = ShoppingList(**shopping_list.dict(), **tenant_scope(current_user))
+    await db.shopping_lists.insert_one(shopping_list_document(shopping_list_obj))
     return shopping_list_obj
 
 @api_router.get("/shopping-lists/{user_id}", response_model=List[ShoppingList])
-async def get_user_shopping_lists(user_id: str):
+async def get_user_shopping_lists(user_id: str, current_user: Optional[dict] = Depends(get_optional_user)):
     """Get shopping lists for a user"""
-    lists = await db.shopping_lists.find({"user_id": user_id}).sort("created_at", -1).to_list(100)
+    lists = await db.shopping_lists.find({"user_id": user_id, **tenant_scope(current_user)}).sort("created_at", -1).to_list(100)
     return [ShoppingList(**parse_from_mongo(shopping_list)) for shopping_list in lists]
 
+@api_router.get("/shopping-lists/{user_id}/consolidated")
+async def get_consolidated_shopping_list(user_id: str, list_ids: Optional[str] = None, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Items of several lists merged by ingredient and unit, grouped by category
+    
+    ``list_ids`` is a comma-separated selection; all of the user's lists are merged when omitted.
+    """
+    match = {"user_id": user_id, **tenant_scope(current_user)}
+    selected = [list_id.strip() for list_id in (list_ids or "").split(",") if list_id.strip()] or None
+    if selected:
+        if len(selected) > 100:
+            raise HTTPException(status_code=400, detail="At most 100 lists can be merged")
+        match["id"] = {"$in": selected}
+    groups = await db.shopping_lists.aggregate(consolidated_pipeline(match)).to_list(None)
+    return format_consolidated(groups, selected)
+
 @api_router.get("/shopping-lists/detail/{list_id}", response_model=ShoppingList)
-async def get_shopping_list(list_id: str):
+async def get_shopping_list(list_id: str, current_user: Optional[dict] = Depends(get_optional_user)):
     """Get a specific shopping list"""
-    shopping_list = await db.shopping_lists.find_one({"id": list_id})
+    shopping_list = await db.shopping_lists.find_one({"id": list_id, **tenant_scope(current_user)})
     if not shopping_list:
         raise HTTPException(status_code=404, detail="Shopping list not found")
     shopping_list = parse_from_mongo(shopping_list)
     return ShoppingList(**shopping_list)
 
 @api_router.put("/shopping-lists/{list_id}", response_model=ShoppingList)
-async def update_shopping_list(list_id: str, updates: ShoppingListUpdate):
-    """Update a shopping list"""
-    existing_list = await db.shopping_lists.find_one({"id": list_id})
-    if not existing_list:
-        raise HTTPException(status_code=404, detail="Shopping list not found")
+async def update_shopping_list(list_id: str, updates: ShoppingListUpdate, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Update a shopping list's title and/or replace its items"""
+    scope = tenant_scope(current_user)
+    query = {"id": list_id, **scope}
+    if updates.version is not None:
+        query["version"] = updates.version
     
-    update_data = {k: v for k, v in updates.dict().items() if v is not None}
-    if update_data:
-        await db.shopping_lists.update_one(
-            {"id": list_id},
-            {"$set": update_data}
+    update_data = {k: v for k, v in updates.dict(exclude={"version"}).items() if v is not None}
+    if "items" in update_data:
+        # Re-consolidate on every edit so added items merge and quantities stay imperial
+        update_data["items"] = [with_merge_fields(ShoppingListItem(**item).dict()) for item in consolidate_items(update_data["items"])]
+    if not update_data:
+        updated_list = await db.shopping_lists.find_one(query, {"_id": 0})
+    else:
+        updated_list = await db.shopping_lists.find_one_and_update(
+            query,
+            {"$set": update_data, "$inc": {"version": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
         )
+    if not updated_list:
+        await raise_shopping_list_conflict(list_id, scope, updates.version)
+    return ShoppingList(**parse_from_mongo(updated_list))
+
+@api_router.patch("/shopping-lists/{list_id}", response_model=ShoppingList)
+async def patch_shopping_list(list_id: str, patch: ShoppingListPatch, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Check, uncheck, add, remove or reorder items in one atomic update (see shopping_list_patch)"""
+    if not patch.operations and patch.title is None:
+        raise HTTPException(status_code=400, detail="Nothing to update")
     
-    updated_list = await db.shopping_lists.find_one({"id": list_id})
-    updated_list = parse_from_mongo(updated_list)
-    return ShoppingList(**updated_list)
+    operations = []
+    for operation in patch.operations:
+        op = operation.dict(include={"op", "item_id", "position", "item_ids"})
+        if operation.op == "add":
+            # Added items get the same quantity parsing and categorization as generated ones
+            parsed = consolidate_items([{"item": operation.item or "", "quantity": operation.quantity, "category": operation.category}])
+            if not parsed:
+                raise HTTPException(status_code=400, detail="'add' needs an item name")
+            op["item"] = with_merge_fields(ShoppingListItem(**parsed[0]).dict())
+        operations.append(op)
+    try:
+        referenced_ids = validate_operations(operations)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    scope = tenant_scope(current_user)
+    query = {"id": list_id, **scope}
+    if patch.version is not None:
+        query["version"] = patch.version
+    if referenced_ids:
+        # Only apply the patch if every item it refers to is still on the list
+        query["items.id"] = {"$all": referenced_ids}
+    
+    update, array_filters = build_item_update(operations, patch.title)
+    updated_list = await db.shopping_lists.find_one_and_update(
+        query,
+        update,
+        array_filters=array_filters,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_list:
+        await raise_shopping_list_conflict(list_id, scope, patch.version)
+    return ShoppingList(**parse_from_mongo(updated_list))
 
 @api_router.delete("/shopping-lists/{list_id}")
-async def delete_shopping_list(list_id: str):
+async def delete_shopping_list(list_id: str, current_user: Optional[dict] = Depends(get_optional_user)):
     """Delete a shopping list"""
-    result = await db.shopping_lists.delete_one({"id": list_id})
+    result = await db.shopping_lists.delete_one({"id": list_id, **tenant_scope(current_user)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Shopping list not found")
     return {"message": "Shopping list deleted successfully"}
 
-@api_router.post("/shopping-lists/generate")
-async def generate_shopping_list(request: dict):
-    """Generate a shopping list from AI meal plan using AI"""
-    try:
-        user_id = request.get('user_id')
-        meal_plan_text = request.get('meal_plan_text', '')
-        
-        if not user_id or not meal_plan_text:
-            raise HTTPException(status_code=400, detail="user_id and meal_plan_text are required")
-        
-        # Use AI to parse the meal plan and generate shopping list
-        shopping_list_prompt = f"""
-        Based on this meal plan, create a shopping list organized by store sections. 
-        Format the response as a simple list without any markdown formatting.
-        Use ONLY Imperial measurements (cups, tablespoons, pounds, ounces).
-        
-        Meal Plan:
-        {meal_plan_text}
-        
-        Please organize items into these categories:
-        - Fresh Produce
-        - Proteins (Meat/Fish/Dairy) 
-        - Pantry Items
-        - Frozen Foods
-        - Other Items
-        
-        For each item, estimate reasonable quantities using Imperial measurements:
-        - Use pounds (lbs) and ounces (oz) for weight
-        - Use cups, tablespoons, teaspoons for volume
-        - Examples: "2 lbs chicken breast", "1 cup brown rice", "8 oz salmon"
-        - Never use grams, kilograms, or liters
-        """
-        
-        # Get AI response for shopping list
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY'),
-            session_id=f"shopping_list_{user_id}",
-            system_message="You are a helpful assistant that creates organized shopping lists from meal plans. Use clear, simple formatting without markdown."
-        ).with_model("openai", "gpt-4o-mini")
-        
-        user_message = UserMessage(text=shopping_list_prompt)
-        ai_response = await chat.send_message(user_message)
-        
-        # Parse AI response into shopping list items (simplified parsing)
-        items = []
-        current_category = "other"
-        category_mapping = {
-            "produce": "produce",
-            "fresh produce": "produce", 
-            "proteins": "proteins",
-            "meat": "proteins",
-            "fish": "proteins",
-            "dairy": "proteins",
-            "pantry": "pantry",
-            "pantry items": "pantry",
-            "frozen": "frozen",
-            "frozen foods": "frozen",
-            "other": "other"
-        }
-        
-        for line in ai_response.split('\n'):
-            line = line.strip()
-            if not line or line.startswith('-') and len(line) < 3:
-                continue
-                
-            # Check if this line indicates a category
-            line_lower = line.lower().replace(':', '').replace('-', '').strip()
-            if line_lower in category_mapping:
-                current_category = category_mapping[line_lower]
-                continue
-            
-            # If line starts with dash or number, it's probably an item
-            if line.startswith('-') or line[0].isdigit():
-                item_text = line.lstrip('- 1234567890.').strip()
-                if item_text and len(item_text) > 2:
-                    items.append(ShoppingListItem(
-                        item=item_text,
-                        category=current_category,
-                        checked=False
-                    ))
-        
-        # Create shopping list
-        shopping_list = ShoppingList(
-            user_id=user_id,
-            title=f"Shopping List - {datetime.now().strftime('%m/%d/%Y')}",
-            items=items
-        )
-        
-        # Save to database
-        shopping_list_data = prepare_for_mongo(shopping_list.dict())
-        await db.shopping_lists.insert_one(shopping_list_data)
-        
-        return {
-            "shopping_list": shopping_list,
-            "ai_response": ai_response
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Shopping list generation error: {str(e)}")
+async def generate_shopping_list_from_plan(user_id: str, meal_plan_text: str, priority: Dict[str, str], tenant_id: Optional[str] = None) -> Dict[str, Any]:
+    """Generate and store a shopping list from meal plan text (runs as a background job)"""
+    # Use AI to parse the meal plan and generate shopping list
+    if SHOPPING_LIST_STRUCTURED_OUTPUT:
+        format_instructions = """Return every item as JSON with its name, a numeric quantity, its unit and one of these categories:
+    produce, proteins (meat/fish), dairy, pantry, frozen, other.
+    List each ingredient once, with the total needed across the whole plan."""
+    else:
+        format_instructions = """Format the response as a simple list without any markdown formatting, organized into these categories:
+    - Fresh Produce
+    - Proteins (Meat/Fish)
+    - Dairy
+    - Pantry Items
+    - Frozen Foods
+    - Other Items"""
+    
+    shopping_list_prompt = f"""
+    Based on this meal plan, create a shopping list organized by store sections. 
+    Use ONLY Imperial measurements (cups, tablespoons, pounds, ounces).
+    
+    Meal Plan:
+    {meal_plan_text}
+    
+    {format_instructions}
+    
+    For each item, estimate reasonable quantities using Imperial measurements:
+    - Use pounds (lbs) and ounces (oz) for weight
+    - Use cups, tablespoons, teaspoons for volume
+    - Examples: "2 lbs chicken breast", "1 cup brown rice", "8 oz salmon"
+    - Never use grams, kilograms, or liters
+    """
+    
+    # Get AI response for shopping list
+    ai_response = await llm_gateway.complete(
+        shopping_list_prompt,
+        system_message="You are a helpful assistant that creates organized shopping lists from meal plans. Use clear, simple formatting without markdown.",
+        session_id=f"shopping_list_{user_id}",
+        queue_deadline=SHOPPING_LIST_JOB_QUEUE_DEADLINE,
+        json_schema=SHOPPING_LIST_SCHEMA if SHOPPING_LIST_STRUCTURED_OUTPUT else None,
+        endpoint="shopping_list",
+        **priority
+    )
+    
+    # JSON or free-text items, with quantities parsed, converted to imperial and merged
+    items = [ShoppingListItem(**item) for item in build_shopping_list_items(ai_response)]
+    
+    # Create shopping list
+    shopping_list = ShoppingList(
+        user_id=user_id,
+        title=f"Shopping List - {datetime.now().strftime('%m/%d/%Y')}",
+        items=items,
+        tenant_id=tenant_id
+    )
+    
+    # Save to database
+    await db.shopping_lists.insert_one(shopping_list_document(shopping_list))
+    
+    return {"shopping_list_id": shopping_list.id, "ai_response": ai_response}
+
+def shopping_list_job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "shopping_list_id": job.get("shopping_list_id"),
+        "error": job.get("error"),
+        "status_url": f"/api/shopping-lists/jobs/{job['id']}",
+        "events_url": f"/api/shopping-lists/jobs/{job['id']}/events",
+    }
+
+@api_router.post("/shopping-lists/generate", status_code=202)
+async def generate_shopping_list(request: dict, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Start generating a shopping list from an AI meal plan
+    
+    Returns a job right away; the same meal plan text resubmitted by the same
+    user returns the existing job instead of generating a second list.
+    """
+    user_id = request.get('user_id')
+    meal_plan_text = request.get('meal_plan_text', '')
+    
+    if not user_id or not meal_plan_text:
+        raise HTTPException(status_code=400, detail="user_id and meal_plan_text are required")
+    
+    priority = llm_priority(current_user, user_id)
+    job = await shopping_list_jobs.submit(
+        user_id,
+        meal_plan_text,
+        lambda: generate_shopping_list_from_plan(user_id, meal_plan_text, priority, tenant_scope(current_user)["tenant_id"])
+    )
+    return shopping_list_job_response(job)
+
+async def shopping_list_job_status(job: Dict[str, Any], current_user: Optional[dict]) -> Optional[Dict[str, Any]]:
+    """Job response with the list once completed; None if the list isn't in the caller's tenant"""
+    response = shopping_list_job_response(job)
+    if job["status"] == "completed":
+        shopping_list = await db.shopping_lists.find_one({"id": job["shopping_list_id"], **tenant_scope(current_user)})
+        if not shopping_list:
+            return None
+        response["shopping_list"] = ShoppingList(**parse_from_mongo(shopping_list))
+        response["ai_response"] = job.get("ai_response")
+    return response
+
+@api_router.get("/shopping-lists/jobs/{job_id}")
+async def get_shopping_list_job(job_id: str, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Status of a shopping list generation job, with the list once completed"""
+    job = await shopping_list_jobs.get(job_id)
+    response = await shopping_list_job_status(job, current_user) if job else None
+    if not response:
+        raise HTTPException(status_code=404, detail="Shopping list job not found")
+    return response
+
+@api_router.get("/shopping-lists/jobs/{job_id}/events")
+async def stream_shopping_list_job(job_id: str, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Server-Sent Events for a generation job: 'status' updates, then 'completed' or 'failed'"""
+    job = await shopping_list_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Shopping list job not found")
+    
+    async def events():
+        current = job
+        last_status = None
+        while True:
+            if current is None:
+                yield sse_event("failed", {"job_id": job_id, "error": "Job expired"})
+                return
+            if current["status"] in TERMINAL_STATUSES:
+                response = await shopping_list_job_status(current, current_user)
+                if response is None:
+                    yield sse_event("failed", {"job_id": job_id, "error": "Shopping list job not found"})
+                else:
+                    yield sse_event(current["status"], jsonable_encoder(response))
+                return
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield sse_event("status", shopping_list_job_response(current))
+            current = await shopping_list_jobs.wait(job_id, timeout=2.0)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 # Meal Plan Endpoints
+async def generate_meal_plan_day(prompt: str, priority: Dict[str, str]) -> str:
+    return await llm_gateway.complete(
+        prompt,
+        system_message="You are a registered dietitian planning meals for people with diabetes. Answer with JSON only.",
+        session_id=f"meal_plan_{uuid.uuid4()}",
+        json_schema=DAY_SCHEMA,
+        endpoint="meal_plan",
+        **priority
+    )
+
+async def lookup_food_nutrition(name: str) -> Optional[Dict[str, Any]]:
+    """Per-100g nutrition for an ingredient: the best search hit whose description covers the name"""
+    foods = await search_foods_cached(name, page_size=5)
+    for food in foods:
+        if ingredient_matches(name, food.description or food.food_name):
+            return food.dict()
+    return None
+
+# Deterministic portion optimizer over cached nutrition data and the FDC index
+meal_optimizer = MealOptimizer(db, food_index)
+
+async def suggest_optimized_meals(profile: Dict[str, Any], day: int, daily_net_carbs: float) -> List[str]:
+    """Optimizer meals for one day of a plan, rotated by day so days differ"""
+    await meal_optimizer.refresh()
+    meals = meal_optimizer.optimize(
+        net_carbs=daily_net_carbs * 0.3,
+        allergies=profile.get("allergies") or [],
+        dislikes=profile.get("dislikes") or [],
+        alternatives=2,
+        offset=2 * (day - 1)
+    )
+    return [describe_meal(meal) for meal in meals]
+
+meal_plan_generator = MealPlanGenerator(
+    complete=generate_meal_plan_day,
+    lookup_food=lookup_food_nutrition,
+    max_concurrency=int(os.environ.get('MEAL_PLAN_DAY_CONCURRENCY', 7)),
+    suggest_meals=suggest_optimized_meals,
+    lookup_concurrency=int(os.environ.get('MEAL_PLAN_LOOKUP_CONCURRENCY', 8))
+)
+
+@api_router.post("/meals/optimize")
+async def optimize_meal(request: MealOptimizeRequest):
+    """Pick foods and portions that hit per-meal net-carb, fiber and calorie targets, without the LLM"""
+    if request.net_carbs < 0 or request.fiber < 0 or request.calories <= 0:
+        raise HTTPException(status_code=400, detail="Targets must be positive")
+    allergies, dislikes = list(request.allergies), list(request.dislikes)
+    if request.user_id:
+        user_profile = await db.user_profiles.find_one({"id": request.user_id}, {"_id": 0, "allergies": 1, "dislikes": 1})
+        if user_profile:
+            allergies += user_profile.get("allergies") or []
+            dislikes += user_profile.get("dislikes") or []
+    
+    await meal_optimizer.refresh()
+    started = time.perf_counter()
+    meals = meal_optimizer.optimize(
+        net_carbs=request.net_carbs,
+        fiber=request.fiber,
+        calories=request.calories,
+        allergies=allergies,
+        dislikes=dislikes,
+        alternatives=max(1, min(request.alternatives, 10))
+    )
+    return {
+        "meals": meals,
+        "summaries": [describe_meal(meal) for meal in meals],
+        "targets": {"net_carbs": request.net_carbs, "fiber": request.fiber, "calories": request.calories},
+        "excluded": {"allergies": allergies, "dislikes": dislikes},
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+@api_router.get("/meals/optimize/stats")
+async def get_meal_optimizer_stats():
+    """Get meal optimizer pool size and counters"""
+    return meal_optimizer.get_stats()
+
+@api_router.post("/meal-plans/generate")
+async def generate_meal_plan(request: MealPlanGenerateRequest, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Generate a multi-day meal plan, streaming per-day progress as Server-Sent Events
+    
+    Emits ``day`` events as each day is generated, validated against the
+    net-carb target and (if needed) retried, then ``completed`` with the saved
+    MealPlan or ``failed``.
+    """
+    if not 1 <= request.days <= 14:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 14")
+    user_profile = await db.user_profiles.find_one({"id": request.user_id}, {"_id": 0})
+    priority = llm_priority(current_user, request.user_id)
+    
+    async def events():
+        try:
+            async for event, data in meal_plan_generator.generate(request.days, user_profile, priority, request.daily_net_carbs):
+                if event != "completed":
+                    yield sse_event(event, data)
+                    continue
+                days = data["days"]
+                within = sum(1 for day in days if day["within_target"])
+                meal_plan = MealPlan(
+                    user_id=request.user_id,
+                    title=request.title or f"{request.days}-Day Meal Plan - {datetime.now().strftime('%m/%d/%Y')}",
+                    description=f"{request.days} days at about {data['carb_target']:.0f} g net carbs per day; "
+                                f"{within} of {request.days} days within target",
+                    meals=days
+                )
+                await db.meal_plans.insert_one(prepare_for_mongo(meal_plan.dict()))
+                yield sse_event("completed", jsonable_encoder(meal_plan))
+        except Exception as e:
+            logging.error(f"Meal plan generation error: {e}")
+            yield sse_event("failed", {"error": "Meal plan generation failed"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@api_router.get("/meal-plans/generator/stats")
+async def get_meal_plan_generator_stats():
+    """Get meal plan generation counters"""
+    return meal_plan_generator.get_stats()
+
 @api_router.get("/meal-plans/{user_id}", response_model=List[MealPlan])
 async def get_user_meal_plans(user_id: str):
     """Get meal plans for a user"""
@@ -1774,7 +2686,7 @@ async def send_restaurant_sms(sms_request: SendSMSRequest):
             "restaurant_name": restaurant.name
         }
         
-    except HTTPException:
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
         logging.error(f"SMS sending error: {e}")
@@ -1888,6 +2800,16 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "GlucoPlanner API", "features": ["meal_planning", "restaurant_search", "nutrition_analysis"]}
 
+@api_router.get("/health/upstreams")
+async def upstream_health():
+    """Circuit breaker state and retry/hedge/timeout counters per upstream"""
+    return get_upstream_metrics()
+
+@api_router.get("/health/llm-queue")
+async def llm_queue_health():
+    """LLM scheduler slots in use, queue depth per tier and shed counters"""
+    return llm_scheduler.get_metrics()
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -1908,4 +2830,8 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await llm_usage.stop()
+    await food_suggester.stop()
+    await cache_warmer.stop()
+    await llm_gateway.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,442 @@
+"""
+Shopping list parsing and consolidation.
+
+The LLM is asked for items matching SHOPPING_LIST_SCHEMA (name, quantity,
+unit, category). Its output, free-text fallbacks and user-edited lists all go
+through the same local engine, which:
+
+- parses quantities and units ("1 1/2 cups", "2-3 lbs", "½ tsp", "200 g",
+  "1 (15 oz) can", "chicken breast (2 lbs)"); a range counts as its upper
+  bound, so merged totals err on buying enough
+- converts to the imperial units the prompt mandates (oz/lb by weight,
+  tsp/tbsp/cup/gallon by volume; metric inputs are converted)
+- merges duplicates across the whole list by normalized name and dimension
+- fills ShoppingListItem.quantity with a readable amount ("2 1/4 lbs")
+
+Only items whose quantities parse are merged. An item whose quantity text
+doesn't parse ("a handful") is kept exactly as written, and an item that
+isn't merged with anything keeps the user's own quantity text ("1 gallon",
+"2-3 lbs").
+
+Everything is pure Python with table lookups, so it is deterministic and
+cheap enough to run on every list edit.
+"""
+import json
+import re
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Tuple
+
+CATEGORIES = ["produce", "proteins", "dairy", "pantry", "frozen", "other"]
+# Dimension of items whose quantity text doesn't parse; they are never merged
+UNMEASURED = "unmeasured"
+
+SHOPPING_LIST_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "quantity": {"type": ["number", "null"]},
+                    "unit": {"type": ["string", "null"]},
+                    "category": {"type": "string", "enum": CATEGORIES},
+                },
+                "required": ["name", "quantity", "unit", "category"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["items"],
+    "additionalProperties": False,
+}
+
+# unit alias -> (dimension, factor into the dimension's base unit)
+# Base units: weight = oz, volume = tsp, count = each
+UNITS: Dict[str, Tuple[str, float]] = {}
+for _aliases, _dimension, _factor in [
+    (("oz", "ounce", "ounces"), "weight", 1.0),
+    (("lb", "lbs", "pound", "pounds"), "weight", 16.0),
+    (("g", "gram", "grams"), "weight", 0.035274),
+    (("kg", "kilogram", "kilograms", "kgs"), "weight", 35.274),
+    (("tsp", "teaspoon", "teaspoons"), "volume", 1.0),
+    (("tbsp", "tablespoon", "tablespoons", "tbs", "tbl"), "volume", 3.0),
+    (("cup", "cups"), "volume", 48.0),
+    (("fl oz", "fluid ounce", "fluid ounces"), "volume", 6.0),
+    (("pint", "pints", "pt"), "volume", 96.0),
+    (("quart", "quarts", "qt"), "volume", 192.0),
+    (("gallon", "gallons", "gal"), "volume", 768.0),
+    (("ml", "milliliter", "milliliters", "millilitre", "millilitres"), "volume", 0.202884),
+    (("l", "liter", "liters", "litre", "litres"), "volume", 202.884),
+    (("dozen",), "count", 12.0),
+]:
+    for _alias in _aliases:
+        UNITS[_alias] = (_dimension, _factor)
+
+# Single-letter abbreviations where case matters: "1 T" is a tablespoon, "1 t" a teaspoon
+CASE_SENSITIVE_UNITS = {"t": UNITS["tsp"], "T": UNITS["tbsp"], "c": UNITS["cup"], "C": UNITS["cup"]}
+
+# Countable packaging units are kept as their own dimension so "2 cans" never merges with "8 oz"
+PACKAGE_UNITS = {
+    "can": "can", "cans": "can", "jar": "jar", "jars": "jar", "bag": "bag", "bags": "bag",
+    "box": "box", "boxes": "box", "package": "package", "packages": "package", "pkg": "package",
+    "bunch": "bunch", "bunches": "bunch", "head": "head", "heads": "head",
+    "clove": "clove", "cloves": "clove", "bottle": "bottle", "bottles": "bottle",
+    "loaf": "loaf", "loaves": "loaf", "container": "container", "containers": "container",
+    "carton": "carton", "cartons": "carton", "slice": "slice", "slices": "slice",
+    "stalk": "stalk", "stalks": "stalk", "sprig": "sprig", "sprigs": "sprig",
+}
+
+UNICODE_FRACTIONS = {"½": "1/2", "⅓": "1/3", "⅔": "2/3", "¼": "1/4", "¾": "3/4", "⅛": "1/8", "⅜": "3/8", "⅝": "5/8", "⅞": "7/8"}
+
+NUMBER = r"\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?"
+UNIT_ALTERNATION = "|".join(
+    re.escape(u) for u in sorted(set(UNITS) | set(PACKAGE_UNITS) | {u.lower() for u in CASE_SENSITIVE_UNITS}, key=len, reverse=True)
+)
+LEADING_QUANTITY = re.compile(
+    rf"^(?P<amount>{NUMBER})(?:\s*(?:-|to)\s*(?P<upper>{NUMBER}))?\s*"
+    rf"(?:\((?P<inner>[^)]*)\)\s*)?(?:(?P<unit>{UNIT_ALTERNATION})\.?(?=\s|$)\s*(?:\([^)]*\)\s*)?(?:of\s+)?)?(?P<name>.*)$",
+    re.IGNORECASE,
+)
+TRAILING_QUANTITY = re.compile(
+    rf"^(?P<name>.*?)\s*(?:[(:,–—-]\s*)(?P<amount>{NUMBER})(?:\s*(?:-|to)\s*(?P<upper>{NUMBER}))?\s*"
+    rf"(?P<unit>{UNIT_ALTERNATION})?\.?\s*\)?$",
+    re.IGNORECASE,
+)
+BULLET = re.compile(r"^\s*(?:[-*•·]+|\d+[.)](?=\s))\s*")
+
+# Words that don't change what to buy
+NAME_NOISE = {"fresh", "large", "medium", "small", "whole", "organic", "about", "approx", "approximately"}
+
+# Matched as whole words (singular or plural) and checked in order: packaged forms and
+# specific phrases come before the broad single words they contain ("chicken broth", "green beans")
+CATEGORY_KEYWORDS = [
+    ("frozen", ("frozen",)),
+    ("pantry", (
+        "canned", "dried", "broth", "stock", "sauce", "peanut butter", "almond butter", "coconut milk",
+        "black pepper", "bread crumb", "noodle",
+    )),
+    ("produce", ("green bean", "bean sprout", "sweet potato", "bell pepper", "eggplant")),
+    ("dairy", (
+        "milk", "buttermilk", "butter", "yogurt", "yoghurt", "cheese", "cheddar", "mozzarella", "parmesan",
+        "feta", "cottage", "kefir", "cream",
+    )),
+    ("proteins", (
+        "chicken", "beef", "pork", "turkey", "salmon", "tuna", "cod", "tilapia", "shrimp", "fish",
+        "egg", "tofu", "tempeh", "lamb", "sausage", "bacon", "steak",
+    )),
+    ("produce", (
+        "apple", "banana", "berry", "strawberry", "blueberry", "raspberry", "spinach", "kale", "lettuce", "tomato", "onion", "garlic",
+        "pepper", "broccoli", "cauliflower", "carrot", "cucumber", "zucchini", "avocado", "lemon", "lime",
+        "celery", "mushroom", "asparagus", "cabbage", "herb", "cilantro", "parsley", "basil", "greens", "squash",
+        "potato", "orange", "pear", "grape", "ginger", "radish", "arugula",
+    )),
+    ("pantry", (
+        "oil", "vinegar", "rice", "quinoa", "oat", "flour", "bean", "lentil", "chickpea", "nut", "almond",
+        "walnut", "peanut", "pecan", "seed", "spice", "salt", "pasta", "bread", "tortilla", "honey",
+        "cinnamon", "cumin", "paprika", "oregano", "mustard",
+    )),
+]
+
+CATEGORY_HEADINGS = {
+    "produce": "produce", "fresh produce": "produce",
+    "proteins": "proteins", "proteins meatfish": "proteins", "proteins meatfishdairy": "proteins",
+    "meat": "proteins", "fish": "proteins", "dairy": "dairy",
+    "pantry": "pantry", "pantry items": "pantry",
+    "frozen": "frozen", "frozen foods": "frozen",
+    "other": "other", "other items": "other",
+}
+
+
+def _number(text: str) -> float:
+    total = 0.0
+    for part in text.split():
+        total += float(Fraction(part)) if "/" in part else float(part)
+    return total
+
+
+def _clean_name(name: str) -> str:
+    name = re.sub(r"\s+", " ", name.strip(" .,:;-–—*")).strip()
+    return name[:1].upper() + name[1:] if name else name
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3 or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("ves"):
+        return word[:-3] + "f"
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def normalize_name(name: str) -> str:
+    """Merge key for an ingredient name: lowercase, singular, without size/freshness words"""
+    words = re.findall(r"[a-z]+", name.lower())
+    return " ".join(_singular(w) for w in words if w not in NAME_NOISE)
+
+
+def _words(text: str) -> List[str]:
+    return [_singular(w) for w in re.findall(r"[a-z]+", text.lower())]
+
+
+CATEGORY_PHRASES = [(category, [_words(keyword) for keyword in keywords]) for category, keywords in CATEGORY_KEYWORDS]
+
+
+def categorize(name: str, suggested: Optional[str] = None) -> str:
+    if suggested in CATEGORIES and suggested != "other":
+        return suggested
+    words = _words(name)
+    for category, phrases in CATEGORY_PHRASES:
+        for phrase in phrases:
+            if any(words[i:i + len(phrase)] == phrase for i in range(len(words) - len(phrase) + 1)):
+                return category
+    return "other"
+
+
+def resolve_unit(unit: Optional[str]) -> Tuple[str, float, Optional[str]]:
+    """(dimension, factor to base unit, package name) for a unit string"""
+    if not unit:
+        return "count", 1.0, None
+    if unit.strip().rstrip(".") in CASE_SENSITIVE_UNITS:
+        dimension, factor = CASE_SENSITIVE_UNITS[unit.strip().rstrip(".")]
+        return dimension, factor, None
+    key = unit.strip().lower().rstrip(".")
+    if key in UNITS:
+        dimension, factor = UNITS[key]
+        return dimension, factor, None
+    if key in PACKAGE_UNITS:
+        return f"package:{PACKAGE_UNITS[key]}", 1.0, PACKAGE_UNITS[key]
+    singular = _singular(key)
+    if singular in PACKAGE_UNITS:
+        return f"package:{PACKAGE_UNITS[singular]}", 1.0, PACKAGE_UNITS[singular]
+    return f"package:{key}", 1.0, key
+
+
+def parse_item_text(text: str) -> Dict[str, Any]:
+    """Split a free-text line like '2 lbs chicken breast' into name, amount and unit"""
+    text = BULLET.sub("", text or "").strip()
+    for fraction, ascii_fraction in UNICODE_FRACTIONS.items():
+        text = re.sub(rf"(\d){fraction}", rf"\1 {ascii_fraction}", text)
+        text = text.replace(fraction, ascii_fraction)
+
+    match = LEADING_QUANTITY.match(text)
+    if match and match.group("name").strip():
+        amount = _number(match.group("upper") or match.group("amount"))
+        unit = match.group("unit")
+        inner = match.group("inner")
+        name = match.group("name")
+        if not unit and inner:
+            # "1 (15 oz) can beans": the outer count is in the package unit that follows
+            inner_match = LEADING_QUANTITY.match(inner.strip() + " x")
+            package = re.match(rf"^({UNIT_ALTERNATION})\b\s*(.*)$", name.strip(), re.IGNORECASE)
+            if package:
+                unit, name = package.group(1), package.group(2)
+            elif inner_match and inner_match.group("unit"):
+                amount *= _number(inner_match.group("amount"))
+                unit = inner_match.group("unit")
+        return {"name": _clean_name(name), "amount": amount, "unit": unit}
+
+    match = TRAILING_QUANTITY.match(text)
+    if match and match.group("name").strip():
+        return {
+            "name": _clean_name(match.group("name")),
+            "amount": _number(match.group("upper") or match.group("amount")),
+            "unit": match.group("unit"),
+        }
+    return {"name": _clean_name(text), "amount": None, "unit": None}
+
+
+def _format_amount(value: float, denominators=(2, 3, 4)) -> str:
+    """Render a number as a whole number plus a kitchen fraction, e.g. 2.25 -> '2 1/4'"""
+    best = Fraction(round(value * 4), 4)
+    for denominator in denominators:
+        candidate = Fraction(round(value * denominator), denominator)
+        if abs(float(candidate) - value) < abs(float(best) - value) - 1e-9:
+            best = candidate
+    if best == 0:
+        best = Fraction(1, max(denominators))
+    whole, remainder = divmod(best.numerator, best.denominator)
+    if not remainder:
+        return str(whole)
+    fraction = f"{remainder}/{best.denominator}"
+    return f"{whole} {fraction}" if whole else fraction
+
+
+def _plural(unit: str, amount: float) -> str:
+    if amount <= 1 or unit in ("oz", "tsp", "tbsp"):
+        return unit
+    return unit + ("es" if unit.endswith(("x", "ch", "sh")) else "s")
+
+
+def format_quantity(dimension: str, base_amount: float) -> str:
+    """Readable imperial quantity for an amount in the dimension's base unit"""
+    if dimension == "weight":
+        if base_amount >= 16:
+            pounds = base_amount / 16
+            return f"{_format_amount(pounds, (2, 4))} {'lb' if pounds <= 1 else 'lbs'}"
+        return f"{_format_amount(base_amount, (2,))} oz"
+    if dimension == "volume":
+        if base_amount >= 768 and base_amount % 192 == 0:
+            # Whole quarts read better in gallons; anything else stays in cups
+            gallons = base_amount / 768
+            return f"{_format_amount(gallons, (2, 4))} {_plural('gallon', gallons)}"
+        if base_amount >= 12:
+            cups = base_amount / 48
+            return f"{_format_amount(cups)} {_plural('cup', cups)}"
+        if base_amount >= 3:
+            return f"{_format_amount(base_amount / 3, (2,))} tbsp"
+        return f"{_format_amount(base_amount, (2, 4))} tsp"
+    if dimension.startswith("package:"):
+        unit = dimension.split(":", 1)[1]
+        return f"{_format_amount(base_amount, (2,))} {_plural(unit, base_amount)}"
+    return _format_amount(base_amount, (2,))
+
+
+def measure_item(raw: Dict[str, Any]) -> Optional[Tuple[str, str, str, Optional[float]]]:
+    """(display name, merge key, dimension, amount in the dimension's base unit) for an item dict
+
+    Returns None for items without a usable name. Items whose quantity text
+    doesn't parse keep their name and get the UNMEASURED dimension.
+    """
+    name = raw.get("name") or raw.get("item") or ""
+    amount = raw.get("quantity")
+    unit = raw.get("unit")
+    if isinstance(amount, str) and amount.strip():
+        parsed = parse_item_text(f"{amount} {name}")
+        if parsed["amount"] is None:
+            name = _clean_name(name)
+            return (name, normalize_name(name), UNMEASURED, None) if normalize_name(name) else None
+        name, amount, unit = parsed["name"], parsed["amount"], unit or parsed["unit"]
+    elif amount is None or isinstance(amount, str):
+        # Quantity may be embedded in the name ("2 lbs chicken breast")
+        parsed = parse_item_text(name)
+        name, amount, unit = parsed["name"], parsed["amount"], unit or parsed["unit"]
+    name = _clean_name(name)
+    key_name = normalize_name(name)
+    if not key_name:
+        return None
+    dimension, factor, _ = resolve_unit(unit)
+    return name, key_name, dimension, (float(amount) * factor if amount is not None else None)
+
+
+def with_merge_fields(item: Dict[str, Any]) -> Dict[str, Any]:
+    """A stored ShoppingListItem dict plus the fields lists are merged on
+
+    ``merge_key`` (normalized name), ``dimension`` and ``base_amount`` are
+    stored with each item when its list is written, so merged views across
+    lists can be aggregated in MongoDB without re-parsing quantities.
+    """
+    measured = measure_item(item)
+    if measured is None:
+        return {**item, "merge_key": None, "dimension": None, "base_amount": None}
+    _, key_name, dimension, base_amount = measured
+    return {**item, "merge_key": key_name, "dimension": dimension, "base_amount": base_amount}
+
+
+def consolidate_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge items by normalized name and dimension into ShoppingListItem dicts
+
+    Input items are dicts with ``name`` (or ``item``), optional ``quantity``
+    (number or text such as "2 lbs"), ``unit``, ``category``, ``checked`` and
+    ``id``. Output order follows the first occurrence of each merged item,
+    which also keeps its id. Items with unparseable quantity text are passed
+    through unmerged, and items merged with nothing keep their quantity text.
+    """
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for position, raw in enumerate(items):
+        measured = measure_item(raw)
+        if measured is None:
+            continue
+        name, key_name, dimension, base_amount = measured
+        key = (key_name, dimension) if dimension != UNMEASURED else position
+        entry = merged.get(key)
+        if entry is None:
+            entry = merged[key] = {
+                "item": name,
+                "category": categorize(name, raw.get("category")),
+                "dimension": dimension,
+                "amount": None,
+                "checked": bool(raw.get("checked", False)),
+                "id": raw.get("id"),
+                "sources": 0,
+                "text": None,
+            }
+        else:
+            entry["checked"] = entry["checked"] and bool(raw.get("checked", False))
+        entry["sources"] += 1
+        quantity = raw.get("quantity")
+        if isinstance(quantity, str) and quantity.strip():
+            entry["text"] = ((raw.get("name") or raw.get("item") or "").strip() or name, quantity.strip())
+        if base_amount is not None:
+            entry["amount"] = (entry["amount"] or 0.0) + base_amount
+
+    consolidated = []
+    for entry in merged.values():
+        if entry["sources"] == 1 and entry["text"]:
+            # Nothing to merge: keep the item as the user wrote it
+            item, quantity = entry["text"]
+        else:
+            item = entry["item"]
+            quantity = format_quantity(entry["dimension"], entry["amount"]) if entry["amount"] else None
+        consolidated.append({
+            "item": item,
+            "category": entry["category"],
+            "quantity": quantity,
+            "checked": entry["checked"],
+            **({"id": entry["id"]} if entry["id"] else {}),
+        })
+    return consolidated
+
+
+def parse_structured_response(text: str) -> Optional[List[Dict[str, Any]]]:
+    """Items from a JSON response matching SHOPPING_LIST_SCHEMA, or None if it isn't JSON"""
+    body = (text or "").strip()
+    if body.startswith("```"):
+        body = re.sub(r"^```(?:json)?\s*|\s*```$", "", body)
+    try:
+        data = json.loads(body)
+    except ValueError:
+        start, end = body.find("{"), body.rfind("}")
+        if start < 0 or end <= start:
+            return None
+        try:
+            data = json.loads(body[start:end + 1])
+        except ValueError:
+            return None
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None
+    return [item for item in items if isinstance(item, dict) and item.get("name")]
+
+
+def parse_text_response(text: str) -> List[Dict[str, Any]]:
+    """Items from a free-text list organized under category headings"""
+    items = []
+    category = "other"
+    for line in (text or "").split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        heading = re.sub(r"[^a-z ]", "", line.lower()).strip()
+        if heading in CATEGORY_HEADINGS and (line.endswith(":") or not BULLET.match(line)):
+            category = CATEGORY_HEADINGS[heading]
+            continue
+        if BULLET.match(line) or line[0].isdigit():
+            parsed = parse_item_text(line)
+            if len(parsed["name"]) > 2:
+                items.append({**parsed, "quantity": parsed.pop("amount"), "category": category})
+    return items
+
+
+def build_shopping_list_items(response_text: str) -> List[Dict[str, Any]]:
+    """Consolidated ShoppingListItem dicts from an LLM response (JSON or free text)"""
+    items = parse_structured_response(response_text)
+    if items is None:
+        items = parse_text_response(response_text)
+    return consolidate_items(items)
@@ -0,0 +1,194 @@
+"""
+Background shopping-list generation jobs.
+
+POST /shopping-lists/generate records a job in ``db.shopping_list_jobs`` and
+returns its id immediately; the LLM completion and parsing run in a
+background task and the finished list is stored in ``db.shopping_lists``.
+
+Jobs are idempotent per user and meal plan: the job key is a hash of the
+user id and the normalized meal plan text, unique-indexed, so resubmitting
+the same plan (e.g. a client retry) returns the existing job. Failed jobs and
+jobs orphaned by a restarted worker are re-run on resubmission; until then,
+an orphaned job is reported (and recorded) as failed once it has not been
+updated for ``stale_after_seconds``, so pollers stop waiting for it. Job records
+expire through a TTL index, which also bounds the de-duplication window.
+
+Completion can be polled (GET /shopping-lists/jobs/{id}) or pushed as SSE
+(GET /shopping-lists/jobs/{id}/events).
+"""
+import asyncio
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def meal_plan_hash(user_id: str, meal_plan_text: str) -> str:
+    normalized = " ".join((meal_plan_text or "").split()).lower()
+    return hashlib.sha256(f"{user_id}|{normalized}".encode()).hexdigest()
+
+
+class ShoppingListJobs:
+    """Submits, runs and reports shopping-list generation jobs"""
+
+    def __init__(self, db, ttl_seconds: int = 7 * 86400, stale_after_seconds: int = 600):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        # A running job not updated for this long is assumed lost with its worker
+        self.stale_after_seconds = stale_after_seconds
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        self.stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0}
+
+    async def ensure_indexes(self):
+        await self.db.shopping_list_jobs.create_index("id", unique=True)
+        await self.db.shopping_list_jobs.create_index("content_hash", unique=True)
+        await self.db.shopping_list_jobs.create_index("expires_at", expireAfterSeconds=0)
+
+    async def submit(
+        self,
+        user_id: str,
+        meal_plan_text: str,
+        generate: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """Return the job for this meal plan, starting it unless it already ran or is running
+
+        ``generate`` produces the list and returns ``{"shopping_list_id", "ai_response"}``.
+        """
+        content_hash = meal_plan_hash(user_id, meal_plan_text)
+        now = datetime.now(timezone.utc)
+        job_id = str(uuid.uuid4())
+        job = await self.db.shopping_list_jobs.find_one_and_update(
+            {"content_hash": content_hash},
+            {"$setOnInsert": {
+                "id": job_id,
+                "user_id": user_id,
+                "content_hash": content_hash,
+                "status": "queued",
+                "created_at": now,
+                "updated_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 0}
+        )
+
+        if job["id"] != job_id and not await self._claim_for_rerun(job):
+            self.stats["deduplicated"] += 1
+            return job
+
+        self.stats["submitted"] += 1
+        job = {**job, "status": "queued"}
+        self._start(job["id"], generate)
+        return job
+
+    async def _claim_for_rerun(self, job: Dict[str, Any]) -> bool:
+        """Atomically take over a failed, orphaned or deleted-list job; False to leave it alone"""
+        if job["status"] == "failed":
+            claim = {"status": "failed"}
+        elif job["status"] == "completed":
+            # Regenerate if the user has since deleted the list this job produced
+            if await self.db.shopping_lists.find_one({"id": job.get("shopping_list_id")}, {"_id": 1}):
+                return False
+            claim = {"status": "completed", "shopping_list_id": job.get("shopping_list_id")}
+        elif job["status"] in ("queued", "running") and job["id"] not in self._tasks:
+            stale_before = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after_seconds)
+            claim = {"status": {"$in": ["queued", "running"]}, "updated_at": {"$lt": stale_before}}
+        else:
+            return False
+        now = datetime.now(timezone.utc)
+        result = await self.db.shopping_list_jobs.update_one(
+            {"id": job["id"], **claim},
+            {"$set": {
+                "status": "queued",
+                "updated_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            }, "$unset": {"error": ""}}
+        )
+        return result.modified_count == 1
+
+    def _start(self, job_id: str, generate: Callable[[], Awaitable[Dict[str, Any]]]):
+        self._events[job_id] = asyncio.Event()
+        task = asyncio.create_task(self._run(job_id, generate))
+        self._tasks[job_id] = task
+
+        def finished(_):
+            self._tasks.pop(job_id, None)
+            event = self._events.pop(job_id, None)
+            if event:
+                event.set()
+
+        task.add_done_callback(finished)
+
+    async def _update(self, job_id: str, fields: Dict[str, Any]):
+        fields["updated_at"] = datetime.now(timezone.utc)
+        await self.db.shopping_list_jobs.update_one({"id": job_id}, {"$set": fields})
+
+    async def _run(self, job_id: str, generate: Callable[[], Awaitable[Dict[str, Any]]]):
+        try:
+            await self._update(job_id, {"status": "running"})
+            result = await generate()
+            await self._update(job_id, {
+                "status": "completed",
+                "shopping_list_id": result["shopping_list_id"],
+                "ai_response": result.get("ai_response"),
+                "completed_at": datetime.now(timezone.utc),
+            })
+            self.stats["completed"] += 1
+        except Exception as e:
+            logging.error(f"Shopping list job {job_id} failed: {e}")
+            self.stats["failed"] += 1
+            try:
+                await self._update(job_id, {"status": "failed", "error": str(e)})
+            except Exception as update_error:
+                logging.error(f"Could not record failure of shopping list job {job_id}: {update_error}")
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.db.shopping_list_jobs.find_one({"id": job_id}, {"_id": 0, "content_hash": 0})
+        if job and job["status"] in ("queued", "running") and job_id not in self._tasks:
+            return await self._fail_if_stale(job)
+        return job
+
+    async def _fail_if_stale(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Mark a queued/running job nobody has updated lately as failed"""
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after_seconds)
+        failed = await self.db.shopping_list_jobs.find_one_and_update(
+            {"id": job["id"], "status": {"$in": ["queued", "running"]}, "updated_at": {"$lt": stale_before}},
+            {"$set": {
+                "status": "failed",
+                "error": "The job was interrupted; submit the meal plan again to retry",
+                "updated_at": datetime.now(timezone.utc),
+            }},
+            projection={"_id": 0, "content_hash": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if failed:
+            logging.warning(f"Shopping list job {job['id']} went stale and was marked failed")
+            self.stats["failed"] += 1
+            return failed
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to ``timeout`` seconds for progress, then return the current job
+
+        Jobs running in this process wake the waiter as soon as they finish;
+        jobs on other workers are picked up when the timeout elapses.
+        """
+        event = self._events.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(timeout)
+        return await self.get(job_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "running": len(self._tasks)}
@@ -0,0 +1,189 @@
+"""
+Item-level shopping list updates.
+
+PATCH /shopping-lists/{id} takes operations on items addressed by id:
+
+- ``{"op": "check" | "uncheck", "item_id": ...}``
+- ``{"op": "add", "item": {...}, "position": 0}`` (position optional; default appends)
+- ``{"op": "remove", "item_id": ...}``
+- ``{"op": "reorder", "item_ids": [...]}`` (listed items first, in that order;
+  the rest keep their relative order)
+
+build_item_update compiles a patch into a single update document, so a patch
+is one ``find_one_and_update`` that returns the new list. Patches of a single
+kind use positional operators: ``$set`` on ``items.$[iN].checked`` with array
+filters, ``$pull`` by id, or ``$push`` with ``$position``. MongoDB rejects
+those operators when two of them touch the same array, so mixed patches
+compile to an update pipeline instead, with one stage per operation
+(``$map``/``$filter``/``$concatArrays``). Either way the patch applies
+atomically and bumps ``version`` for optimistic concurrency.
+"""
+import logging
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateMany, UpdateOne
+
+from shopping_list_engine import with_merge_fields
+
+ITEM_OPERATIONS = ("check", "uncheck", "add", "remove", "reorder")
+MAX_OPERATIONS = 100
+
+
+def validate_operations(operations: List[Dict[str, Any]]) -> List[str]:
+    """Check operation shapes; returns the ids of existing items the patch refers to"""
+    if len(operations) > MAX_OPERATIONS:
+        raise ValueError(f"A patch can contain at most {MAX_OPERATIONS} operations")
+    added = {op["item"].get("id") for op in operations if op.get("op") == "add" and op.get("item")}
+    referenced = []
+    for op in operations:
+        kind = op.get("op")
+        if kind not in ITEM_OPERATIONS:
+            raise ValueError(f"Unsupported operation: {kind}")
+        if kind in ("check", "uncheck", "remove"):
+            if not op.get("item_id"):
+                raise ValueError(f"'{kind}' needs an item_id")
+            referenced.append(op["item_id"])
+        elif kind == "add":
+            if not op.get("item"):
+                raise ValueError("'add' needs an item")
+            if op.get("position") is not None and op["position"] < 0:
+                raise ValueError("position must be zero or more")
+        elif kind == "reorder":
+            if not op.get("item_ids"):
+                raise ValueError("'reorder' needs item_ids")
+            referenced.extend(op["item_ids"])
+    return [item_id for item_id in dict.fromkeys(referenced) if item_id not in added]
+
+
+def _positional_update(operations: List[Dict[str, Any]]) -> Optional[Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]]:
+    """Classic operator update for single-kind patches, or None if the patch needs a pipeline"""
+    kinds = {op["op"] for op in operations}
+    if kinds <= {"check", "uncheck"}:
+        checked = {op["item_id"]: op["op"] == "check" for op in operations}  # last operation per item wins
+        update = {"$set": {f"items.$[i{n}].checked": value for n, value in enumerate(checked.values())}}
+        return update, [{f"i{n}.id": item_id} for n, item_id in enumerate(checked)]
+    if kinds == {"remove"}:
+        return {"$pull": {"items": {"id": {"$in": [op["item_id"] for op in operations]}}}}, None
+    if kinds == {"add"}:
+        positions = {op.get("position") for op in operations}
+        if len(positions) == 1:
+            position = positions.pop()
+            push = {"$each": [op["item"] for op in operations]}
+            if position is not None:
+                push["$position"] = position
+            return {"$push": {"items": push}}, None
+    return None
+
+
+def _pipeline_stage(op: Dict[str, Any]) -> Dict[str, Any]:
+    kind = op["op"]
+    if kind in ("check", "uncheck"):
+        items = {"$map": {"input": "$items", "in": {"$cond": [
+            {"$eq": ["$$this.id", {"$literal": op["item_id"]}]},
+            {"$mergeObjects": ["$$this", {"checked": kind == "check"}]},
+            "$$this",
+        ]}}}
+    elif kind == "remove":
+        items = {"$filter": {"input": "$items", "cond": {"$ne": ["$$this.id", {"$literal": op["item_id"]}]}}}
+    elif kind == "add":
+        new_items = {"$literal": [op["item"]]}
+        if op.get("position") is None:
+            items = {"$concatArrays": ["$items", new_items]}
+        else:
+            items = {"$concatArrays": [
+                {"$slice": ["$items", op["position"]]},
+                new_items,
+                {"$slice": ["$items", op["position"], {"$add": [{"$size": "$items"}, 1]}]},
+            ]}
+    else:  # reorder
+        item_ids = {"$literal": op["item_ids"]}
+        listed = {"$map": {"input": item_ids, "as": "item_id", "in": {"$arrayElemAt": [
+            {"$filter": {"input": "$items", "cond": {"$eq": ["$$this.id", "$$item_id"]}}}, 0
+        ]}}}
+        items = {"$concatArrays": [
+            {"$filter": {"input": listed, "cond": {"$ne": ["$$this", None]}}},
+            {"$filter": {"input": "$items", "cond": {"$not": [{"$in": ["$$this.id", item_ids]}]}}},
+        ]}
+    return {"$set": {"items": items}}
+
+
+def build_item_update(
+    operations: List[Dict[str, Any]],
+    title: Optional[str] = None,
+) -> Tuple[Any, Optional[List[Dict[str, Any]]]]:
+    """(update, array_filters) applying a patch in one find_one_and_update
+
+    ``add`` operations must carry complete item documents (with ``id`` and
+    merge fields).
+    """
+    positional = _positional_update(operations) if operations else ({}, None)
+    if positional is not None:
+        update, array_filters = positional
+        if title is not None:
+            update.setdefault("$set", {})["title"] = title
+        update["$inc"] = {"version": 1}
+        return update, array_filters
+
+    stages = [_pipeline_stage(op) for op in operations]
+    stages.append({"$set": {
+        "version": {"$add": [{"$ifNull": ["$version", 1]}, 1]},
+        **({"title": {"$literal": title}} if title is not None else {}),
+    }})
+    return stages, None
+
+
+async def backfill_list_items(db, batch_size: int = 500) -> int:
+    """Give older lists a version and their items ids and merge fields, so they can be patched and merged"""
+    await db.shopping_lists.create_index("id")
+    await db.shopping_lists.create_index([("user_id", 1), ("created_at", -1)])
+    cursor = db.shopping_lists.find(
+        {"$or": [
+            {"version": {"$exists": False}},
+            {"items": {"$elemMatch": {"$or": [{"id": {"$exists": False}}, {"merge_key": {"$exists": False}}]}}},
+        ]},
+        {"_id": 1, "items": 1, "version": 1}
+    ).batch_size(batch_size)
+
+    updated = 0
+    operations = []
+    async for doc in cursor:
+        items = [with_merge_fields({**item, "id": item.get("id") or str(uuid.uuid4())}) for item in doc.get("items") or []]
+        operations.append(UpdateOne(
+            {"_id": doc["_id"], "version": doc.get("version")},
+            {"$set": {"items": items, "version": doc.get("version") or 1}}
+        ))
+        if len(operations) >= batch_size:
+            updated += (await db.shopping_lists.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await db.shopping_lists.bulk_write(operations, ordered=False)).modified_count
+    if updated:
+        logging.info(f"Backfilled item ids and merge fields on {updated} shopping lists")
+    return updated
+
+
+async def backfill_list_tenants(db, batch_size: int = 500) -> int:
+    """Stamp tenantless lists with their owner's tenant, so authenticated owners keep access to them
+
+    Lists created before tenant scoping have no ``tenant_id``, while
+    authenticated callers only see lists of their own tenant. Lists whose
+    ``user_id`` is not an account stay tenantless (anonymous lists).
+    """
+    await db.shopping_lists.create_index("tenant_id")
+    user_ids = await db.shopping_lists.distinct("user_id", {"tenant_id": None})
+    updated = 0
+    for start in range(0, len(user_ids), batch_size):
+        owners = await db.users.find(
+            {"id": {"$in": user_ids[start:start + batch_size]}, "tenant_id": {"$ne": None}},
+            {"_id": 0, "id": 1, "tenant_id": 1}
+        ).to_list(None)
+        operations = [
+            UpdateMany({"user_id": owner["id"], "tenant_id": None}, {"$set": {"tenant_id": owner["tenant_id"]}})
+            for owner in owners
+        ]
+        if operations:
+            updated += (await db.shopping_lists.bulk_write(operations, ordered=False)).modified_count
+    if updated:
+        logging.info(f"Backfilled tenant_id on {updated} shopping lists")
+    return updated
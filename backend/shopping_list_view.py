@@ -0,0 +1,77 @@
+"""
+Consolidated view across several shopping lists.
+
+Every stored item carries its merge fields (``merge_key``, ``dimension``,
+``base_amount``; see shopping_list_engine.with_merge_fields). They are
+written whenever a list is created or changed, so the view only re-reads what
+the lists already hold. A single aggregation pipeline unwinds the selected
+lists and groups their items by normalized ingredient and unit dimension,
+summing amounts in base units. The groups are then formatted back into
+imperial quantities and grouped by category.
+
+Items whose quantity text doesn't parse (dimension UNMEASURED) are never
+merged, and an item with a single source keeps that item's quantity text.
+A merged item is checked only when every source item is checked. Each merged
+item lists its sources (list id, item id), so the client can tick them with
+PATCH /shopping-lists/{id}.
+"""
+from typing import Any, Dict, List, Optional
+
+from shopping_list_engine import CATEGORIES, UNMEASURED, format_quantity
+
+
+def consolidated_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Aggregation over db.shopping_lists merging the items of the matched lists"""
+    return [
+        {"$match": match},
+        # Oldest list first, so its spelling of a merged item is the one shown
+        {"$sort": {"created_at": 1}},
+        {"$unwind": {"path": "$items", "includeArrayIndex": "position"}},
+        {"$match": {"items.merge_key": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": {
+                "key": "$items.merge_key",
+                "dimension": "$items.dimension",
+                # Unmeasured items group alone
+                "source": {"$cond": [{"$eq": ["$items.dimension", UNMEASURED]}, ["$id", "$position"], None]},
+            },
+            "item": {"$first": "$items.item"},
+            "category": {"$first": "$items.category"},
+            "base_amount": {"$sum": "$items.base_amount"},
+            "measured": {"$sum": {"$cond": [{"$gt": ["$items.base_amount", None]}, 1, 0]}},
+            "checked": {"$min": {"$ifNull": ["$items.checked", False]}},
+            "sources": {"$push": {
+                "list_id": "$id",
+                "item_id": "$items.id",
+                "quantity": "$items.quantity",
+                "checked": {"$ifNull": ["$items.checked", False]},
+            }},
+        }},
+        {"$sort": {"_id.key": 1, "_id.dimension": 1}},
+    ]
+
+
+def format_consolidated(groups: List[Dict[str, Any]], list_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Shape pipeline output as categories of merged items with imperial quantities"""
+    by_category: Dict[str, List[Dict[str, Any]]] = {category: [] for category in CATEGORIES}
+    for group in groups:
+        dimension = group["_id"].get("dimension") or "count"
+        if len(group["sources"]) == 1:
+            quantity = group["sources"][0].get("quantity")
+        elif group["measured"] and group["base_amount"]:
+            quantity = format_quantity(dimension, group["base_amount"])
+        else:
+            quantity = None
+        by_category.setdefault(group.get("category") or "other", []).append({
+            "item": group["item"],
+            "quantity": quantity,
+            "checked": bool(group["checked"]),
+            "sources": group["sources"],
+        })
+    categories = [{"category": category, "items": items} for category, items in by_category.items() if items]
+    return {
+        "list_ids": list_ids,
+        "categories": categories,
+        "item_count": sum(len(category["items"]) for category in categories),
+        "checked_count": sum(item["checked"] for category in categories for item in category["items"]),
+    }
@@ -0,0 +1,113 @@
+"""
+Table-driven parsing of USDA FoodData Central nutrient data.
+
+Nutrients are matched by USDA nutrient ID or nutrient number rather than by
+name, and converted to the units FoodNutrition stores (kcal, grams, and
+milligrams for sodium). The same parser handles every payload shape we see:
+
+- /foods/search results: ``{"nutrientId", "nutrientNumber", "unitName", "value"}``
+- /food/{id} and /foods (full format) and bulk downloads:
+  ``{"nutrient": {"id", "number", "unitName"}, "amount"}``
+- abridged format: ``{"number", "unitName", "amount"}``
+"""
+from typing import Any, Dict, List, NamedTuple, Optional
+
+
+class NutrientSpec(NamedTuple):
+    nutrient_id: int
+    number: str
+    column: str
+    unit: str
+    rank: int  # Lower wins when several entries map to the same column
+
+
+# FoodNutrition columns, in storage order
+NUTRIENT_COLUMNS = ["calories", "carbohydrates", "sugars", "fiber", "protein", "fat", "sodium"]
+
+NUTRIENT_SPECS = [
+    NutrientSpec(1008, "208", "calories", "kcal", 0),       # Energy
+    NutrientSpec(2047, "957", "calories", "kcal", 1),       # Energy (Atwater General Factors)
+    NutrientSpec(2048, "958", "calories", "kcal", 2),       # Energy (Atwater Specific Factors)
+    NutrientSpec(1062, "268", "calories", "kcal", 3),       # Energy in kJ, converted
+    NutrientSpec(1005, "205", "carbohydrates", "g", 0),     # Carbohydrate, by difference
+    NutrientSpec(1050, "205.2", "carbohydrates", "g", 1),   # Carbohydrate, by summation
+    NutrientSpec(2000, "269", "sugars", "g", 0),            # Sugars, total including NLEA
+    NutrientSpec(1063, "269.3", "sugars", "g", 1),          # Sugars, Total NLEA
+    NutrientSpec(1079, "291", "fiber", "g", 0),             # Fiber, total dietary
+    NutrientSpec(1003, "203", "protein", "g", 0),           # Protein
+    NutrientSpec(1004, "204", "fat", "g", 0),               # Total lipid (fat)
+    NutrientSpec(1085, "298", "fat", "g", 1),               # Total fat (NLEA)
+    NutrientSpec(1093, "307", "sodium", "mg", 0),           # Sodium, Na
+]
+
+NUTRIENTS_BY_ID = {spec.nutrient_id: spec for spec in NUTRIENT_SPECS}
+NUTRIENTS_BY_NUMBER = {spec.number: spec for spec in NUTRIENT_SPECS}
+
+# Nutrient numbers to request from USDA endpoints that accept a filter
+REQUESTED_NUTRIENT_NUMBERS = sorted({int(float(spec.number)) for spec in NUTRIENT_SPECS})
+
+# Conversion factors into each target unit
+UNIT_FACTORS = {
+    "g": {"g": 1.0, "mg": 0.001, "ug": 0.000001, "µg": 0.000001},
+    "mg": {"mg": 1.0, "g": 1000.0, "ug": 0.001, "µg": 0.001},
+    "kcal": {"kcal": 1.0, "kj": 1 / 4.184},
+}
+
+
+def convert_unit(amount: float, unit: Optional[str], target: str) -> Optional[float]:
+    """Convert an amount into the target unit; None if the unit is incompatible"""
+    if not unit:
+        return float(amount)
+    factor = UNIT_FACTORS[target].get(unit.lower())
+    return float(amount) * factor if factor is not None else None
+
+
+def lookup_spec(entry: Dict[str, Any]) -> Optional[NutrientSpec]:
+    """Resolve a foodNutrients entry (any payload shape) to its NutrientSpec"""
+    nutrient = entry.get("nutrient")
+    if nutrient:
+        nutrient_id, number = nutrient.get("id"), nutrient.get("number")
+    else:
+        # Top-level "id" on full-format entries is the food_nutrient row, not the nutrient
+        nutrient_id, number = entry.get("nutrientId"), entry.get("nutrientNumber", entry.get("number"))
+
+    spec = NUTRIENTS_BY_ID.get(nutrient_id) if nutrient_id is not None else None
+    if spec is None and number is not None:
+        spec = NUTRIENTS_BY_NUMBER.get(str(number))
+    return spec
+
+
+def parse_food_nutrients(entries: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Extract normalized FoodNutrition values from a foodNutrients list"""
+    values: Dict[str, float] = {}
+    ranks: Dict[str, int] = {}
+    for entry in entries or []:
+        spec = lookup_spec(entry)
+        if spec is None or ranks.get(spec.column, len(NUTRIENT_SPECS)) <= spec.rank:
+            continue
+
+        nutrient = entry.get("nutrient") or {}
+        amount = entry.get("amount", entry.get("value"))
+        unit = nutrient.get("unitName", entry.get("unitName"))
+        if amount is None:
+            continue
+        try:
+            value = convert_unit(amount, unit, spec.unit)
+        except (TypeError, ValueError):
+            continue
+        if value is None:
+            continue
+
+        values[spec.column] = round(value, 2)
+        ranks[spec.column] = spec.rank
+    return values
+
+
+def parse_food(food_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a USDA food payload from any endpoint or bulk download"""
+    return {
+        "fdc_id": food_data.get("fdcId"),
+        "description": food_data.get("description") or food_data.get("lowercaseDescription") or "",
+        "brand_name": food_data.get("brandOwner") or food_data.get("brandName"),
+        "nutrients": parse_food_nutrients(food_data.get("foodNutrients", [])),
+    }
@@ -1,6 +1,7 @@
 import requests
 import sys
 import json
+import time
 from datetime import datetime
 
 class GlucoPlannerAPITester:
@@ -590,10 +591,18 @@ class GlucoPlannerAPITester:
             "Generate Shopping List from AI",
             "POST",
             "shopping-lists/generate",
-            200,
+            202,
             data=generation_data
         )
         
+        # Generation runs as a background job; poll its status until it finishes
+        if success and 'job_id' in response:
+            for _ in range(30):
+                if response.get('status') in ('completed', 'failed'):
+                    break
+                time.sleep(2)
+                response = requests.get(f"{self.api_url}/shopping-lists/jobs/{response['job_id']}", timeout=30).json()
+        
         if success and 'shopping_list' in response:
             generated_list = response['shopping_list']
             print(f"   Generated list with {len(generated_list.get('items', []))} items")
@@ -857,6 +857,7 @@ const ShoppingListView = ({ userProfile }) => {
     switch(category) {
       case 'produce': return '🥬';
       case 'proteins': return '🥩';
+      case 'dairy': return '🧀';
       case 'pantry': return '🥫';
       case 'frozen': return '🧊';
       default: return '📦';
@@ -867,6 +868,7 @@ const ShoppingListView = ({ userProfile }) => {
     switch(category) {
       case 'produce': return 'bg-green-100 text-green-700';
       case 'proteins': return 'bg-red-100 text-red-700';
+      case 'dairy': return 'bg-indigo-100 text-indigo-700';
       case 'pantry': return 'bg-yellow-100 text-yellow-700';
       case 'frozen': return 'bg-blue-100 text-blue-700';
       default: return 'bg-gray-100 text-gray-700';
@@ -904,14 +906,14 @@ const ShoppingListView = ({ userProfile }) => {
               </CardTitle>
             </CardHeader>
             <CardContent className="p-6">
-              {['produce', 'proteins', 'pantry', 'frozen', 'other'].map(category => {
+              {['produce', 'proteins', 'dairy', 'pantry', 'frozen', 'other'].map(category => {
                 const categoryItems = list.items.filter(item => item.category === category);
                 if (categoryItems.length === 0) return null;
                 
                 return (
                   <div key={category} className="mb-6">
                     <h4 className={`font-semibold mb-3 px-3 py-1 rounded-full inline-block capitalize ${getCategoryColor(category)}`}>
-                      {getCategoryIcon(category)} {category === 'proteins' ? 'Proteins (Meat/Fish/Dairy)' : category.replace('_', ' ')}
+                      {getCategoryIcon(category)} {category === 'proteins' ? 'Proteins (Meat/Fish)' : category.replace('_', ' ')}
                     </h4>
                     <div className="space-y-2 ml-4">
                       {categoryItems.map((item, index) => {
@@ -1621,6 +1623,20 @@ const Dashboard = ({ userProfile, onBack }) => {
         meal_plan_text: lastMealPlan
       });
 
+      // Generation runs as a background job; poll until it finishes, for at most 3 minutes
+      let job = response.data;
+      const giveUpAt = Date.now() + 3 * 60 * 1000;
+      while (job.status !== "completed" && job.status !== "failed") {
+        if (Date.now() > giveUpAt) {
+          throw new Error("Shopping list generation timed out");
+        }
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        job = (await axios.get(`${API}/shopping-lists/jobs/${job.job_id}`)).data;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Shopping list generation failed");
+      }
+
       toast.success("Shopping list created successfully!");
       setActiveTab("shopping");
       setShowShoppingListButton(false);
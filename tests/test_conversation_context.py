@@ -0,0 +1,111 @@
+"""Conversation context: token budgets, rolling summaries and background folding"""
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from conversation_context import ConversationContextBuilder, count_tokens, truncate_to_tokens  # noqa: E402
+
+
+class FakeSummaries:
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query["conversation_id"])
+        return dict(doc) if doc else None
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs.setdefault(query["conversation_id"], {"conversation_id": query["conversation_id"]}).update(update["$set"])
+
+
+def make_builder(**kwargs):
+    calls = []
+
+    async def summarize(prompt, tenant_id):
+        calls.append((prompt, tenant_id))
+        return f"summary {len(calls)}"
+
+    builder = ConversationContextBuilder(SimpleNamespace(chat_summaries=FakeSummaries()), summarize, **kwargs)
+    return builder, calls
+
+
+def turns(count, start=0):
+    return [(f"question {i}", f"answer {i}", f"2026-01-01T00:00:{i:02d}") for i in range(start, start + count)]
+
+
+def build(builder, history, message="hi", tenant_id="tenant-a"):
+    async def load_turns(since):
+        return [turn for turn in history if turn[2] > since]
+
+    async def run():
+        system_message = await builder.build("chat_u1", "static", message, load_turns, tenant_id)
+        await asyncio.gather(*builder._fold_tasks)
+        return system_message
+
+    return asyncio.run(run())
+
+
+def test_count_and_truncate_tokens():
+    assert count_tokens("Hello, world! 12345") == 8
+    # Long words are charged one token per four characters
+    assert count_tokens("antidisestablishmentarianism") == 7
+    assert count_tokens("") == 0
+    assert truncate_to_tokens("one two three four", 2) == "one two"
+
+
+def test_recent_turns_stay_verbatim_until_a_batch_builds_up():
+    builder, calls = make_builder(max_recent_turns=2, fold_batch=2)
+    system_message = build(builder, turns(3))
+    assert calls == []
+    assert system_message.startswith("static\n\nRecent conversation:\nUser: question 0")
+    assert "Coach: answer 2" in system_message
+    assert builder.static_tokens("static") == count_tokens("static")
+    assert builder.stats["static_cache_hits"] == 1
+
+
+def test_folded_turns_move_into_the_summary():
+    builder, calls = make_builder(max_recent_turns=2, fold_batch=2)
+    history = turns(4)
+    build(builder, history)
+    assert "User: question 1" in calls[0][0] and "question 2" not in calls[0][0]
+    assert builder.stats["folds"] == 1
+
+    # The next turn shows the summary and only the turns after its cursor
+    system_message = build(builder, history)
+    assert "Summary of the earlier conversation:\nsummary 1" in system_message
+    assert "question 1" not in system_message and "question 3" in system_message
+    assert len(calls) == 1
+
+
+def test_turns_over_the_budget_are_folded_at_once():
+    builder, calls = make_builder(max_recent_turns=8, fold_batch=4)
+    long_answer = " ".join(["word"] * 2500)
+    history = [(f"question {i}", long_answer, f"2026-01-01T00:00:0{i}") for i in range(3)]
+    system_message = build(builder, history)
+    assert "question 0" not in system_message and "question 2" in system_message
+    assert builder.stats["budget_folds"] == 1 and len(calls) == 1
+    assert builder.db.chat_summaries.docs["chat_u1"]["summarized_until"] == history[0][2]
+
+
+def test_failed_folds_are_counted_and_retried_later():
+    async def summarize(prompt, tenant_id):
+        raise RuntimeError("llm down")
+
+    builder = ConversationContextBuilder(
+        SimpleNamespace(chat_summaries=FakeSummaries()), summarize, max_recent_turns=1, fold_batch=1
+    )
+    build(builder, turns(3))
+    assert builder.stats["fold_errors"] == 1
+    assert builder.get_stats()["folding"] == 0
+    assert builder.db.chat_summaries.docs == {}
+
+
+def test_summaries_are_billed_to_the_conversation_tenant():
+    builder, calls = make_builder(max_recent_turns=2, fold_batch=2)
+    history = turns(4)
+    build(builder, history)
+    assert [tenant_id for _, tenant_id in calls] == ["tenant-a"]
+    assert builder.db.chat_summaries.docs["chat_u1"]["summarized_until"] == history[1][2]
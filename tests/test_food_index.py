@@ -0,0 +1,95 @@
+"""Offline FDC index: dump importers, search ranking, prefix matching and persistence"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from food_index import FoodDataIndex, import_dump  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+@pytest.fixture(scope="module")
+def index():
+    return import_dump(str(FIXTURES / "fdc_foods.json"))
+
+
+def test_json_import_normalizes_nutrients(index):
+    # The food without a description is skipped
+    assert len(index) == 4
+    brown = index.get("169704")
+    assert brown["description"] == "Rice, brown, long-grain, cooked"
+    assert brown["calories"] == 123
+    assert brown["carbohydrates"] == 25.6
+    assert brown["fiber"] == 1.6
+    assert brown["sugars"] is None
+
+    # Energy in kJ is converted to kcal
+    assert index.get("168875")["calories"] == pytest.approx(364.96, abs=0.01)
+
+    # Search-format entries, brand owners and sodium given in grams
+    crackers = index.get("2000001")
+    assert crackers["brand_name"] == "Snack Co"
+    assert crackers["sodium"] == 500
+    assert index.get("12345") is None
+    assert index.get("not-a-number") is None
+
+
+def test_csv_import_matches_json(index):
+    csv_index = import_dump(str(FIXTURES / "fdc_csv"))
+    assert len(csv_index) == 3
+    brown = csv_index.get("169704")
+    # The kcal energy entry outranks the kJ one listed before it
+    assert brown["calories"] == 123
+    assert {column: brown[column] for column in ("carbohydrates", "fiber")} == {"carbohydrates": 25.6, "fiber": 1.6}
+    crackers = csv_index.get("2000001")
+    assert crackers["brand_name"] == "Snack Co"
+    # Rows without an amount are ignored
+    assert crackers["sodium"] is None
+
+
+def test_search_ranks_full_matches_and_leading_term_first(index):
+    # Foods with every query term outrank partial matches (the white rice)
+    results = [food["fdc_id"] for food in index.search("rice brown", limit=5)]
+    # Equal matches: the description starting with the first query term wins
+    assert results == ["169704", "2000001"]
+
+    # Without that bonus, the shorter description ranks first
+    assert [food["fdc_id"] for food in index.search("brown rice", limit=5)] == ["2000001", "169704"]
+
+    results = [food["fdc_id"] for food in index.search("rice", limit=5)]
+    assert results[:2] == ["169704", "168875"]
+    assert set(results) == {"169704", "168875", "2000001"}
+    assert len(index.search("rice", limit=1)) == 1
+
+
+def test_search_matches_last_term_as_prefix(index):
+    assert [food["fdc_id"] for food in index.search("rice bro")] == ["169704", "2000001"]
+    assert [food["fdc_id"] for food in index.search("eg")] == ["171287"]
+    # Only the last term expands: "ri" matches nothing, so "brown" alone decides
+    assert {food["fdc_id"] for food in index.search("ri brown")} == {"169704", "2000001"}
+    assert index.search("quinoa") == []
+    assert index.search("") == []
+
+
+def test_search_require_all_drops_partial_matches(index):
+    # "salad" and "sandwich" are not in the dump, so the raw egg is only a partial match
+    assert [food["fdc_id"] for food in index.search("egg salad sandwich")] == ["171287"]
+    assert index.search("egg salad sandwich", require_all=True) == []
+    assert index.search("quinoa rice", require_all=True) == []
+    assert [food["fdc_id"] for food in index.search("rice bro", require_all=True)] == ["169704", "2000001"]
+
+
+def test_save_load_round_trip(index, tmp_path):
+    path = tmp_path / "fdc_index.npz"
+    index.save(str(path))
+    loaded = FoodDataIndex().load(str(path))
+
+    assert len(loaded) == len(index)
+    assert loaded.vocabulary == index.vocabulary
+    for fdc_id in ("169704", "168875", "2000001", "171287"):
+        assert loaded.get(fdc_id) == index.get(fdc_id)
+    for query in ("brown rice", "ric", "egg raw"):
+        assert loaded.search(query) == index.search(query)
@@ -0,0 +1,116 @@
+"""Food autocomplete: word-start prefix segments, multi-word queries and popularity refreshes"""
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from food_index import import_dump  # noqa: E402
+from food_suggest import FoodSuggester, SuggestSegment  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+FOODS = [
+    (1, "Rice, brown, long-grain, cooked"),
+    (2, "Rice, white, cooked"),
+    (3, "Brown rice crackers"),
+    (4, "rice brown long grain cooked"),
+    (5, "Egg, whole, raw"),
+    (6, "Rice, brown, medium-grain, cooked, enriched with vitamins"),
+]
+
+
+def displays(segment, results):
+    return [segment.display(phrase_id) for _, phrase_id in results]
+
+
+def test_segment_matches_word_starts_and_merges_phrases():
+    segment = SuggestSegment(FOODS)
+    # Foods 1 and 4 normalize to the same phrase
+    assert len(segment) == 5
+    # Phrase starts outrank later words, and shorter phrases longer ones
+    assert displays(segment, segment.lookup(b"ric", 10)) == [
+        "Rice, white, cooked",
+        "Rice, brown, long-grain, cooked",
+        "Rice, brown, medium-grain, cooked, enriched with vitamins",
+        "Brown rice crackers",
+    ]
+    assert displays(segment, segment.lookup(b"ric", 1)) == ["Rice, white, cooked"]
+    # Only the first MAX_WORD_STARTS words are indexed
+    assert displays(segment, segment.lookup(b"cooked", 10)) == ["Rice, white, cooked"]
+    assert segment.lookup(b"quinoa", 10) == []
+
+
+def test_multi_word_queries_match_whole_words_in_any_order():
+    segment = SuggestSegment(FOODS)
+    assert set(displays(segment, segment.lookup_words([b"brown", b"ri"], 10))) == {
+        "Brown rice crackers", "Rice, brown, long-grain, cooked", "Rice, brown, medium-grain, cooked, enriched with vitamins",
+    }
+    # "bro" is not a whole word
+    assert segment.lookup_words([b"bro", b"ri"], 10) == []
+
+
+def test_hits_reorder_results_and_pick_the_top_food():
+    segment = SuggestSegment(FOODS)
+    assert segment.set_hits(np.array([4, 99]), np.array([5.0, 1.0], dtype=np.float32))
+    assert not segment.set_hits(np.array([99]), np.array([1.0], dtype=np.float32))
+    best_score, best_phrase = segment.lookup(b"ric", 10)[0]
+    assert segment.display(best_phrase) == "Rice, brown, long-grain, cooked"
+    assert segment.phrase_top_food[best_phrase] == 4
+    assert segment.phrase_hits[best_phrase] == 5
+    # The memoized one-character prefix was rebuilt too
+    assert displays(segment, segment.lookup(b"r", 1)) == ["Rice, brown, long-grain, cooked"]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeNutrition:
+    def __init__(self, docs):
+        self.docs = docs
+        self.writes = []
+
+    def find(self, query, projection=None):
+        watermark = query["$or"][0]["cached_at"]["$gt"]
+        return FakeCursor([
+            dict(doc) for doc in self.docs
+            if doc.get("cached_at", "") > watermark or doc.get("hits_updated_at", "") > watermark
+        ])
+
+    async def bulk_write(self, requests, ordered=True):
+        self.writes.append(requests)
+
+
+def test_suggester_merges_the_index_with_cached_foods():
+    nutrition = FakeNutrition([
+        {"fdc_id": "169704", "description": "Rice, brown, long-grain, cooked", "cached_at": "2026-01-01"},
+        {"fdc_id": "3000001", "description": "Riced cauliflower, frozen", "cached_at": "2026-01-02"},
+    ])
+    suggester = FoodSuggester(type("DB", (), {"nutrition": nutrition})(), import_dump(str(FIXTURES / "fdc_foods.json")))
+
+    async def run():
+        await suggester.refresh()
+        first = suggester.suggest("ric")
+        # A popular cached food moves up once its hits are read back
+        suggester.record_hits(["3000001", "3000001", "not-an-id", None])
+        nutrition.docs[1].update(search_hits=2, hits_updated_at="2026-01-03")
+        await suggester.refresh()
+        return first, suggester.suggest("ric")
+
+    first, second = asyncio.run(run())
+    texts = [suggestion["text"] for suggestion in first]
+    assert "Riced cauliflower, frozen" in texts
+    # Foods already in the index are not duplicated in the delta segment
+    assert texts.count("Rice, brown, long-grain, cooked") == 1
+    assert second[0] == {"text": "Riced cauliflower, frozen", "fdc_id": "3000001", "popularity": 2}
+    assert len(nutrition.writes) == 1 and len(nutrition.writes[0]) == 1
+    stats = suggester.get_stats()
+    assert stats["hits_recorded"] == 2 and stats["pending_hits"] == 0 and stats["refreshes"] == 2
+    assert suggester.suggest("") == []
@@ -0,0 +1,113 @@
+"""LLM admission control: concurrency limits, tiered queueing and load shedding"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from llm_scheduler import LLMOverloadedError, LLMScheduler  # noqa: E402
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_global_and_per_tenant_limits():
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=3, per_tenant_concurrency=2)
+        first = await scheduler.acquire("a")
+        await scheduler.acquire("a")
+        # Tenant "a" is at its limit, but "b" still gets the free global slot
+        queued_a = asyncio.create_task(scheduler.acquire("a"))
+        await settle()
+        assert not queued_a.done()
+        await scheduler.acquire("b")
+        assert scheduler.running == 3
+
+        first.release()
+        first.release()  # idempotent
+        ticket = await asyncio.wait_for(queued_a, timeout=1)
+        return scheduler, ticket
+
+    scheduler, ticket = asyncio.run(run())
+    assert ticket.tenant_id == "a"
+    assert scheduler.running_by_tenant == {"a": 2, "b": 1}
+
+
+def test_premium_waiters_are_served_first():
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=1)
+        ticket = await scheduler.acquire("t0")
+        order = []
+
+        async def wait(tenant, tier):
+            granted = await scheduler.acquire(tenant, tier)
+            order.append(tier)
+            granted.release()
+
+        tasks = [asyncio.create_task(wait(f"t{i}", tier)) for i, tier in enumerate(("background", "basic", "premium"), 1)]
+        await settle()
+        ticket.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["premium", "basic", "background"]
+
+
+def test_full_queue_displaces_lower_tiers_or_sheds():
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        await scheduler.acquire("t0")
+        background = asyncio.create_task(scheduler.acquire("t1", "background"))
+        await settle()
+        premium = asyncio.create_task(scheduler.acquire("t2", "premium"))
+        await settle()
+        with pytest.raises(LLMOverloadedError, match="displaced"):
+            await background
+        with pytest.raises(LLMOverloadedError, match="queue full"):
+            await scheduler.acquire("t3", "basic")
+        premium.cancel()
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert scheduler.stats["displaced"] == 1 and scheduler.stats["shed_full"] == 1
+
+
+def test_deadlines_shed_requests():
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=1)
+        scheduler.avg_service_seconds = 10.0
+        await scheduler.acquire("t0")
+        with pytest.raises(LLMOverloadedError, match="expected wait") as raised:
+            await scheduler.acquire("t1", deadline=5.0)
+        assert raised.value.retry_after == 10.0
+
+        scheduler.avg_service_seconds = 0.01
+        with pytest.raises(LLMOverloadedError, match="deadline passed"):
+            await scheduler.acquire("t1", deadline=0.02)
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert scheduler.get_metrics()["queue_depth"] == 0
+    assert scheduler.stats["shed_deadline"] == 1 and scheduler.stats["shed_timeout"] == 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=1)
+        ticket = await scheduler.acquire("t0")
+        waiter = asyncio.create_task(scheduler.acquire("t1"))
+        await settle()
+        waiter.cancel()
+        await settle()
+        assert scheduler.get_metrics()["queue_depth"] == 0
+        ticket.release()
+        # The freed slot isn't handed to the cancelled waiter
+        async with scheduler.slot("t2"):
+            assert scheduler.running == 1
+        return scheduler
+
+    assert asyncio.run(run()).running == 0
@@ -0,0 +1,86 @@
+"""Meal optimizer: role assignment, exclusions and batched portion solving"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from food_index import FoodDataIndex  # noqa: E402
+from meal_optimizer import MealOptimizer, PORTION_BOUNDS, describe_meal, exclusion_terms  # noqa: E402
+
+COLUMNS = ("calories", "carbohydrates", "sugars", "fiber", "protein", "fat", "sodium")
+FOODS = [
+    ("1", "Chicken, broilers or fryers, breast, meat only, cooked, roasted", (165, 0, 0, 0, 31, 3.6, 74)),
+    ("2", "Fish, salmon, Atlantic, farmed, cooked, dry heat", (206, 0, 0, 0, 22, 12.4, 61)),
+    ("3", "Tofu, raw, firm, prepared with calcium sulfate", (144, 2.8, 0.6, 2.3, 17.3, 8.7, 14)),
+    ("4", "Rice, brown, long-grain, cooked", (123, 25.6, 0.2, 1.6, 2.7, 1, 4)),
+    ("5", "Lentils, mature seeds, cooked, boiled, without salt", (116, 20.1, 1.8, 7.9, 9, 0.4, 2)),
+    ("6", "Bread, whole-wheat, commercially prepared", (252, 43.1, 4.4, 6, 12.5, 3.5, 450)),
+    ("7", "Broccoli, raw", (34, 6.6, 1.7, 2.6, 2.8, 0.4, 33)),
+    ("8", "Spinach, raw", (23, 3.6, 0.4, 2.2, 2.9, 0.4, 79)),
+    ("9", "Oil, olive, salad or cooking", (884, 0, 0, 0, 0, 100, 2)),
+    ("10", "Mystery food without calories", (None, 10, None, None, 5, None, None)),
+]
+
+
+@pytest.fixture
+def optimizer():
+    optimizer = MealOptimizer(db=None, food_index=FoodDataIndex())
+    optimizer.build_pool(
+        [{"fdc_id": fdc_id, "description": description, **dict(zip(COLUMNS, values))} for fdc_id, description, values in FOODS]
+        # Duplicates of a cached food are dropped
+        + [{"fdc_id": "1", "description": "Chicken again", "calories": 1}]
+    )
+    return optimizer
+
+
+def test_foods_are_assigned_to_roles(optimizer):
+    assert len(optimizer.descriptions) == len(FOODS)
+    roles = {role: {optimizer.fdc_ids[row] for row in np.flatnonzero(mask)} for role, mask in optimizer.roles.items()}
+    assert roles == {"protein": {"1", "2", "3"}, "carb": {"4", "5", "6"}, "vegetable": {"7", "8"}}
+
+
+def test_exclusion_terms():
+    assert exclusion_terms(["Eggs", "Tree nuts"], ["Brown rice "])[:2] == [["egg"], ["almond"]]
+    assert exclusion_terms([], ["Brown rice "]) == [["brown", "rice"]]
+    assert exclusion_terms(["kiwis"], []) == [["kiwi"]]
+
+
+def test_meals_hit_the_targets_with_bounded_portions(optimizer):
+    meals = optimizer.optimize(net_carbs=45, fiber=8, calories=500)
+    # Alternatives never reuse a food, and there are only two vegetables
+    assert len(meals) == 2
+    used = [item["fdc_id"] for meal in meals for item in meal["items"]]
+    assert len(used) == len(set(used))
+
+    best = meals[0]
+    assert [item["role"] for item in best["items"]] == ["protein", "carb", "vegetable"]
+    for item in best["items"]:
+        low, high = PORTION_BOUNDS[item["role"]]
+        assert low <= item["grams"] <= high and item["grams"] % 5 == 0
+    assert abs(best["totals"]["net_carbs"] - 45) <= 5
+    assert abs(best["totals"]["calories"] - 500) <= 75
+    assert best["score"] <= meals[1]["score"]
+    assert describe_meal(best).endswith(
+        f"(about {best['totals']['net_carbs']:.0f} g net carbs, {best['totals']['fiber']:.0f} g fiber, "
+        f"{best['totals']['calories']:.0f} kcal)"
+    )
+
+
+def test_offset_rotates_through_ranked_meals(optimizer):
+    first, second = optimizer.optimize(alternatives=2)
+    assert optimizer.optimize(alternatives=1, offset=1) == [second]
+    assert optimizer.optimize(alternatives=1) == [first]
+
+
+def test_allergies_and_dislikes_exclude_foods(optimizer):
+    meals = optimizer.optimize(allergies=["Fish", "soy"], dislikes=["brown rice"])
+    assert len(meals) == 1
+    ids = {item["fdc_id"] for item in meals[0]["items"]}
+    assert ids.isdisjoint({"2", "3", "4"}) and "1" in ids
+
+    # No protein left to choose from
+    assert optimizer.optimize(dislikes=["chicken", "salmon", "tofu"]) == []
+    assert optimizer.stats["no_solution"] == 1
@@ -0,0 +1,80 @@
+"""Glycemic index lookup and vectorized food analytics on real FDC descriptions"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from nutrition_analytics import analyze_foods, food_analytics_records, glycemic_index, singular  # noqa: E402
+
+
+@pytest.mark.parametrize("description, gi", [
+    # Plural FDC descriptions match singular and plural reference phrases
+    ("Bananas, raw", 51),
+    ("Oranges, raw, navels", 43),
+    ("Peaches, yellow, raw", 42),
+    ("Cherries, sweet, raw", 22),
+    ("Potatoes, baked, flesh and skin", 85),
+    ("Tomatoes, red, ripe, raw, year round average", 15),
+    # The most specific phrase wins
+    ("Rice, brown, long-grain, cooked", 68),
+    ("Yogurt, Greek, plain, nonfat", 11),
+    ("Bread, whole-wheat, commercially prepared", 74),
+    ("Sweet potato, cooked, baked in skin, flesh, without salt", 63),
+    # Category-only first segments defer to the next one
+    ("Beverages, orange juice, drink", 50),
+    ("Nuts, almonds", 0),
+    ("Cereals, oats, regular and quick, not fortified, dry", 55),
+    # Ties go to the primary segment's head word
+    ("Candies, milk chocolate", 40),
+    ("Milk, chocolate, fluid, commercial, reduced fat", 39),
+])
+def test_glycemic_index_of_fdc_descriptions(description, gi):
+    assert glycemic_index(description) == gi
+
+
+@pytest.mark.parametrize("description", [
+    "Oil, corn, industrial and retail, all purpose salad or cooking",
+    "Chicken, broilers or fryers, breast, meat only, cooked, roasted, corn-fed",
+    "Beef, ground, 85% lean meat / 15% fat, raw",
+    "",
+])
+def test_glycemic_index_ignores_words_outside_the_primary_segment(description):
+    assert glycemic_index(description) is None
+
+
+def test_singular():
+    assert [singular(w) for w in ("bananas", "cherries", "peaches", "potatoes", "oats", "hummus", "glass", "peas")] == \
+        ["banana", "cherry", "peach", "potato", "oat", "hummus", "glass", "pea"]
+
+
+def test_zero_gi_is_kept():
+    record, = food_analytics_records([
+        {"description": "Cheese, cheddar", "carbohydrates": 3.1, "fiber": 0.0, "sugars": 0.5},
+    ])
+    assert record["glycemic_index"] == 0
+    assert record["glycemic_load"] == 0.0
+
+
+def test_analytics_records():
+    records = food_analytics_records([
+        {"description": "Rice, brown, long-grain, cooked", "carbohydrates": 25.6, "fiber": 1.6, "sugars": 0.2},
+        # Negligible net carbs: no GI, glycemic load 0
+        {"description": "Egg, whole, raw, fresh", "carbohydrates": 0.7, "fiber": 0.0, "sugars": 0.4},
+        # Unknown carbs: GI from the description, load unknown
+        {"description": "Bananas, raw"},
+        # An explicit GI is kept
+        {"description": "Apples, raw", "carbohydrates": 13.8, "fiber": 2.4, "sugars": 10.4, "glycemic_index": 38},
+    ])
+    assert records[0] == {"net_carbs": 24.0, "glycemic_index": 68, "glycemic_load": 16.3, "diabetic_rating": "caution"}
+    assert records[1]["glycemic_index"] is None and records[1]["glycemic_load"] == 0.0
+    assert records[2]["glycemic_index"] == 51 and records[2]["net_carbs"] is None and records[2]["glycemic_load"] is None
+    assert records[3]["glycemic_index"] == 38 and records[3]["glycemic_load"] == round(38 * 11.4 / 100, 1)
+    assert food_analytics_records([]) == []
+
+
+def test_analyze_foods_is_vectorized():
+    results = analyze_foods([{"description": "Lentils, mature seeds, cooked", "carbohydrates": 20.1, "fiber": 7.9}] * 3)
+    assert results["net_carbs"].tolist() == [12.2] * 3
+    assert results["glycemic_load"].tolist() == [3.9] * 3
@@ -0,0 +1,84 @@
+"""Nutrition detail cache: negative caching and single-flight upstream fetches"""
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from nutrition_cache import NutritionDetailCache, normalize_query  # noqa: E402
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query["fdc_id"])
+        return dict(doc) if doc else None
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs.setdefault(query["fdc_id"], {}).update(update["$set"])
+
+
+def make_cache():
+    return NutritionDetailCache(SimpleNamespace(nutrition=FakeCollection(), nutrition_negative_cache=FakeCollection()))
+
+
+def test_normalize_query():
+    assert normalize_query("  Brown RICE, cooked! ") == "brown rice cooked"
+
+
+def test_missing_foods_are_remembered():
+    cache = make_cache()
+    calls = []
+
+    async def fetch(fdc_id):
+        calls.append(fdc_id)
+        return None
+
+    async def run():
+        return [await cache.get("404", fetch) for _ in range(2)]
+
+    assert asyncio.run(run()) == [None, None]
+    assert calls == ["404"]
+    assert cache.stats["negative_hits"] == 1
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = make_cache()
+    calls = []
+
+    async def fetch(fdc_id):
+        calls.append(fdc_id)
+        await asyncio.sleep(0.01)
+        return {"fdc_id": fdc_id, "description": "Rice, brown"}
+
+    async def run():
+        return await asyncio.gather(*(cache.get("1", fetch) for _ in range(3)))
+
+    docs = asyncio.run(run())
+    assert [doc["description"] for doc in docs] == ["Rice, brown"] * 3
+    assert calls == ["1"]
+    assert cache.db.nutrition.docs["1"]["description"] == "Rice, brown"
+
+
+def test_cancelled_first_caller_does_not_strand_waiters():
+    cache = make_cache()
+
+    async def fetch(fdc_id):
+        await asyncio.sleep(0.01)
+        return {"fdc_id": fdc_id, "description": "Egg, whole"}
+
+    async def run():
+        leader = asyncio.create_task(cache.get("2", fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get("2", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        doc = await asyncio.wait_for(waiter, timeout=1)
+        return leader.cancelled(), doc["description"]
+
+    assert asyncio.run(run()) == (True, "Egg, whole")
+    assert cache._inflight == {}
+    assert "2" in cache.db.nutrition.docs
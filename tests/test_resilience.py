@@ -0,0 +1,181 @@
+"""Upstream policies: retries, deadlines, hedging, circuit breaking and streams"""
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamPolicy  # noqa: E402
+
+
+def make_policy(**kwargs):
+    kwargs = {"timeout": 0.5, "backoff_base": 0.0, **kwargs}
+    return UpstreamPolicy("test", **kwargs)
+
+
+def flaky(*outcomes):
+    """Coroutine factory returning or raising the given outcomes in order"""
+    calls = []
+
+    async def fn():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    return fn, calls
+
+
+def test_retries_transient_errors():
+    policy = make_policy(max_retries=2)
+    fn, calls = flaky(httpx.ConnectError("refused"), httpx.ReadTimeout("slow"), "ok")
+    assert asyncio.run(policy.call(fn)) == "ok"
+    assert len(calls) == 3
+    assert policy.counters["retries"] == 2 and policy.counters["successes"] == 1
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_non_idempotent_calls_are_not_retried():
+    policy = make_policy(max_retries=2)
+    fn, calls = flaky(httpx.ConnectError("refused"), "ok")
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(policy.call(fn, idempotent=False))
+    assert len(calls) == 1 and policy.counters["failures"] == 1
+
+
+def test_caller_errors_do_not_trip_the_breaker():
+    policy = make_policy(max_retries=2, failure_threshold=1)
+    fn, calls = flaky(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        asyncio.run(policy.call(fn))
+    assert len(calls) == 1 and policy.breaker.state == CircuitBreaker.CLOSED
+
+    # SDK clients raise their own types, so any error counts for them
+    policy = make_policy(max_retries=0, failure_threshold=1, any_error_is_failure=True)
+    fn, _ = flaky(ValueError("provider error"))
+    with pytest.raises(ValueError):
+        asyncio.run(policy.call(fn))
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+
+def test_final_5xx_response_is_returned():
+    policy = make_policy(max_retries=1)
+    request = httpx.Request("GET", "https://upstream.test")
+    fn, calls = flaky(httpx.Response(503, request=request), httpx.Response(502, request=request))
+    response = asyncio.run(policy.call(fn))
+    assert response.status_code == 502 and len(calls) == 2
+    assert policy.counters["failures"] == 1 and policy.breaker.consecutive_failures == 1
+
+    fn, _ = flaky(httpx.Response(404, request=request))
+    assert asyncio.run(policy.call(fn)).status_code == 404
+    assert policy.breaker.consecutive_failures == 0
+
+
+def test_attempts_are_cut_off_at_the_deadline():
+    policy = make_policy(timeout=0.02, max_retries=0)
+
+    async def stalled():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(policy.call(stalled))
+    assert policy.counters["timeouts"] == 1
+
+
+def test_breaker_opens_short_circuits_and_probes_once():
+    policy = make_policy(max_retries=0, failure_threshold=2, reset_timeout=60.0)
+    for _ in range(2):
+        fn, _ = flaky(httpx.ConnectError("refused"))
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(policy.call(fn))
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+    fn, calls = flaky("ok")
+    with pytest.raises(CircuitOpenError) as raised:
+        asyncio.run(policy.call(fn))
+    assert calls == [] and raised.value.retry_after > 0
+    assert policy.counters["short_circuits"] == 1
+
+    # Once the reset timeout passes, a single probe is let through
+    policy.breaker.reset_timeout = 0.0
+    assert policy.breaker.allow() and policy.breaker.state == CircuitBreaker.HALF_OPEN
+    assert not policy.breaker.allow()
+    policy.breaker.record_failure()
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+    assert policy.breaker.allow()
+    policy.breaker.release_probe()
+    fn, _ = flaky("ok")
+    assert asyncio.run(policy.call(fn)) == "ok"
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_hedge_wins_over_a_slow_first_attempt():
+    policy = make_policy(max_retries=0, hedge_after=0.01)
+    delays = [0.3, 0.0]
+
+    async def fn():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    assert asyncio.run(policy.call(fn)) == 0.0
+    assert policy.counters["hedges"] == 1 and policy.counters["hedge_wins"] == 1
+
+
+def test_fast_attempt_is_not_hedged():
+    policy = make_policy(max_retries=0, hedge_after=0.2)
+    fn, calls = flaky("ok")
+    assert asyncio.run(policy.call(fn)) == "ok"
+    assert len(calls) == 1 and policy.counters["hedges"] == 0
+
+
+def collect(policy, fn, limit=None):
+    async def run():
+        items = []
+        async for item in policy.stream(fn):
+            items.append(item)
+            if limit is not None and len(items) >= limit:
+                break
+        return items
+
+    return asyncio.run(run())
+
+
+def test_stream_relays_items_and_records_outcomes():
+    policy = make_policy(failure_threshold=1, any_error_is_failure=True)
+
+    async def tokens():
+        for token in ("a", "b", "c"):
+            yield token
+
+    assert collect(policy, tokens) == ["a", "b", "c"]
+    assert policy.counters["successes"] == 1
+
+    async def stalled():
+        yield "a"
+        await asyncio.sleep(1)
+        yield "b"
+
+    policy.timeout = 0.02
+    with pytest.raises(asyncio.TimeoutError):
+        collect(policy, stalled)
+    assert policy.counters["timeouts"] == 1 and policy.breaker.state == CircuitBreaker.OPEN
+
+
+def test_stream_consumer_leaving_releases_the_probe():
+    policy = make_policy(failure_threshold=1, reset_timeout=0.0)
+    policy.breaker.record_failure()
+
+    async def tokens():
+        for token in ("a", "b", "c"):
+            yield token
+
+    assert collect(policy, tokens, limit=1) == ["a"]
+    # No outcome was recorded, so the breaker lets the next probe through
+    assert policy.breaker.state == CircuitBreaker.HALF_OPEN
+    assert policy.breaker.allow()
@@ -0,0 +1,92 @@
+"""Health-coach response cache: segments, similarity guards, expiry, and replayed SSE streams"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from llm_streaming import relay_completion, replay_text  # noqa: E402
+from resilience import CircuitBreaker, UpstreamPolicy  # noqa: E402
+from response_cache import ResponseCache, chat_segment, normalize_message  # noqa: E402
+
+
+def make_cache(**kwargs):
+    return ResponseCache(enabled=True, **kwargs)
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache()
+    cache.put("s", "is rice ok", "answer")
+    assert cache.get("s", "is rice ok") is None
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = make_cache()
+    cache.put("s", "Is rice OK?", "answer")
+    assert normalize_message("Is rice OK?") == "is rice ok"
+    assert cache.get("s", "is rice ok") == "answer"
+    assert cache.stats["exact_hits"] == 1
+
+
+def test_similar_question_hits_within_segment_only():
+    cache = make_cache(similarity_threshold=0.8)
+    cache.put("s", "what can i eat for breakfast", "eggs")
+    assert cache.get("s", "what can i eat for breakfast today") == "eggs"
+    assert cache.stats["similar_hits"] == 1
+    assert cache.get("other", "what can i eat for breakfast") is None
+
+
+def test_guard_words_and_numbers_must_agree():
+    cache = make_cache(similarity_threshold=0.5)
+    cache.put("s", "is rice ok for me", "yes")
+    cache.put("s", "can i eat 2 eggs for breakfast", "two is fine")
+    assert cache.get("s", "is rice not ok for me") is None
+    assert cache.get("s", "can i eat 4 eggs for breakfast") is None
+    assert cache.get("s", "should i avoid rice") is None
+    assert cache.stats["misses"] == 3
+
+
+def test_entries_expire_and_evict_lru():
+    cache = make_cache(ttl_seconds=-1)
+    cache.put("s", "is rice ok", "answer")
+    assert cache.get("s", "is rice ok") is None
+
+    cache = make_cache(max_entries=2)
+    cache.put("s", "question one", "1")
+    cache.put("s", "question two", "2")
+    assert cache.get("s", "question one") == "1"  # now most recently used
+    cache.put("s", "question three", "3")
+    assert cache.get("s", "question two") is None
+    assert cache.get("s", "question one") == "1"
+    assert cache.stats["evictions"] == 1
+
+
+def test_chat_segment_covers_prompt_profile_fields():
+    base = {"diabetes_type": "Type 2", "age": 54, "allergies": ["Peanuts", "shellfish"], "dislikes": []}
+    assert chat_segment(base) == chat_segment({**base, "allergies": ["shellfish", "peanuts "], "name": "x"})
+    for field, value in (("age", 55), ("gender", "female"), ("cooking_skill", "beginner"),
+                         ("dislikes", ["okra"]), ("food_preferences", ["vegetarian"])):
+        assert chat_segment({**base, field: value}) != chat_segment(base)
+
+
+def test_replayed_text_bypasses_the_breaker():
+    policy = UpstreamPolicy("llm", timeout=1.0, max_retries=0, failure_threshold=1, reset_timeout=60.0)
+    policy.breaker.record_failure()
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+    async def on_complete(text):
+        return {"response": text}
+
+    async def collect(**kwargs):
+        return [event async for event in relay_completion(lambda: replay_text("cached answer"), on_complete, **kwargs)]
+
+    replayed = asyncio.run(collect())
+    assert replayed[0].startswith("event: token") and "cached answer" in replayed[0]
+    assert replayed[-1].startswith("event: done")
+    # A cache replay neither hits the open breaker nor shows up in the provider metrics
+    assert policy.breaker.state == CircuitBreaker.OPEN
+    assert policy.counters["calls"] == 0
+
+    refused = asyncio.run(collect(policy=policy))
+    assert refused[0].startswith("event: error") and policy.counters["short_circuits"] == 1
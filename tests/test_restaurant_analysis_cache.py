@@ -0,0 +1,106 @@
+"""Restaurant analysis cache: profile segments, fingerprints and single-flight misses"""
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from restaurant_analysis_cache import RestaurantAnalysisCache, profile_hash  # noqa: E402
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        return self.docs.get((query["place_id"], query["profile_hash"]))
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[(query["place_id"], query["profile_hash"])] = doc
+
+
+RESTAURANT = {"place_id": "p1", "name": "Diner", "address": "1 Main St", "rating": 4.2, "cuisine_types": ["american"]}
+PROFILE = {"diabetes_type": "Type 2", "health_goals": ["weight loss"], "allergies": []}
+
+
+def make_cache():
+    return RestaurantAnalysisCache(SimpleNamespace(restaurant_analysis_cache=FakeCollection()))
+
+
+def test_profile_hash_ignores_order_case_and_unrelated_fields():
+    assert profile_hash(PROFILE) == profile_hash({
+        "diabetes_type": "type 2 ", "health_goals": ["Weight Loss"], "allergies": [], "name": "x",
+    })
+    assert profile_hash(PROFILE) != profile_hash({**PROFILE, "allergies": ["peanuts"]})
+
+
+def test_hits_and_fingerprint_invalidation():
+    cache = make_cache()
+    calls = []
+
+    async def analyze():
+        calls.append(1)
+        return f"analysis {len(calls)}"
+
+    async def run():
+        assert await cache.get(RESTAURANT, PROFILE, analyze) == "analysis 1"
+        assert await cache.get(RESTAURANT, PROFILE, analyze) == "analysis 1"
+        return await cache.get({**RESTAURANT, "rating": 4.5}, PROFILE, analyze)
+
+    assert asyncio.run(run()) == "analysis 2"
+    assert cache.stats == {"hits": 1, "misses": 2, "invalidated": 1, "shared": 0}
+
+
+def test_concurrent_misses_share_one_call():
+    cache = make_cache()
+    calls = []
+
+    async def analyze():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "analysis"
+
+    async def run():
+        return await asyncio.gather(*(cache.get(RESTAURANT, PROFILE, analyze) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["analysis"] * 3
+    assert len(calls) == 1 and cache.stats["shared"] == 2
+
+
+def test_cancelled_first_caller_does_not_strand_waiters():
+    cache = make_cache()
+
+    async def analyze():
+        await asyncio.sleep(0.01)
+        return "analysis"
+
+    async def run():
+        leader = asyncio.create_task(cache.get(RESTAURANT, PROFILE, analyze))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get(RESTAURANT, PROFILE, analyze))
+        await asyncio.sleep(0)
+        leader.cancel()
+        result = await asyncio.wait_for(waiter, timeout=1)
+        return leader.cancelled(), result
+
+    assert asyncio.run(run()) == (True, "analysis")
+    # The shared call still completed and was stored for the next request
+    assert cache._inflight == {}
+    assert len(cache.db.restaurant_analysis_cache.docs) == 1
+
+
+def test_failed_call_reaches_every_waiter():
+    cache = make_cache()
+
+    async def analyze():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("llm down")
+
+    async def run():
+        results = await asyncio.gather(*(cache.get(RESTAURANT, PROFILE, analyze) for _ in range(2)),
+                                       return_exceptions=True)
+        return [type(r) for r in results]
+
+    assert asyncio.run(run()) == [RuntimeError, RuntimeError]
+    assert cache._inflight == {}
@@ -0,0 +1,126 @@
+"""Shopping list engine: categories, quantity parsing, unit conversion and consolidation"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from shopping_list_engine import (  # noqa: E402
+    build_shopping_list_items,
+    categorize,
+    consolidate_items,
+    format_quantity,
+    normalize_name,
+    parse_item_text,
+)
+
+
+@pytest.mark.parametrize("name, category", [
+    # Whole words only: no "egg" in eggplant, no "nut" in coconut
+    ("Eggplant", "produce"),
+    ("Pineapple", "other"),
+    ("Eggs", "proteins"),
+    # Specific phrases and packaged forms before the broad words they contain
+    ("Chicken broth", "pantry"),
+    ("Low-sodium vegetable stock", "pantry"),
+    ("Canned tomatoes", "pantry"),
+    ("Frozen peas", "frozen"),
+    ("Green beans", "produce"),
+    ("Black beans", "pantry"),
+    ("Peanut butter", "pantry"),
+    ("Butter", "dairy"),
+    ("Black pepper", "pantry"),
+    ("Red bell peppers", "produce"),
+    # Plurals
+    ("Strawberries", "produce"),
+    ("Sweet potatoes", "produce"),
+    ("Salmon fillets", "proteins"),
+    ("Rolled oats", "pantry"),
+    ("Walnuts", "pantry"),
+])
+def test_categorize(name, category):
+    assert categorize(name) == category
+
+
+def test_categorize_keeps_a_specific_suggestion():
+    assert categorize("Tofu", "dairy") == "dairy"
+    assert categorize("Tofu", "other") == "proteins"
+    assert categorize("Tofu", "snacks") == "proteins"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2 lbs chicken breast", ("Chicken breast", 2.0, "lbs")),
+    ("1 1/2 cups rice", ("Rice", 1.5, "cups")),
+    ("1½ cups oats", ("Oats", 1.5, "cups")),
+    ("½ tsp salt", ("Salt", 0.5, "tsp")),
+    ("2-3 lbs chicken", ("Chicken", 3.0, "lbs")),
+    ("2 cups of milk", ("Milk", 2.0, "cups")),
+    ("- 3 eggs", ("Eggs", 3.0, None)),
+    ("2 lemons", ("Lemons", 2.0, None)),
+    # Package sizes in parentheses, before or after the package unit
+    ("1 (15 oz) can black beans", ("Black beans", 1.0, "can")),
+    ("2 cans (15 oz) chickpeas", ("Chickpeas", 2.0, "cans")),
+    ("1 (15 oz) chickpeas", ("Chickpeas", 15.0, "oz")),
+    ("chicken breast (2 lbs)", ("Chicken breast", 2.0, "lbs")),
+    ("a handful of basil", ("A handful of basil", None, None)),
+])
+def test_parse_item_text(text, expected):
+    parsed = parse_item_text(text)
+    assert (parsed["name"], parsed["amount"], parsed["unit"]) == expected
+
+
+def test_normalize_name_drops_size_words_and_plurals():
+    assert normalize_name("Large Fresh Tomatoes") == normalize_name("tomato")
+    assert normalize_name("Cherries") == "cherry"
+
+
+def test_format_quantity():
+    assert format_quantity("weight", 36) == "2 1/4 lbs"
+    assert format_quantity("weight", 8) == "8 oz"
+    assert format_quantity("volume", 768) == "1 gallon"
+    assert format_quantity("volume", 72) == "1 1/2 cups"
+    assert format_quantity("volume", 6) == "2 tbsp"
+    assert format_quantity("package:can", 2) == "2 cans"
+
+
+def test_consolidate_merges_by_name_and_dimension():
+    items = consolidate_items([
+        {"name": "chicken breast", "quantity": "1 lb", "category": "proteins", "id": "a"},
+        {"name": "Chicken Breasts", "quantity": "8 oz", "id": "b"},
+        {"name": "chickpeas", "quantity": "1", "unit": "can"},
+        {"name": "Chickpeas", "quantity": "8 oz"},
+        {"name": "olive oil", "quantity": 1, "unit": "T"},
+        {"name": "olive oil", "quantity": 1, "unit": "t"},
+    ])
+    assert items[0] == {"item": "Chicken breast", "category": "proteins", "quantity": "1 1/2 lbs", "checked": False, "id": "a"}
+    # Cans and ounces are different dimensions and stay apart
+    assert [item["quantity"] for item in items[1:3]] == ["1", "8 oz"]
+    # A tablespoon plus a teaspoon
+    assert items[3]["item"] == "Olive oil" and items[3]["quantity"] == "1 1/4 tbsp"
+    assert len(items) == 4
+
+
+def test_unmeasured_and_single_items_keep_their_text():
+    items = consolidate_items([
+        {"name": "basil", "quantity": "a handful"},
+        {"name": "basil", "quantity": "a handful"},
+        {"name": "chicken", "quantity": "2-3 lbs", "checked": True},
+        {"name": "", "quantity": "1"},
+    ])
+    assert [(item["item"], item["quantity"]) for item in items] == [
+        ("basil", "a handful"), ("basil", "a handful"), ("chicken", "2-3 lbs"),
+    ]
+    assert items[2]["checked"] is True
+
+
+def test_build_from_json_and_free_text():
+    structured = build_shopping_list_items(
+        '```json\n{"items": [{"name": "Spinach", "quantity": 200, "unit": "g", "category": "produce"}]}\n```'
+    )
+    assert structured == [{"item": "Spinach", "category": "produce", "quantity": "7 oz", "checked": False}]
+
+    text = build_shopping_list_items("Produce:\n- 2 lemons\n- 1 lemon\nPantry:\n- 2 cans (15 oz) chickpeas\n")
+    assert [(item["item"], item["category"], item["quantity"]) for item in text] == [
+        ("Lemons", "produce", "3"), ("Chickpeas", "pantry", "2 cans"),
+    ]
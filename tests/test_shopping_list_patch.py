@@ -0,0 +1,127 @@
+"""Item-level shopping list patches: validation and compilation to one MongoDB update"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from shopping_list_patch import build_item_update, validate_operations  # noqa: E402
+
+
+def evaluate(expression, variables):
+    """Evaluate the aggregation expressions the patch pipeline uses against plain Python data"""
+    if isinstance(expression, str) and expression.startswith("$$"):
+        name, *path = expression[2:].split(".")
+        value = variables[name]
+        for field in path:
+            value = value.get(field)
+        return value
+    if isinstance(expression, str) and expression.startswith("$"):
+        return variables["ROOT"].get(expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, variables) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if not next(iter(expression), "").startswith("$"):
+        return {field: evaluate(value, variables) for field, value in expression.items()}
+    (operator, args), = expression.items()
+    if operator == "$literal":
+        return args
+    if operator in ("$map", "$filter"):
+        name = args.get("as", "this")
+        values = evaluate(args["input"], variables)
+        if operator == "$map":
+            return [evaluate(args["in"], {**variables, name: value}) for value in values]
+        return [value for value in values if evaluate(args["cond"], {**variables, name: value})]
+    args = evaluate(args, variables)
+    operators = {
+        "$cond": lambda a: a[1] if a[0] else a[2],
+        "$eq": lambda a: a[0] == a[1],
+        "$ne": lambda a: a[0] != a[1],
+        "$not": lambda a: not a[0],
+        "$in": lambda a: a[0] in a[1],
+        "$mergeObjects": lambda a: {**a[0], **a[1]},
+        "$concatArrays": lambda a: [value for array in a for value in array],
+        "$slice": lambda a: a[0][:a[1]] if len(a) == 2 else a[0][a[1]:a[1] + a[2]],
+        "$add": lambda a: sum(a),
+        "$size": lambda a: len(a),
+        "$arrayElemAt": lambda a: a[0][a[1]] if len(a[0]) > a[1] else None,
+        "$ifNull": lambda a: a[1] if a[0] is None else a[0],
+    }
+    return operators[operator](args)
+
+
+def apply_pipeline(document, stages):
+    for stage in stages:
+        document = {**document, **{field: evaluate(value, {"ROOT": document}) for field, value in stage["$set"].items()}}
+    return document
+
+
+def items(*ids, checked=()):
+    return [{"id": item_id, "item": item_id.title(), "checked": item_id in checked} for item_id in ids]
+
+
+def test_validate_operations():
+    assert validate_operations([
+        {"op": "check", "item_id": "a"},
+        {"op": "add", "item": {"id": "new"}},
+        {"op": "reorder", "item_ids": ["new", "b", "a"]},
+    ]) == ["a", "b"]
+    for operations, message in (
+        ([{"op": "rename"}], "Unsupported"),
+        ([{"op": "remove"}], "item_id"),
+        ([{"op": "add"}], "needs an item"),
+        ([{"op": "add", "item": {"id": "x"}, "position": -1}], "position"),
+        ([{"op": "reorder", "item_ids": []}], "item_ids"),
+        ([{"op": "check", "item_id": "a"}] * 101, "at most"),
+    ):
+        with pytest.raises(ValueError, match=message):
+            validate_operations(operations)
+
+
+def test_single_kind_patches_use_positional_operators():
+    update, array_filters = build_item_update([
+        {"op": "check", "item_id": "a"}, {"op": "check", "item_id": "b"}, {"op": "uncheck", "item_id": "a"},
+    ], title="Week 2")
+    assert update == {
+        "$set": {"items.$[i0].checked": False, "items.$[i1].checked": True, "title": "Week 2"},
+        "$inc": {"version": 1},
+    }
+    assert array_filters == [{"i0.id": "a"}, {"i1.id": "b"}]
+
+    assert build_item_update([{"op": "remove", "item_id": "a"}, {"op": "remove", "item_id": "b"}]) == (
+        {"$pull": {"items": {"id": {"$in": ["a", "b"]}}}, "$inc": {"version": 1}}, None
+    )
+    assert build_item_update([{"op": "add", "item": {"id": "x"}, "position": 0}]) == (
+        {"$push": {"items": {"$each": [{"id": "x"}], "$position": 0}}, "$inc": {"version": 1}}, None
+    )
+    assert build_item_update([], title="Renamed") == ({"$set": {"title": "Renamed"}, "$inc": {"version": 1}}, None)
+
+
+def test_mixed_patches_compile_to_a_pipeline():
+    stages, array_filters = build_item_update([
+        {"op": "check", "item_id": "b"},
+        {"op": "remove", "item_id": "a"},
+        {"op": "add", "item": {"id": "x", "item": "X", "checked": False}, "position": 1},
+        {"op": "add", "item": {"id": "y", "item": "Y", "checked": False}},
+        {"op": "reorder", "item_ids": ["y", "missing", "c"]},
+    ], title="Mixed")
+    assert array_filters is None and isinstance(stages, list)
+
+    result = apply_pipeline({"items": items("a", "b", "c"), "version": 3, "title": "Old"}, stages)
+    assert [item["id"] for item in result["items"]] == ["y", "c", "b", "x"]
+    assert [item["checked"] for item in result["items"]] == [False, False, True, False]
+    assert result["version"] == 4 and result["title"] == "Mixed"
+
+    # Lists written before versioning count as version 1
+    assert apply_pipeline({"items": []}, stages)["version"] == 2
+
+
+def test_adds_at_different_positions_keep_their_order():
+    stages, _ = build_item_update([
+        {"op": "add", "item": {"id": "x"}, "position": 0},
+        {"op": "add", "item": {"id": "y"}, "position": 2},
+    ])
+    result = apply_pipeline({"items": items("a", "b"), "version": 1}, stages)
+    assert [item["id"] for item in result["items"]] == ["x", "a", "y", "b"]
@@ -0,0 +1,73 @@
+"""Consolidated shopping view: merge pipeline and formatting of merged groups"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from shopping_list_engine import UNMEASURED, with_merge_fields  # noqa: E402
+from shopping_list_view import consolidated_pipeline, format_consolidated  # noqa: E402
+
+
+def test_pipeline_groups_matched_items_by_key_and_dimension():
+    match = {"id": {"$in": ["l1", "l2"]}, "tenant_id": "t"}
+    pipeline = consolidated_pipeline(match)
+    assert pipeline[0] == {"$match": match}
+    assert pipeline[1] == {"$sort": {"created_at": 1}}
+    assert pipeline[3] == {"$match": {"items.merge_key": {"$nin": [None, ""]}}}
+    group = pipeline[4]["$group"]
+    assert group["_id"]["key"] == "$items.merge_key" and group["_id"]["dimension"] == "$items.dimension"
+    # Unmeasured items get a per-source group key so they never merge
+    assert group["_id"]["source"]["$cond"][0] == {"$eq": ["$items.dimension", UNMEASURED]}
+    assert group["base_amount"] == {"$sum": "$items.base_amount"}
+    assert group["checked"] == {"$min": {"$ifNull": ["$items.checked", False]}}
+
+
+def group(items, list_ids):
+    """A $group result for items that share a merge key and dimension"""
+    first = with_merge_fields(items[0])
+    amounts = [with_merge_fields(item)["base_amount"] for item in items]
+    return {
+        "_id": {"key": first["merge_key"], "dimension": first["dimension"], "source": None},
+        "item": first["item"],
+        "category": first.get("category"),
+        "base_amount": sum(amount for amount in amounts if amount is not None),
+        "measured": sum(amount is not None for amount in amounts),
+        "checked": all(item.get("checked", False) for item in items),
+        "sources": [
+            {"list_id": list_id, "item_id": item["id"], "quantity": item.get("quantity"), "checked": item.get("checked", False)}
+            for item, list_id in zip(items, list_ids)
+        ],
+    }
+
+
+def test_format_merges_quantities_and_categories():
+    chicken = [
+        {"id": "a", "item": "Chicken breast", "quantity": "1 lb", "category": "proteins", "checked": True},
+        {"id": "b", "item": "chicken breasts", "quantity": "8 oz", "category": "proteins"},
+    ]
+    milk = [{"id": "c", "item": "Milk", "quantity": "2-3 cups", "category": "dairy", "checked": True}]
+    basil = [{"id": "d", "item": "Basil", "quantity": "a handful", "category": None}]
+    view = format_consolidated(
+        [group(chicken, ["l1", "l2"]), group(milk, ["l2"]), group(basil, ["l1"])], ["l1", "l2"]
+    )
+
+    assert [category["category"] for category in view["categories"]] == ["proteins", "dairy", "other"]
+    merged, single, unmeasured = (category["items"][0] for category in view["categories"])
+    assert merged["item"] == "Chicken breast" and merged["quantity"] == "1 1/2 lbs"
+    # Checked only when every source item is
+    assert merged["checked"] is False
+    assert [(s["list_id"], s["item_id"]) for s in merged["sources"]] == [("l1", "a"), ("l2", "b")]
+    # A single source keeps its own quantity text
+    assert single["quantity"] == "2-3 cups" and single["checked"] is True
+    assert unmeasured["quantity"] == "a handful"
+    assert (view["list_ids"], view["item_count"], view["checked_count"]) == (["l1", "l2"], 3, 1)
+
+
+def test_merged_unmeasured_amounts_have_no_quantity():
+    basil = [
+        {"id": "a", "item": "Basil", "quantity": "a handful", "category": "produce"},
+        {"id": "b", "item": "Basil", "quantity": "some", "category": "produce"},
+    ]
+    view = format_consolidated([group(basil, ["l1", "l2"])])
+    assert view["categories"][0]["items"][0]["quantity"] is None
+    assert format_consolidated([]) == {"list_ids": None, "categories": [], "item_count": 0, "checked_count": 0}